@@ -1,12 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from app.core.db import get_db
+from app.core.db import get_db, async_session
+from app.core.executors import ExecutorSaturatedError
 from app.models.user import User
 from app.models.chat import Chat, ChatSession
 from app.services.auth import get_current_user
-from app.services.rag_service import query_notes
+from app.services.rag_service import query_notes, stream_query_notes
 from app.schemas.chat import ChatRequest, ChatResponse, ChatSessionCreate, ChatSessionResponse, ChatSessionWithMessages
-from typing import List
+from typing import Any, AsyncIterator, Dict, List, Optional
+import json
 import logging
 from sqlalchemy import select
 import uuid
@@ -126,6 +129,117 @@ async def delete_chat_session(
             detail="An error occurred while deleting the chat session."
         )
 
+async def _get_or_create_session(db: Session, user_id: uuid.UUID, session_id: Optional[uuid.UUID]) -> ChatSession:
+    """Load the user's chat session (or create a new one) and bump its timestamp."""
+    if session_id:
+        # Verify session belongs to user
+        stmt = select(ChatSession).where(
+            (ChatSession.id == session_id) & 
+            (ChatSession.user_id == user_id)
+        )
+        result = await db.execute(stmt)
+        session = result.scalars().first()
+        
+        if not session:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Chat session not found"
+            )
+    else:
+        # Create new chat session
+        session = ChatSession(
+            id=uuid.uuid4(),
+            user_id=user_id,
+            name=f"Chat {datetime.now().strftime('%Y-%m-%d %H:%M')}"
+        )
+        db.add(session)
+        await db.commit()
+        await db.refresh(session)
+    
+    # Update session timestamp
+    session.updated_at = datetime.now()
+    await db.commit()
+    return session
+
+def _format_sse(event: str, data: Any) -> str:
+    """Encode one Server-Sent Events frame with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def _chat_event_stream(user_id: uuid.UUID, session_id: uuid.UUID, message: str) -> AsyncIterator[str]:
+    """Stream the RAG answer as SSE and save the conversation when done.
+
+    Runs after the response has started, when the request's session may
+    already be torn down, so retrieval and saving share a session of their own.
+    """
+    yield _format_sse("session", {"session_id": session_id})
+    
+    async with async_session() as db:
+        answer = ""
+        try:
+            async for event in stream_query_notes(user_id, message, db):
+                if event["event"] == "answer":
+                    answer = event["data"]
+                    continue
+                yield _format_sse(event["event"], event["data"])
+        except ExecutorSaturatedError:
+            yield _format_sse("error", {"detail": "Server is busy. Please try again shortly."})
+            return
+        except Exception as e:
+            logger.error(f"Unexpected error in chat stream: {str(e)}", exc_info=True)
+            yield _format_sse("error", {"detail": "An unexpected error occurred while processing your request."})
+            return
+        
+        if not answer:
+            logger.warning("Empty response from RAG system")
+            answer = "I'm sorry, I couldn't generate a response based on the available information."
+        
+        # Retrieval only reads, so its transaction can end with the chat row's commit
+        chat = Chat(
+            user_id=user_id,
+            session_id=session_id,
+            message=message,
+            response=answer
+        )
+        db.add(chat)
+        await db.commit()
+        await db.refresh(chat)
+    
+    logger.info(f"Successfully streamed chat message for user {user_id}")
+    yield _format_sse("done", {
+        "id": chat.id,
+        "message": chat.message,
+        "response": chat.response,
+        "timestamp": chat.timestamp,
+        "session_id": chat.session_id
+    })
+
+@router.post("/send/stream")
+async def send_message_stream(
+    chat_request: ChatRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Send a message and stream the answer back as Server-Sent Events.
+    
+    Emits a "session" event, a "sources" event with the retrieved documents,
+    "delta" events as the answer is generated, and a final "done" event with
+    the saved chat message (or an "error" event).
+    """
+    session = await _get_or_create_session(db, current_user.id, chat_request.session_id)
+    
+    logger.info(f"Streaming RAG answer for user {current_user.id}")
+    
+    return StreamingResponse(
+        _chat_event_stream(current_user.id, session.id, chat_request.message),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            # Marks the body as already encoded so GZipMiddleware doesn't buffer the stream
+            "Content-Encoding": "identity",
+        }
+    )
+
 @router.post("/send", response_model=ChatResponse)
 async def send_message(
     chat_request: ChatRequest,
@@ -134,36 +248,8 @@ async def send_message(
 ):
     try:
         # Get or create session
-        session_id = chat_request.session_id
-        if session_id:
-            # Verify session belongs to user
-            stmt = select(ChatSession).where(
-                (ChatSession.id == session_id) & 
-                (ChatSession.user_id == current_user.id)
-            )
-            result = await db.execute(stmt)
-            session = result.scalars().first()
-            
-            if not session:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="Chat session not found"
-                )
-        else:
-            # Create new chat session
-            session = ChatSession(
-                id=uuid.uuid4(),
-                user_id=current_user.id,
-                name=f"Chat {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-            )
-            db.add(session)
-            await db.commit()
-            await db.refresh(session)
-            session_id = session.id
-        
-        # Update session timestamp
-        session.updated_at = datetime.now()
-        await db.commit()
+        session = await _get_or_create_session(db, current_user.id, chat_request.session_id)
+        session_id = session.id
         
         # Query the RAG system
         logger.info(f"Querying RAG system for user {current_user.id}")
@@ -201,6 +287,10 @@ async def send_message(
             "source_documents": source_documents
         }
         
+    except ExecutorSaturatedError:
+        # Let the application handler turn this into a 429
+        raise
+        
     except ValueError as e:
         logger.error(f"Value error in chat endpoint: {str(e)}")
         raise HTTPException(
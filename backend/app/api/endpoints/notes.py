@@ -3,19 +3,24 @@ import uuid
 from fastapi import APIRouter, Depends, File, UploadFile, HTTPException, status
 from sqlalchemy.orm import Session
 from typing import List
+from app.core.config import settings
 from app.core.db import get_db
 from app.models.user import User
 from app.models.note import Note
 from app.models.document_chunks import DocumentChunk
+from app.models.ingestion_job import IngestionJob
 from app.services.auth import get_current_user
-from app.services.file_processor import process_file
-from app.services.rag_service import process_user_note, delete_note_embeddings
-from app.schemas.note import NoteResponse
+from app.services.ingestion_queue import ingestion_workers
+from app.services.rag_service import delete_note_embeddings
+from app.schemas.note import IngestionJobResponse, NoteResponse
 from sqlalchemy import select
 
 router = APIRouter()
 
-@router.post("/upload", response_model=NoteResponse)
+# Bytes copied per read from the spooled upload
+UPLOAD_COPY_BLOCK_SIZE = 1024 * 1024
+
+@router.post("/upload", response_model=IngestionJobResponse, status_code=status.HTTP_202_ACCEPTED)
 async def upload_note(
     file: UploadFile = File(...), 
     db: Session = Depends(get_db),
@@ -29,35 +34,47 @@ async def upload_note(
             detail="File type not supported. Upload PDF, DOCX, or TXT files."
         )
     
-    # Save file temporarily
-    file_path = f"temp_{uuid.uuid4()}{os.path.splitext(file.filename)[1]}"
-    with open(file_path, "wb") as f:
-        content = await file.read()
-        f.write(content)
-    
+    # Keep the file until an ingestion worker has processed it
+    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+    file_path = os.path.join(settings.UPLOAD_DIR, f"{uuid.uuid4()}{os.path.splitext(file.filename)[1]}")
     try:
-        # Process file to extract text
-        note_text = process_file(file_path, file.content_type)
+        # Copy the spooled upload in blocks instead of reading it into memory whole
+        with open(file_path, "wb") as f:
+            while block := await file.read(UPLOAD_COPY_BLOCK_SIZE):
+                f.write(block)
         
-        # Save to database
-        note = Note(
-            id=uuid.uuid4(),
+        # Extraction, chunking and indexing run in the background; poll the job for progress
+        return await ingestion_workers.enqueue(
+            db,
             user_id=current_user.id,
-            note_text=note_text,
-            file_name=file.filename
+            file_name=file.filename,
+            content_type=file.content_type,
+            file_path=file_path
         )
-        db.add(note)
-        await db.commit()
-        
-        # Process the note
-        await process_user_note(current_user.id, note.id, note_text, db)
-        
-        return note
-    
-    finally:
-        # Clean up temporary file
+    except Exception:
         if os.path.exists(file_path):
             os.remove(file_path)
+        raise
+
+@router.get("/jobs/{job_id}", response_model=IngestionJobResponse)
+async def get_upload_job(
+    job_id: uuid.UUID,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    stmt = select(IngestionJob).where(
+        (IngestionJob.id == job_id) &
+        (IngestionJob.user_id == current_user.id)
+    )
+    result = await db.execute(stmt)
+    job = result.scalars().first()
+    
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload job not found"
+        )
+    return job
 
 @router.get("", response_model=List[NoteResponse])
 async def get_user_notes(
@@ -97,7 +114,7 @@ async def delete_note(
             )
         
         # Delete embeddings from the vector database
-        await delete_note_embeddings(note_id)
+        await delete_note_embeddings(note_id, db=db, user_id=current_user.id)
         
         # Delete note from database (this will cascade delete chunks due to relationship setting)
         await db.delete(note)
@@ -56,10 +56,121 @@ class Settings(BaseSettings):
     DEFAULT_MODEL: str = "gpt-4o-mini"
     DEFAULT_MAX_TOKENS: int = 1024
     DEFAULT_TEMPERATURE: float = 0.7
+    
+    # Lilypad HTTP connection pool settings
+    LILYPAD_POOL_LIMIT: int = int(os.getenv("LILYPAD_POOL_LIMIT", "100"))
+    LILYPAD_POOL_LIMIT_PER_HOST: int = int(os.getenv("LILYPAD_POOL_LIMIT_PER_HOST", "20"))
+    LILYPAD_KEEPALIVE_TIMEOUT: float = float(os.getenv("LILYPAD_KEEPALIVE_TIMEOUT", "60"))
+    LILYPAD_DNS_CACHE_TTL: int = int(os.getenv("LILYPAD_DNS_CACHE_TTL", "300"))
+    LILYPAD_REQUEST_TIMEOUT: float = float(os.getenv("LILYPAD_REQUEST_TIMEOUT", "120"))
+    # Streamed answers have no overall deadline, only limits on connecting and on the gap between reads
+    LILYPAD_CONNECT_TIMEOUT: float = float(os.getenv("LILYPAD_CONNECT_TIMEOUT", "10"))
+    LILYPAD_STREAM_READ_TIMEOUT: float = float(os.getenv("LILYPAD_STREAM_READ_TIMEOUT", "60"))
     DEFAULT_EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
     
+    # Embedding batching settings
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+    EMBEDDING_MAX_BATCH_SIZE: int = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "128"))
+    EMBEDDING_MAX_WAIT_MS: float = float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5"))
+    
+    # Embedding cache settings (set EMBEDDING_CACHE_DIR to enable the shared on-disk tier)
+    EMBEDDING_CACHE_SIZE: int = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+    EMBEDDING_CACHE_DIR: str = os.getenv("EMBEDDING_CACHE_DIR", "")
+    EMBEDDING_CACHE_DISK_SLOTS: int = int(os.getenv("EMBEDDING_CACHE_DISK_SLOTS", "65536"))
+    
+    # Executor settings for work kept off the event loop
+    EMBEDDING_EXECUTOR: str = os.getenv("EMBEDDING_EXECUTOR", "thread")  # "thread" or "process"
+    EMBEDDING_WORKERS: int = int(os.getenv("EMBEDDING_WORKERS", "2"))
+    EMBEDDING_MAX_PENDING: int = int(os.getenv("EMBEDDING_MAX_PENDING", "1024"))
+    VECTOR_IO_WORKERS: int = int(os.getenv("VECTOR_IO_WORKERS", "4"))
+    VECTOR_IO_MAX_PENDING: int = int(os.getenv("VECTOR_IO_MAX_PENDING", "64"))
+    
+    # Background ingestion of note uploads (UPLOAD_DIR must be shared by every replica running workers)
+    UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", os.path.join(os.getcwd(), "uploads"))
+    INGESTION_WORKERS: int = int(os.getenv("INGESTION_WORKERS", "2"))
+    INGESTION_MAX_ATTEMPTS: int = int(os.getenv("INGESTION_MAX_ATTEMPTS", "3"))
+    INGESTION_RETRY_BACKOFF_SECONDS: float = float(os.getenv("INGESTION_RETRY_BACKOFF_SECONDS", "10"))
+    INGESTION_POLL_INTERVAL_SECONDS: float = float(os.getenv("INGESTION_POLL_INTERVAL_SECONDS", "2.0"))
+    INGESTION_JOB_TIMEOUT_SECONDS: int = int(os.getenv("INGESTION_JOB_TIMEOUT_SECONDS", "900"))
+    
+    # Chunk granularities as "type:size:overlap[:unit]" (unit "chars", "tokens" or "lines"), comma separated
+    NOTE_CHUNK_SPECS: str = os.getenv("NOTE_CHUNK_SPECS", "text:1000:200")
+    DOCUMENT_CHUNK_SPECS: str = os.getenv("DOCUMENT_CHUNK_SPECS", "small:300:150,medium:800:200,line:10:5:lines")
+    
+    # With CHUNK_LENGTH_UNIT=tokens, character specs are measured with the embedding model's tokenizer
+    # instead; the largest becomes CHUNK_TOKEN_FRACTION of EMBEDDING_MAX_SEQ_LENGTH and the others scale with it
+    CHUNK_LENGTH_UNIT: str = os.getenv("CHUNK_LENGTH_UNIT", "chars")  # "chars" or "tokens"
+    CHUNK_TOKEN_FRACTION: float = float(os.getenv("CHUNK_TOKEN_FRACTION", "0.9"))
+    EMBEDDING_MAX_SEQ_LENGTH: int = int(os.getenv("EMBEDDING_MAX_SEQ_LENGTH", "256"))  # all-MiniLM-L6-v2 truncates at 256 word pieces
+    
+    # PDF extraction pool (0 processes extracts in the ingestion worker's thread, without a timeout)
+    PDF_EXTRACTION_PROCESSES: int = int(os.getenv("PDF_EXTRACTION_PROCESSES", str(os.cpu_count() or 1)))
+    PDF_PAGES_PER_TASK: int = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+    PDF_MAX_PAGES: int = int(os.getenv("PDF_MAX_PAGES", "2000"))
+    PDF_EXTRACTION_TIMEOUT_SECONDS: float = float(os.getenv("PDF_EXTRACTION_TIMEOUT_SECONDS", "300"))
+    
+    # Semantic answer cache settings
+    ANSWER_CACHE_ENABLED: bool = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = float(os.getenv("ANSWER_CACHE_SIMILARITY_THRESHOLD", "0.95"))
+    ANSWER_CACHE_TTL_SECONDS: int = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+    ANSWER_CACHE_MAX_ENTRIES_PER_USER: int = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES_PER_USER", "100"))
+    ANSWER_CACHE_MAX_USERS: int = int(os.getenv("ANSWER_CACHE_MAX_USERS", "1000"))
+    
     # Vector Store settings
+    VECTOR_STORE_BACKEND: str = os.getenv("VECTOR_STORE_BACKEND", "chroma")  # "chroma", "pgvector" or "faiss"
     VECTOR_STORE_DIR: str = os.getenv("VECTOR_STORE_DIR", os.path.join(os.getcwd(), "chroma_db"))
+    EMBEDDING_DIMENSION: int = int(os.getenv("EMBEDDING_DIMENSION", "384"))
+    
+    # Write-behind persistence for backends without durable writes (FAISS): writes are logged to a WAL and flushed in the background
+    VECTOR_WAL_DIR: str = os.getenv("VECTOR_WAL_DIR", os.path.join(os.getcwd(), "vector_wal"))
+    VECTOR_WAL_FSYNC: bool = os.getenv("VECTOR_WAL_FSYNC", "true").lower() == "true"
+    VECTOR_FLUSH_INTERVAL_SECONDS: float = float(os.getenv("VECTOR_FLUSH_INTERVAL_SECONDS", "5.0"))
+    VECTOR_FLUSH_MAX_PENDING: int = int(os.getenv("VECTOR_FLUSH_MAX_PENDING", "500"))
+    
+    # Per-user ANN partitions (HNSW parameters apply to newly created partitions)
+    VECTOR_HNSW_SPACE: str = os.getenv("VECTOR_HNSW_SPACE", "cosine")
+    VECTOR_HNSW_M: int = int(os.getenv("VECTOR_HNSW_M", "16"))
+    VECTOR_HNSW_CONSTRUCTION_EF: int = int(os.getenv("VECTOR_HNSW_CONSTRUCTION_EF", "100"))
+    VECTOR_HNSW_SEARCH_EF: int = int(os.getenv("VECTOR_HNSW_SEARCH_EF", "64"))
+    VECTOR_EXACT_SEARCH_MAX_CHUNKS: int = int(os.getenv("VECTOR_EXACT_SEARCH_MAX_CHUNKS", "2000"))
+    VECTOR_MAX_OPEN_PARTITIONS: int = int(os.getenv("VECTOR_MAX_OPEN_PARTITIONS", "256"))
+    # Seconds between checks for other workers' writes to an open partition
+    VECTOR_PARTITION_REFRESH_SECONDS: float = float(os.getenv("VECTOR_PARTITION_REFRESH_SECONDS", "5.0"))
+
+    # In-memory vector storage: "float32", "float16", "int8" or "pq" (top candidates are rescored exactly)
+    VECTOR_STORAGE_MODE: str = os.getenv("VECTOR_STORAGE_MODE", "float32")
+    VECTOR_RESCORE_FACTOR: int = int(os.getenv("VECTOR_RESCORE_FACTOR", "4"))
+    VECTOR_PQ_SUBQUANTIZERS: int = int(os.getenv("VECTOR_PQ_SUBQUANTIZERS", "48"))
+    VECTOR_PQ_MIN_TRAINING_VECTORS: int = int(os.getenv("VECTOR_PQ_MIN_TRAINING_VECTORS", "1024"))
+    
+    # pgvector backend settings
+    PGVECTOR_INDEX: str = os.getenv("PGVECTOR_INDEX", "ivfflat")  # "ivfflat" or "hnsw"
+    PGVECTOR_IVFFLAT_LISTS: int = int(os.getenv("PGVECTOR_IVFFLAT_LISTS", "100"))
+    PGVECTOR_IVFFLAT_PROBES: int = int(os.getenv("PGVECTOR_IVFFLAT_PROBES", "10"))
+    PGVECTOR_HNSW_M: int = int(os.getenv("PGVECTOR_HNSW_M", "16"))
+    PGVECTOR_HNSW_EF_CONSTRUCTION: int = int(os.getenv("PGVECTOR_HNSW_EF_CONSTRUCTION", "64"))
+    PGVECTOR_HNSW_EF_SEARCH: int = int(os.getenv("PGVECTOR_HNSW_EF_SEARCH", "40"))
+
+    # FAISS backend settings
+    FAISS_INDEX_DIR: str = os.getenv("FAISS_INDEX_DIR", os.path.join(os.getcwd(), "faiss_index"))
+    FAISS_INDEX_TYPE: str = os.getenv("FAISS_INDEX_TYPE", "flat")  # "flat" or "hnsw"
+    FAISS_HNSW_M: int = int(os.getenv("FAISS_HNSW_M", "32"))
+    FAISS_HNSW_EF_CONSTRUCTION: int = int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "80"))
+    FAISS_HNSW_EF_SEARCH: int = int(os.getenv("FAISS_HNSW_EF_SEARCH", "64"))
+
+    # BM25 sparse index settings
+    BM25_INDEX_DIR: str = os.getenv("BM25_INDEX_DIR", os.path.join(os.getcwd(), "bm25_index"))
+    BM25_K1: float = float(os.getenv("BM25_K1", "1.2"))
+    BM25_B: float = float(os.getenv("BM25_B", "0.75"))
+    BM25_MAX_LOADED_SHARDS: int = int(os.getenv("BM25_MAX_LOADED_SHARDS", "64"))
+    BM25_MIN_SCORE: float = float(os.getenv("BM25_MIN_SCORE", "3.0"))
+
+    # Retrieval mode: "hybrid" (dense + BM25 fused with RRF), "dense" (vector search only)
+    # or "sparse_first" (BM25 candidates, dense fallback)
+    RETRIEVAL_MODE: str = os.getenv("RETRIEVAL_MODE", "hybrid")
+    HYBRID_RRF_K: int = int(os.getenv("HYBRID_RRF_K", "60"))
+    HYBRID_CANDIDATE_K: int = int(os.getenv("HYBRID_CANDIDATE_K", "20"))
+    HYBRID_MMR_LAMBDA: float = float(os.getenv("HYBRID_MMR_LAMBDA", "0.5"))
     
     # Add this line for JWT token generation
     ALGORITHM: str = "HS256"  # Standard algorithm for JWT tokens
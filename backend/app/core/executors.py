@@ -0,0 +1,143 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorSaturatedError(Exception):
+    """Raised when an executor already has its maximum amount of pending work."""
+
+    def __init__(self, name: str):
+        super().__init__(f"The {name} executor is saturated")
+        self.name = name
+
+
+class BoundedExecutor:
+    """
+    Runs blocking callables off the event loop with a cap on pending work.
+
+    Calls beyond max_pending (running plus queued) fail fast with
+    ExecutorSaturatedError instead of growing an unbounded queue.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_pending: int, use_processes: bool = False):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.use_processes = use_processes
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.use_processes:
+                # Spawn so workers don't inherit the parent's torch/thread state
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix=self.name,
+                )
+            logger.info(
+                f"Started {self.name} executor with {self.max_workers} "
+                f"{'processes' if self.use_processes else 'threads'}"
+            )
+        return self._executor
+
+    @property
+    def saturated(self) -> bool:
+        return self._pending >= self.max_pending
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run fn(*args, **kwargs) in the pool and await its result."""
+        if self.saturated:
+            raise ExecutorSaturatedError(self.name)
+
+        return await self.run_unbounded(fn, *args, **kwargs)
+
+    async def run_unbounded(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run fn(*args, **kwargs) in the pool even when saturated.
+
+        For small bookkeeping calls that must not be shed under load; the work
+        still counts towards pending, so callers of run() see the backlog.
+        """
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._get_executor(), functools.partial(fn, *args, **kwargs)
+            )
+        finally:
+            self._pending -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.max_workers,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            logger.info(f"Stopped {self.name} executor")
+
+
+# Thread pool for blocking vector store (Chroma/SQLite) calls
+vector_io_executor = BoundedExecutor(
+    name="vector-io",
+    max_workers=settings.VECTOR_IO_WORKERS,
+    max_pending=settings.VECTOR_IO_MAX_PENDING,
+)
+
+# Thread or process pool for CPU-bound embedding model calls
+embedding_executor = BoundedExecutor(
+    name="embedding",
+    max_workers=settings.EMBEDDING_WORKERS,
+    max_pending=settings.EMBEDDING_WORKERS * 2,
+    use_processes=settings.EMBEDDING_EXECUTOR == "process",
+)
+
+# Thread pool for blocking text extraction from uploaded files
+extraction_executor = BoundedExecutor(
+    name="extraction",
+    max_workers=settings.INGESTION_WORKERS,
+    max_pending=settings.INGESTION_WORKERS * 2,
+)
+
+
+async def run_vector_io(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run a blocking vector store call on the vector I/O pool."""
+    return await vector_io_executor.run(fn, *args, **kwargs)
+
+
+async def run_vector_io_unbounded(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run a vector store bookkeeping call on the vector I/O pool, bypassing backpressure."""
+    return await vector_io_executor.run_unbounded(fn, *args, **kwargs)
+
+
+async def run_embedding(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run a CPU-bound embedding call on the embedding pool."""
+    return await embedding_executor.run(fn, *args, **kwargs)
+
+
+async def run_extraction(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run a blocking file extraction call on the extraction pool."""
+    return await extraction_executor.run(fn, *args, **kwargs)
+
+
+def shutdown_executors() -> None:
+    """Stop all executors. Called during application shutdown."""
+    vector_io_executor.shutdown()
+    embedding_executor.shutdown()
+    extraction_executor.shutdown()
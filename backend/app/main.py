@@ -13,9 +13,17 @@ from starlette.middleware.httpsredirect import HTTPSRedirectMiddleware
 from app.core.config import settings
 from app.api.api import api_router
 from app.core.db import create_tables, close_db_connections
+from app.core.executors import ExecutorSaturatedError, shutdown_executors
 from app.core.logging import setup_logging
 from app.middleware.rate_limiter import RateLimitMiddleware
 from app.middleware.security_headers import SecurityHeadersMiddleware
+from app.services.embeddings import embedding_batcher
+from app.services.embedding_cache import embedding_cache
+from app.services.api_client import get_lilypad_client
+from app.services.answer_cache import answer_cache
+from app.services.vector_store import vector_store
+from app.services.ingestion_queue import ingestion_workers
+from app.services.file_processor import shutdown_pdf_pool
 
 # Setup logging
 logger = logging.getLogger(__name__)
@@ -37,10 +45,41 @@ async def lifespan(app: FastAPI):
         logger.exception("Failed to create database tables: %s", str(e))
         raise
 
+    await get_lilypad_client().start()
+    await vector_store.start()
+    await ingestion_workers.start()
+
     yield
 
     # Shutdown
     logger.info("Shutting down application")
+    try:
+        # Stop taking jobs first; interrupted jobs go back to the queue
+        await ingestion_workers.close()
+    except Exception as e:
+        logger.exception("Error stopping ingestion workers: %s", str(e))
+
+    try:
+        # Flush pending vector writes while the vector I/O executor is still running
+        await vector_store.close()
+    except Exception as e:
+        logger.exception("Error closing vector store: %s", str(e))
+
+    try:
+        await embedding_batcher.close()
+        embedding_cache.close()
+        shutdown_executors()
+        shutdown_pdf_pool()
+        logger.info("Embedding workers stopped successfully")
+    except Exception as e:
+        logger.exception("Error stopping embedding workers: %s", str(e))
+
+    try:
+        await get_lilypad_client().close()
+        logger.info("Lilypad client closed successfully")
+    except Exception as e:
+        logger.exception("Error closing Lilypad client: %s", str(e))
+
     try:
         await close_db_connections()
         logger.info("Database connections closed successfully")
@@ -144,6 +183,19 @@ def _configure_exception_handlers(app_instance: FastAPI) -> None:
             content={"detail": exc.errors()},
         )
 
+    @app_instance.exception_handler(ExecutorSaturatedError)
+    async def saturated_exception_handler(request: Request, exc: ExecutorSaturatedError):
+        logger.warning(
+            "Executor saturated: %s",
+            exc.name,
+            extra={"path": request.url.path, "method": request.method},
+        )
+        return JSONResponse(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            content={"detail": "Server is busy. Please try again shortly."},
+            headers={"Retry-After": "1"},
+        )
+
 
 # Health check endpoint
 @api_router.get("/health", status_code=status.HTTP_200_OK, tags=["Health"])
@@ -156,7 +208,11 @@ async def health_check():
     return {
         "status": "healthy",
         "version": settings.VERSION,
-        "environment": settings.ENVIRONMENT
+        "environment": settings.ENVIRONMENT,
+        "embedding_cache": embedding_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "vector_store": vector_store.stats(),
+        "ingestion": ingestion_workers.stats()
     }
 
 
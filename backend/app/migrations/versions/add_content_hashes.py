@@ -0,0 +1,34 @@
+"""add content_hash columns to notes and document_chunks
+
+Revision ID: add_content_hashes
+Revises: create_ingestion_jobs
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_content_hashes'
+down_revision = 'create_ingestion_jobs'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # SHA-256 hex digests: of the uploaded file for notes (skips identical re-uploads),
+    # of the chunk text for chunks (reuses stored vectors of unchanged content)
+    op.add_column('notes', sa.Column('content_hash', sa.String(64), nullable=True))
+    op.add_column('document_chunks', sa.Column('content_hash', sa.String(64), nullable=True))
+    
+    # Backfill chunks (sha256() needs PostgreSQL 11+). Existing notes stay NULL: their uploaded
+    # files are gone, so they are never matched as duplicates of a re-upload
+    op.execute("UPDATE document_chunks SET content_hash = encode(sha256(convert_to(content, 'UTF8')), 'hex')")
+    
+    op.create_index('idx_notes_user_content_hash', 'notes', ['user_id', 'content_hash'])
+    op.create_index('ix_document_chunks_content_hash', 'document_chunks', ['content_hash'])
+
+def downgrade():
+    op.drop_index('ix_document_chunks_content_hash', table_name='document_chunks')
+    op.drop_index('idx_notes_user_content_hash', table_name='notes')
+    op.drop_column('document_chunks', 'content_hash')
+    op.drop_column('notes', 'content_hash')
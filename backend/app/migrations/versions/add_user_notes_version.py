@@ -0,0 +1,22 @@
+"""add notes_version to users
+
+Revision ID: add_user_notes_version
+Revises: add_content_hashes
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_user_notes_version'
+down_revision = 'add_content_hashes'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Shared index version for the answer cache, bumped whenever the user's notes change
+    op.add_column('users', sa.Column('notes_version', sa.Integer(), nullable=False, server_default='0'))
+
+def downgrade():
+    op.drop_column('users', 'notes_version')
@@ -0,0 +1,48 @@
+"""create ingestion_jobs table for asynchronous note uploads
+
+Revision ID: create_ingestion_jobs
+Revises: add_title_to_notes
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+
+# revision identifiers, used by Alembic.
+revision = 'create_ingestion_jobs'
+down_revision = 'add_title_to_notes'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Durable queue of note uploads; workers claim rows with FOR UPDATE SKIP LOCKED
+    op.create_table(
+        'ingestion_jobs',
+        sa.Column('id', UUID(as_uuid=True), primary_key=True),
+        sa.Column('user_id', UUID(as_uuid=True), sa.ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('note_id', UUID(as_uuid=True), sa.ForeignKey('notes.id', ondelete='SET NULL'), nullable=True),
+        sa.Column('file_name', sa.String(), nullable=False),
+        sa.Column('content_type', sa.String(), nullable=False),
+        sa.Column('file_path', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False, server_default='queued'),
+        sa.Column('stage', sa.String(), nullable=True),
+        sa.Column('progress', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('chunks_indexed', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('max_attempts', sa.Integer(), nullable=False, server_default='3'),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('available_at', sa.DateTime(timezone=True), server_default=sa.text('now()')),
+        sa.Column('locked_by', sa.String(), nullable=True),
+        sa.Column('locked_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()')),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()')),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index('idx_ingestion_jobs_status_available', 'ingestion_jobs', ['status', 'available_at'])
+    op.create_index('idx_ingestion_jobs_user_id', 'ingestion_jobs', ['user_id'])
+
+def downgrade():
+    op.drop_index('idx_ingestion_jobs_user_id', table_name='ingestion_jobs')
+    op.drop_index('idx_ingestion_jobs_status_available', table_name='ingestion_jobs')
+    op.drop_table('ingestion_jobs')
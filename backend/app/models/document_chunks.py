@@ -15,6 +15,7 @@ class DocumentChunk(Base):
     content = Column(Text, nullable=False)
     chunk_type = Column(String, default="text")  # text, code, etc.
     chunk_metadata = Column(JSONB, nullable=True)
+    content_hash = Column(String(64), nullable=True, index=True)  # SHA-256 of content, for reusing vectors
     
     # Relationship to Note model
     document = relationship("Note", back_populates="chunks")
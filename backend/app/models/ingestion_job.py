@@ -0,0 +1,44 @@
+import uuid
+from datetime import datetime, timezone
+from sqlalchemy import Column, String, DateTime, ForeignKey, Text, Integer, Float, Index
+from sqlalchemy.dialects.postgresql import UUID
+from app.core.db import Base
+
+class IngestionJob(Base):
+    """Model for a queued note upload being extracted, chunked and indexed.
+
+    status moves from queued to processing to completed, or back to queued
+    for a retry until max_attempts, then to failed. locked_at is refreshed
+    while a worker holds the job, so jobs of a crashed worker become
+    claimable again once the lease expires.
+    """
+    
+    __tablename__ = "ingestion_jobs"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    note_id = Column(UUID(as_uuid=True), ForeignKey("notes.id", ondelete="SET NULL"), nullable=True)
+    file_name = Column(String, nullable=False)
+    content_type = Column(String, nullable=False)
+    file_path = Column(String, nullable=False)  # Upload stored under UPLOAD_DIR until the job finishes
+    status = Column(String, nullable=False, default="queued")  # queued, processing, completed, failed
+    stage = Column(String, nullable=True)  # extracting, chunking, indexing
+    progress = Column(Float, nullable=False, default=0.0)
+    chunks_indexed = Column(Integer, nullable=False, default=0)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    error = Column(Text, nullable=True)
+    available_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    locked_by = Column(String, nullable=True)
+    locked_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    
+    __table_args__ = (
+        Index("idx_ingestion_jobs_status_available", "status", "available_at"),
+        Index("idx_ingestion_jobs_user_id", "user_id"),
+    )
+    
+    def __repr__(self):
+        return f"<IngestionJob(id={self.id}, status={self.status})>"
@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime, timezone
-from sqlalchemy import Column, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, String, DateTime, ForeignKey, Text, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from app.core.db import Base
@@ -15,7 +15,12 @@ class Note(Base):
     note_text = Column(Text, nullable=False)
     file_name = Column(String, nullable=True)
     upload_date = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    content_hash = Column(String(64), nullable=True)  # SHA-256 of the uploaded file once indexed, for skipping identical re-uploads
     
     # Relationships
     user = relationship("User", back_populates="notes")
-    chunks = relationship("DocumentChunk", back_populates="document", cascade="all, delete-orphan") 
\ No newline at end of file
+    chunks = relationship("DocumentChunk", back_populates="document", cascade="all, delete-orphan") 
+    
+    __table_args__ = (
+        Index("idx_notes_user_content_hash", "user_id", "content_hash"),
+    )
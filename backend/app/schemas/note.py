@@ -25,4 +25,25 @@ class NoteResponse(BaseModel):
 
     class Config:
         """Configure Pydantic to work with ORM"""
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True 
+
+
+class IngestionJobResponse(BaseModel):
+    """Schema for note upload job status"""
+    id: UUID
+    note_id: Optional[UUID] = None
+    file_name: str
+    status: str
+    stage: Optional[str] = None
+    progress: float
+    chunks_indexed: int
+    attempts: int
+    max_attempts: int
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        """Configure Pydantic to work with ORM"""
+        from_attributes = True
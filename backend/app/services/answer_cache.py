@@ -0,0 +1,173 @@
+import copy
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+import numpy as np
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.db import async_session
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+class _CachedAnswer:
+    """A previously generated answer and the query embedding it answered."""
+
+    __slots__ = ("query_vector", "result", "index_version", "created_at")
+
+    def __init__(self, query_vector: np.ndarray, result: Dict[str, Any], index_version: int, created_at: float):
+        self.query_vector = query_vector
+        self.result = result
+        self.index_version = index_version
+        self.created_at = created_at
+
+class AnswerCache:
+    """Per-user semantic cache of RAG answers.
+
+    A query hits when its embedding's cosine similarity to a cached query is at
+    least the configured threshold. Each user has an index version that is
+    bumped whenever their note set changes; entries recorded under an older
+    version are never served. Entries also expire after a TTL, each user keeps a
+    bounded number of entries, and the least recently active users are evicted
+    first.
+
+    Index versions are the users.notes_version column, bumped in the same
+    transaction as the note change, so a change made by any worker or replica
+    invalidates every process's entries. Reading it costs one primary-key
+    lookup per query.
+    """
+
+    def __init__(
+        self,
+        similarity_threshold: float,
+        ttl_seconds: int,
+        max_entries_per_user: int,
+        max_users: int,
+        enabled: bool = True,
+    ):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries_per_user = max_entries_per_user
+        self.max_users = max_users
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, List[_CachedAnswer]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def index_version(self, db: Session, user_id: uuid.UUID) -> int:
+        """Current version of the user's note set."""
+        if not self.enabled:
+            return 0
+        result = await db.execute(select(User.notes_version).where(User.id == user_id))
+        return result.scalar() or 0
+
+    async def bump_index_version(self, db: Optional[Session], user_id: uuid.UUID) -> None:
+        """Invalidate every cached answer for a user after their notes change.
+
+        With db the bump commits with the caller's transaction; without it,
+        it is committed right away.
+        """
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+
+        stmt = update(User).where(User.id == user_id).values(notes_version=User.notes_version + 1)
+        if db is not None:
+            await db.execute(stmt)
+            return
+        async with async_session() as session:
+            await session.execute(stmt)
+            await session.commit()
+
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def lookup(self, user_id: uuid.UUID, query_embedding: np.ndarray, index_version: int) -> Optional[Dict[str, Any]]:
+        """Return a cached answer for a semantically equivalent query under the given index version, if any."""
+        if not self.enabled:
+            return None
+
+        key = str(user_id)
+        query_vector = self._normalize(query_embedding)
+        now = time.monotonic()
+
+        with self._lock:
+            entries = self._entries.get(key)
+            if entries:
+                # Drop expired or stale entries before scoring
+                entries[:] = [
+                    entry for entry in entries
+                    if entry.index_version == index_version and now - entry.created_at < self.ttl_seconds
+                ]
+
+            if not entries:
+                self.misses += 1
+                return None
+
+            scores = np.stack([entry.query_vector for entry in entries]) @ query_vector
+            best = int(np.argmax(scores))
+            if scores[best] < self.similarity_threshold:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            logger.debug(f"Answer cache hit for user {key} (similarity {scores[best]:.3f})")
+            return copy.deepcopy(entries[best].result)
+
+    def store(self, user_id: uuid.UUID, query_embedding: np.ndarray, result: Dict[str, Any], index_version: int) -> None:
+        """Cache an answer computed against the given index version.
+
+        Entries from a version that has since been bumped are dropped by the
+        next lookup.
+        """
+        if not self.enabled:
+            return
+
+        key = str(user_id)
+        entry = _CachedAnswer(
+            query_vector=self._normalize(query_embedding),
+            result=copy.deepcopy(result),
+            index_version=index_version,
+            created_at=time.monotonic(),
+        )
+
+        with self._lock:
+            entries = self._entries.setdefault(key, [])
+            entries.append(entry)
+            if len(entries) > self.max_entries_per_user:
+                del entries[0]
+                self.evictions += 1
+
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_users:
+                _, dropped = self._entries.popitem(last=False)
+                self.evictions += len(dropped)
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss/eviction counters for monitoring."""
+        with self._lock:
+            return {
+                "users": len(self._entries),
+                "entries": sum(len(entries) for entries in self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+# Create a singleton instance
+answer_cache = AnswerCache(
+    similarity_threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+    max_entries_per_user=settings.ANSWER_CACHE_MAX_ENTRIES_PER_USER,
+    max_users=settings.ANSWER_CACHE_MAX_USERS,
+    enabled=settings.ANSWER_CACHE_ENABLED,
+)
@@ -1,9 +1,8 @@
-import os
-import requests
+import asyncio
 import json
 import logging
 from app.core.config import settings
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Awaitable, Callable, Optional, Tuple
 import aiohttp
 
 # Initialize logging
@@ -15,12 +14,50 @@ class LilypadClient:
     def __init__(self):
         self.api_url = settings.LILYPAD_API_URL
         self.api_token = settings.LILYPAD_API_TOKEN
+        self._session: Optional[aiohttp.ClientSession] = None
         
         if not self.api_token:
             raise ValueError("Lilypad API token not configured")
 
-    def query(self, query: str, context: str) -> str:
-        """Query Lilypad API with the given query and context"""
+    def _default_headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_token}",
+            "Content-Type": "application/json"
+        }
+
+    async def start(self) -> None:
+        """Open the long-lived HTTP session and its keep-alive connection pool."""
+        if self._session is not None and not self._session.closed:
+            return
+
+        connector = aiohttp.TCPConnector(
+            limit=settings.LILYPAD_POOL_LIMIT,
+            limit_per_host=settings.LILYPAD_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=settings.LILYPAD_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=settings.LILYPAD_DNS_CACHE_TTL,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=settings.LILYPAD_REQUEST_TIMEOUT),
+            headers=self._default_headers()
+        )
+        logger.info("Opened Lilypad HTTP session")
+
+    async def close(self) -> None:
+        """Close the HTTP session and release pooled connections."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("Closed Lilypad HTTP session")
+        self._session = None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Return the shared session, opening it on first use outside the app lifespan."""
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
+
+    def _build_query_payload(self, query: str, context: str) -> Dict[str, Any]:
+        """Build the streaming request payload for a context-grounded query"""
 
         system_prompt = """You are an AI assistant that answers questions using only the provided context.
 
@@ -47,34 +84,109 @@ Question: {query}
 Answer strictly based on the context above:
 """
 
-        payload = {
+        return {
             "model": settings.DEFAULT_MODEL,
             "messages": [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
             ],
             "max_tokens": settings.DEFAULT_MAX_TOKENS,
-            "temperature": settings.DEFAULT_TEMPERATURE
+            "temperature": settings.DEFAULT_TEMPERATURE,
+            "stream": True
         }
 
-        headers = {
-            "Authorization": f"Bearer {self.api_token}",
-            "Content-Type": "application/json"
-        }
+    async def aquery(
+        self,
+        query: str,
+        context: str,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None
+    ) -> str:
+        """Query Lilypad API with the given query and context without blocking the event loop.
 
+        Args:
+            query: The user's question
+            context: Retrieved context to answer from
+            is_disconnected: Optional callback (e.g. Request.is_disconnected); when it
+                returns True the upstream request is aborted
+
+        Returns:
+            str: The cleaned answer, or an error message
+        """
+        session = await self._get_session()
+        return await self._run_query(session, self._build_query_payload(query, context), is_disconnected)
+
+    def query(self, query: str, context: str) -> str:
+        """Blocking wrapper around aquery for scripts.
+
+        Uses a temporary session, so it must not be called from a running event loop.
+        """
+        async def _query_with_temporary_session() -> str:
+            async with aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=settings.LILYPAD_REQUEST_TIMEOUT),
+                headers=self._default_headers()
+            ) as session:
+                return await self._run_query(session, self._build_query_payload(query, context))
+
+        return asyncio.run(_query_with_temporary_session())
+
+    async def _run_query(
+        self,
+        session: aiohttp.ClientSession,
+        payload: Dict[str, Any],
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None
+    ) -> str:
+        """Stream a query to completion, aborting it if the client goes away."""
         logger.info("Sending request to Lilypad API")
 
-        try:
-            response = requests.post(self.api_url, headers=headers, json=payload, stream=True)
+        async def _collect() -> str:
+            parts = []
+            async for delta in self._stream_payload(session, payload):
+                parts.append(delta)
+            return "".join(parts)
+
+        task = asyncio.ensure_future(_collect())
+        watcher = None
+        if is_disconnected is not None:
+            watcher = asyncio.ensure_future(self._cancel_on_disconnect(task, is_disconnected))
 
-            if response.status_code == 401:
+        try:
+            full_text = await task
+        except aiohttp.ClientResponseError as e:
+            if e.status == 401:
                 logger.error("Unauthorized (401) - Check API Token and Headers.")
                 return "Unauthorized. Please check your API token."
-
-            return self._process_streaming_response(response)
+            logger.exception(f"Error querying Lilypad API: {str(e)}")
+            return f"Error querying API: {str(e)}"
+        except asyncio.CancelledError:
+            if watcher is not None and watcher.done() and not watcher.cancelled() and watcher.result():
+                logger.info("Client disconnected; aborted Lilypad request")
+                return ""
+            raise
         except Exception as e:
             logger.exception(f"Error querying Lilypad API: {str(e)}")
             return f"Error querying API: {str(e)}"
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+            if not task.done():
+                task.cancel()
+
+        # Clean the response to remove any remaining chunk references
+        return self._clean_response(full_text.strip())
+
+    async def _cancel_on_disconnect(
+        self,
+        task: asyncio.Future,
+        is_disconnected: Callable[[], Awaitable[bool]],
+        interval: float = 0.5
+    ) -> bool:
+        """Poll the client connection and cancel task once it has gone away."""
+        while not task.done():
+            if await is_disconnected():
+                task.cancel()
+                return True
+            await asyncio.sleep(interval)
+        return False
 
     def _clean_context(self, context: str) -> str:
         """Remove chunk references from the retrieved context"""
@@ -103,61 +215,100 @@ Answer strictly based on the context above:
         cleaned = re.sub(r"\s{2,}", " ", cleaned)
         return cleaned.strip()
 
-    def _process_streaming_response(self, response: requests.Response) -> str:
-        """Process streaming or full JSON response from Lilypad API."""
-        full_response = []
+    def clean_response(self, response: str) -> str:
+        """Public wrapper for cleaning chunk references out of a full answer."""
+        return self._clean_response(response)
 
-        try:
-            # Check content type header to decide how to parse
-            content_type = response.headers.get("Content-Type", "")
-            is_streaming = "text/event-stream" in content_type
+    @staticmethod
+    def _extract_content(data: Dict[str, Any]) -> str:
+        """Pull the text out of a completion payload or streaming delta."""
+        choice = (data.get("choices") or [{}])[0]
+        delta = choice.get("delta") or {}
+        message = choice.get("message") or {}
+        return delta.get("content") or message.get("content") or ""
 
-            if is_streaming:
+    async def _iter_sse_events(self, response: aiohttp.ClientResponse) -> AsyncIterator[Tuple[Optional[str], str]]:
+        """Incrementally parse a text/event-stream body into (event, data) pairs."""
+        current_event = None
+        async for raw_line in response.content:
+            line_str = raw_line.decode("utf-8").strip()
+
+            if not line_str:
+                # A blank line terminates the current event
                 current_event = None
+                continue
 
-                for line in response.iter_lines():
-                    if not line:
-                        continue
+            if line_str.startswith("event:"):
+                current_event = line_str[len("event:"):].strip()
+                continue
 
-                    line_str = line.decode("utf-8").strip()
+            if line_str.startswith("data:"):
+                yield current_event, line_str[len("data:"):].strip()
 
-                    if line_str.startswith("event:"):
-                        current_event = line_str[len("event:"):].strip()
-                        continue
+    async def _stream_payload(self, session: aiohttp.ClientSession, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        """POST a streaming request and yield text deltas as they arrive.
 
-                    if line_str.startswith("data:"):
-                        data_str = line_str[len("data:"):].strip()
-
-                        if data_str == "[DONE]":
-                            continue
-
-                        if current_event == "delta":
-                            try:
-                                data = json.loads(data_str)
-                                message = data.get("choices", [{}])[0].get("message", {})
-                                content = message.get("content", "")
-                                if content:
-                                    full_response.append(content)
-                            except json.JSONDecodeError:
-                                logger.debug(f"Failed to parse JSON in delta event: {data_str[:100]}...")
-
-            else:
-                # Non-streaming full JSON response
-                try:
-                    data = response.json()
-                    message = data.get("choices", [{}])[0].get("message", {})
-                    content = message.get("content", "")
+        If the consumer stops early (cancellation, client disconnect), the
+        connection is closed rather than returned to the pool so Lilypad stops
+        generating. The session's total timeout doesn't apply: a long answer
+        may stream for any time, as long as each read arrives within
+        LILYPAD_STREAM_READ_TIMEOUT.
+        """
+        timeout = aiohttp.ClientTimeout(
+            total=None,
+            sock_connect=settings.LILYPAD_CONNECT_TIMEOUT,
+            sock_read=settings.LILYPAD_STREAM_READ_TIMEOUT
+        )
+        async with session.post(self.api_url, json=payload, timeout=timeout) as response:
+            completed = False
+            try:
+                response.raise_for_status()
+
+                if "text/event-stream" not in response.headers.get("Content-Type", ""):
+                    # Endpoint ignored the stream flag; forward the full answer at once
+                    result = await response.json()
+                    content = self._extract_content(result)
                     if content:
-                        full_response.append(content)
-                except Exception as e:
-                    logger.error(f"Failed to parse full JSON response: {e}")
+                        yield content
+                    completed = True
+                    return
 
-        except Exception as e:
-            logger.error(f"Error processing response: {e}")
+                async for event, data_str in self._iter_sse_events(response):
+                    if data_str == "[DONE]":
+                        break
+                    if event not in (None, "delta"):
+                        continue
+                    try:
+                        content = self._extract_content(json.loads(data_str))
+                    except json.JSONDecodeError:
+                        logger.debug(f"Failed to parse JSON in delta event: {data_str[:100]}...")
+                        continue
+                    if content:
+                        yield content
+                completed = True
+            finally:
+                if not completed:
+                    response.close()
 
-        full_text = "".join(full_response).strip()
-        # Clean the response to remove any remaining chunk references
-        return self._clean_response(full_text)
+    async def stream_chat_completion(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """Stream chat completion text from Lilypad API as it is generated.
+        
+        Args:
+            messages: List of message dictionaries with 'role' and 'content'
+            
+        Yields:
+            str: Raw text deltas, in order
+        """
+        data = {
+            "model": "deepseek-r1:7b",
+            "messages": messages,
+            "temperature": 0.5,
+            "stream": True
+        }
+
+        session = await self._get_session()
+        async for delta in self._stream_payload(session, data):
+            yield delta
 
     async def get_chat_completion(self, messages: List[Dict[str, str]]) -> str:
         """Get chat completion from Lilypad API.
@@ -169,11 +320,6 @@ Answer strictly based on the context above:
             str: Generated response text
         """
         try:
-            headers = {
-                "Authorization": f"Bearer {self.api_token}",
-                "Content-Type": "application/json"
-            }
-            
             # Simplified payload with a known working model
             data = {
                 "model": "deepseek-r1:7b",  # Try a different model that might be supported
@@ -183,28 +329,37 @@ Answer strictly based on the context above:
             
             logger.debug(f"Sending request to Lilypad API: {json.dumps(data)}")
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    self.api_url,
-                    headers=headers,
-                    json=data
-                ) as response:
-                    response.raise_for_status()
-                    result = await response.json()
-                    
-                    logger.debug(f"API response: {json.dumps(result)}")
+            session = await self._get_session()
+            async with session.post(
+                self.api_url,
+                json=data
+            ) as response:
+                response.raise_for_status()
+                result = await response.json()
+                
+                logger.debug(f"API response: {json.dumps(result)}")
+                
+                if not result.get("choices"):
+                    raise ValueError("No choices in response")
                     
-                    if not result.get("choices"):
-                        raise ValueError("No choices in response")
-                        
-                    answer = result["choices"][0]["message"]["content"]
-                    logger.debug("Successfully got chat completion")
-                    # Clean the response to remove any chunk references
-                    return self._clean_response(answer)
+                answer = result["choices"][0]["message"]["content"]
+                logger.debug("Successfully got chat completion")
+                # Clean the response to remove any chunk references
+                return self._clean_response(answer)
                     
         except aiohttp.ClientError as e:
             logger.error(f"API request failed: {str(e)}")
             raise
         except Exception as e:
             logger.error(f"Error getting chat completion: {str(e)}")
-            raise 
\ No newline at end of file
+            raise
+
+# Process-wide client shared by all RAGService instances
+_lilypad_client: Optional[LilypadClient] = None
+
+def get_lilypad_client() -> LilypadClient:
+    """Get or create the shared Lilypad client."""
+    global _lilypad_client
+    if _lilypad_client is None:
+        _lilypad_client = LilypadClient()
+    return _lilypad_client
@@ -0,0 +1,344 @@
+import os
+import json
+import fcntl
+import shutil
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import select
+from app.core.config import settings
+from app.models.document_chunks import DocumentChunk
+from app.models.note import Note
+from app.services.keyword_retriever import tokenize, hash_features
+
+logger = logging.getLogger(__name__)
+
+# Metadata keys returned as top-level chunk fields rather than inside chunk_metadata
+_RESERVED_METADATA_KEYS = ("chunk_id", "document_id", "chunk_type", "user_id")
+
+def chunk_record(chunk: Any) -> Dict[str, Any]:
+    """Convert a DocumentChunk row or ChunkRecord into the plain dict the index stores."""
+    metadata = chunk.chunk_metadata or {}
+    return {
+        "id": str(chunk.id),
+        "document_id": str(chunk.document_id),
+        "content": chunk.content,
+        "chunk_type": chunk.chunk_type or "text",
+        "chunk_metadata": {k: v for k, v in metadata.items() if k not in _RESERVED_METADATA_KEYS},
+    }
+
+def _encode(chunks: List[Dict[str, Any]], first_row: int = 0) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Tokenize chunks into (term, row, tf) posting triplets and document lengths."""
+    terms, rows, tfs = [], [], []
+    doc_lens = np.zeros(len(chunks), dtype=np.float32)
+    for i, chunk in enumerate(chunks):
+        tokens = tokenize(chunk["content"])
+        features, counts = hash_features(tokens, ngram_range=(1, 1))
+        terms.append(features)
+        rows.append(np.full(len(features), first_row + i, dtype=np.int32))
+        tfs.append(counts)
+        doc_lens[i] = len(tokens)
+
+    if not chunks:
+        empty = np.empty(0, dtype=np.int32)
+        return empty, empty, np.empty(0, dtype=np.float32), doc_lens
+    return np.concatenate(terms), np.concatenate(rows), np.concatenate(tfs), doc_lens
+
+class BM25Shard:
+    """Immutable BM25 inverted index over one user's chunks.
+
+    Postings are stored term-major: terms[i] owns rows/tfs in the range
+    offsets[i]:offsets[i + 1]. All arrays and the chunk text are memory-mapped
+    from disk, so loading a shard costs little more than reading its metadata.
+    """
+
+    def __init__(self, path: str, version: int):
+        self.path = path
+        self.version = version
+        self.terms = np.load(os.path.join(path, "terms.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.rows = np.load(os.path.join(path, "rows.npy"), mmap_mode="r")
+        self.tfs = np.load(os.path.join(path, "tfs.npy"), mmap_mode="r")
+        self.doc_lens = np.load(os.path.join(path, "doc_lens.npy"), mmap_mode="r")
+        self.content_offsets = np.load(os.path.join(path, "content_offsets.npy"), mmap_mode="r")
+        content_path = os.path.join(path, "content.bin")
+        self.content = np.memmap(content_path, dtype=np.uint8, mode="r") if os.path.getsize(content_path) else np.empty(0, dtype=np.uint8)
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.chunks: List[Dict[str, Any]] = meta["chunks"]
+        self.avgdl = float(self.doc_lens.mean()) if len(self.doc_lens) else 0.0
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def text(self, row: int) -> str:
+        start, end = self.content_offsets[row], self.content_offsets[row + 1]
+        return self.content[start:end].tobytes().decode("utf-8")
+
+    def chunk(self, row: int) -> Dict[str, Any]:
+        return {**self.chunks[row], "content": self.text(row)}
+
+    def triplets(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Expand the postings back into (term, row, tf) triplets."""
+        terms = np.repeat(np.asarray(self.terms), np.diff(self.offsets))
+        return terms, np.asarray(self.rows), np.asarray(self.tfs)
+
+    def search(self, query: str, k: int, k1: float, b: float) -> List[Tuple[int, float]]:
+        """Return the top-k (row, BM25 score) pairs for a query."""
+        if not len(self) or not len(self.terms):
+            return []
+
+        features, _ = hash_features(tokenize(query), ngram_range=(1, 1))
+        if not len(features):
+            return []
+
+        n_docs = len(self)
+        scores = np.zeros(n_docs, dtype=np.float32)
+        norm = k1 * (1 - b + b * np.asarray(self.doc_lens) / (self.avgdl or 1.0))
+
+        positions = np.searchsorted(self.terms, features)
+        for feature, pos in zip(features.tolist(), positions.tolist()):
+            if pos >= len(self.terms) or self.terms[pos] != feature:
+                continue
+            start, end = self.offsets[pos], self.offsets[pos + 1]
+            rows = self.rows[start:end]
+            tfs = self.tfs[start:end]
+            df = end - start
+            idf = np.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+            scores[rows] += idf * tfs * (k1 + 1) / (tfs + norm[rows])
+
+        k = min(k, n_docs)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(row), float(scores[row])) for row in top if scores[row] > 0]
+
+class BM25Index:
+    """On-disk BM25 index sharded by user.
+
+    Each user's shard lives in <root>/<user_id>/v<N>/ and a CURRENT file names
+    the live version. Writers build a new version next to the old one and
+    switch CURRENT atomically under a file lock, so readers in any worker
+    process always see a complete shard. Shards are opened lazily on first
+    query and a bounded number are kept mapped.
+    """
+
+    def __init__(self, root: str, k1: float, b: float, max_loaded_shards: int):
+        self.root = root
+        self.k1 = k1
+        self.b = b
+        self.max_loaded_shards = max_loaded_shards
+        self._shards: "OrderedDict[str, BM25Shard]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._user_locks: Dict[str, threading.Lock] = {}
+        os.makedirs(root, exist_ok=True)
+
+    def _user_dir(self, user_id: uuid.UUID) -> str:
+        return os.path.join(self.root, str(user_id))
+
+    def _current_version(self, user_id: uuid.UUID) -> Optional[int]:
+        try:
+            with open(os.path.join(self._user_dir(user_id), "CURRENT"), "r") as f:
+                return int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def has_shard(self, user_id: uuid.UUID) -> bool:
+        return self._current_version(user_id) is not None
+
+    def _get_shard(self, user_id: uuid.UUID) -> Optional[BM25Shard]:
+        """Return the user's live shard, reopening it if another writer replaced it."""
+        key = str(user_id)
+        version = self._current_version(user_id)
+        if version is None:
+            return None
+
+        with self._lock:
+            shard = self._shards.get(key)
+            if shard is not None and shard.version == version:
+                self._shards.move_to_end(key)
+                return shard
+
+        shard = BM25Shard(os.path.join(self._user_dir(user_id), f"v{version}"), version)
+        with self._lock:
+            self._shards[key] = shard
+            self._shards.move_to_end(key)
+            while len(self._shards) > self.max_loaded_shards:
+                self._shards.popitem(last=False)
+        logger.debug(f"Loaded BM25 shard for user {key} (version {version}, {len(shard)} chunks)")
+        return shard
+
+    @contextmanager
+    def _write_lock(self, user_id: uuid.UUID) -> Iterator[None]:
+        """Serialize writers for one user across threads and worker processes."""
+        key = str(user_id)
+        with self._lock:
+            user_lock = self._user_locks.setdefault(key, threading.Lock())
+
+        user_dir = self._user_dir(user_id)
+        os.makedirs(user_dir, exist_ok=True)
+        with user_lock, open(os.path.join(user_dir, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write(
+        self,
+        user_id: uuid.UUID,
+        chunks: List[Dict[str, Any]],
+        texts: List[bytes],
+        triplets: Tuple[np.ndarray, np.ndarray, np.ndarray],
+        doc_lens: np.ndarray,
+    ) -> None:
+        """Write a new shard version and make it current. Caller holds the write lock."""
+        user_dir = self._user_dir(user_id)
+        previous = self._current_version(user_id)
+        version = (previous or 0) + 1
+        path = os.path.join(user_dir, f"v{version}")
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+
+        terms, rows, tfs = triplets
+        order = np.lexsort((rows, terms))
+        terms, rows, tfs = terms[order], rows[order], tfs[order]
+        unique_terms, starts = np.unique(terms, return_index=True)
+
+        np.save(os.path.join(path, "terms.npy"), unique_terms.astype(np.int32))
+        np.save(os.path.join(path, "offsets.npy"), np.append(starts, len(terms)).astype(np.int64))
+        np.save(os.path.join(path, "rows.npy"), rows.astype(np.int32))
+        np.save(os.path.join(path, "tfs.npy"), tfs.astype(np.float32))
+        np.save(os.path.join(path, "doc_lens.npy"), doc_lens.astype(np.float32))
+        np.save(os.path.join(path, "content_offsets.npy"), np.concatenate([[0], np.cumsum([len(t) for t in texts], dtype=np.int64)]).astype(np.int64))
+        with open(os.path.join(path, "content.bin"), "wb") as f:
+            for text in texts:
+                f.write(text)
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"chunks": chunks}, f, default=str)
+
+        current_tmp = os.path.join(user_dir, f"CURRENT.{os.getpid()}.tmp")
+        with open(current_tmp, "w") as f:
+            f.write(str(version))
+        os.replace(current_tmp, os.path.join(user_dir, "CURRENT"))
+
+        # Keep the previous version for readers that resolved CURRENT just before the switch
+        for name in os.listdir(user_dir):
+            if name.startswith("v") and name[1:].isdigit() and int(name[1:]) < version - 1:
+                shutil.rmtree(os.path.join(user_dir, name), ignore_errors=True)
+
+    @staticmethod
+    def _split(chunks: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[bytes]]:
+        """Separate chunk text (stored in content.bin) from the rest of the record."""
+        records = [{k: v for k, v in chunk.items() if k != "content"} for chunk in chunks]
+        texts = [chunk["content"].encode("utf-8") for chunk in chunks]
+        return records, texts
+
+    def build(self, user_id: uuid.UUID, chunks: List[Dict[str, Any]], replace: bool = False) -> bool:
+        """Build a user's shard from scratch.
+
+        Unless replace is set, an existing shard is left alone so a lazy build
+        from a stale read never overwrites a concurrent update.
+
+        Returns:
+            bool: Whether a shard was written
+        """
+        with self._write_lock(user_id):
+            if not replace and self.has_shard(user_id):
+                return False
+            terms, rows, tfs, doc_lens = _encode(chunks)
+            records, texts = self._split(chunks)
+            self._write(user_id, records, texts, (terms, rows, tfs), doc_lens)
+        logger.info(f"Built BM25 shard for user {user_id} with {len(chunks)} chunks")
+        return True
+
+    def add_chunks(self, user_id: uuid.UUID, chunks: List[Dict[str, Any]]) -> bool:
+        """Add chunks to an existing shard, replacing any with the same id.
+
+        Returns:
+            bool: False if the user has no shard yet (the caller should build one)
+        """
+        with self._write_lock(user_id):
+            shard = self._get_shard(user_id)
+            if shard is None:
+                return False
+
+            new_ids = {chunk["id"] for chunk in chunks}
+            keep = np.array([chunk["id"] not in new_ids for chunk in shard.chunks], dtype=bool)
+            records, texts, (terms, rows, tfs), doc_lens = self._retain(shard, keep)
+
+            new_terms, new_rows, new_tfs, new_lens = _encode(chunks, first_row=len(records))
+            new_records, new_texts = self._split(chunks)
+            self._write(
+                user_id,
+                records + new_records,
+                texts + new_texts,
+                (np.concatenate([terms, new_terms]), np.concatenate([rows, new_rows]), np.concatenate([tfs, new_tfs])),
+                np.concatenate([doc_lens, new_lens]),
+            )
+        logger.info(f"Added {len(chunks)} chunks to BM25 shard for user {user_id}")
+        return True
+
+    def delete_document(self, user_id: uuid.UUID, document_id: uuid.UUID) -> int:
+        """Remove every chunk of a document from the user's shard.
+
+        Returns:
+            int: Number of chunks removed
+        """
+        with self._write_lock(user_id):
+            shard = self._get_shard(user_id)
+            if shard is None:
+                return 0
+
+            keep = np.array([chunk["document_id"] != str(document_id) for chunk in shard.chunks], dtype=bool)
+            removed = int((~keep).sum())
+            if removed:
+                records, texts, triplets, doc_lens = self._retain(shard, keep)
+                self._write(user_id, records, texts, triplets, doc_lens)
+        if removed:
+            logger.info(f"Removed {removed} chunks of document {document_id} from BM25 shard for user {user_id}")
+        return removed
+
+    @staticmethod
+    def _retain(shard: BM25Shard, keep: np.ndarray):
+        """Copy the rows of a shard selected by keep, renumbering them densely."""
+        records = [chunk for chunk, kept in zip(shard.chunks, keep) if kept]
+        texts = [shard.content[shard.content_offsets[row]:shard.content_offsets[row + 1]].tobytes() for row in np.flatnonzero(keep)]
+        terms, rows, tfs = shard.triplets()
+        if len(keep):
+            new_index = np.cumsum(keep, dtype=np.int64) - 1
+            mask = keep[rows]
+            terms, rows, tfs = terms[mask], new_index[rows[mask]].astype(np.int32), tfs[mask]
+        return records, texts, (terms, rows, tfs), np.asarray(shard.doc_lens)[keep]
+
+    def search(self, user_id: uuid.UUID, query: str, k: int = 5) -> Optional[List[Dict[str, Any]]]:
+        """Search one user's chunks with BM25.
+
+        Returns:
+            Chunk dicts with a "score" field, best first, or None if the user has
+            no shard yet
+        """
+        shard = self._get_shard(user_id)
+        if shard is None:
+            return None
+        return [{**shard.chunk(row), "score": score} for row, score in shard.search(query, k, self.k1, self.b)]
+
+async def load_user_chunks(db, user_id: uuid.UUID) -> List[Dict[str, Any]]:
+    """Load all of a user's chunks from the database for a shard build."""
+    result = await db.execute(
+        select(DocumentChunk)
+        .join(Note, DocumentChunk.document_id == Note.id)
+        .where(Note.user_id == user_id)
+    )
+    return [chunk_record(chunk) for chunk in result.scalars().all()]
+
+# Create a singleton instance
+bm25_index = BM25Index(
+    root=settings.BM25_INDEX_DIR,
+    k1=settings.BM25_K1,
+    b=settings.BM25_B,
+    max_loaded_shards=settings.BM25_MAX_LOADED_SHARDS,
+)
@@ -0,0 +1,254 @@
+import re
+import logging
+from array import array
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Boundary strengths, strongest first, mirroring RecursiveCharacterTextSplitter's
+# separators ["\n\n", "\n", ". ", " "]; anything weaker is a hard cut
+PARAGRAPH, LINE, SENTENCE, WORD = range(4)
+_LEVELS = (PARAGRAPH, LINE, SENTENCE, WORD)
+_BOUNDARY_RE = re.compile(r"\n{2,}|\n|\. | ")
+
+# Special tokens the model adds around every input ([CLS] and [SEP])
+_SPECIAL_TOKENS = 2
+
+_UNITS = ("chars", "tokens", "lines")
+
+@dataclass(frozen=True)
+class ChunkSpec:
+    """One chunk granularity.
+
+    unit "chars" makes chunks of at most size characters, overlapping by up
+    to overlap characters and ending at the strongest boundary that fits.
+    unit "tokens" does the same with lengths measured in the embedding
+    model's tokens. unit "lines" makes sliding windows of size lines,
+    starting every overlap (stride) lines.
+    """
+
+    chunk_type: str
+    size: int
+    overlap: int = 0
+    unit: str = "chars"
+
+def parse_chunk_specs(value: str) -> List[ChunkSpec]:
+    """Parse "type:size:overlap[:unit],..." e.g. "small:300:150,line:10:5:lines"."""
+    specs = []
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        parts = item.split(":")
+        if len(parts) not in (3, 4):
+            raise ValueError(f"Invalid chunk spec {item!r}; expected type:size:overlap[:unit]")
+        spec = ChunkSpec(parts[0], int(parts[1]), int(parts[2]), parts[3] if len(parts) == 4 else "chars")
+        if spec.unit not in _UNITS:
+            raise ValueError(f"Unknown chunk unit {spec.unit!r} in {item!r}")
+        if spec.size <= 0 or spec.overlap < 0 or (spec.unit != "lines" and spec.overlap >= spec.size):
+            raise ValueError(f"Invalid chunk size or overlap in {item!r}")
+        specs.append(spec)
+    return specs
+
+def resolve_chunk_specs(value: str) -> List[ChunkSpec]:
+    """Parse chunk specs and apply CHUNK_LENGTH_UNIT.
+
+    In "tokens" mode every character spec becomes a token spec: the largest
+    gets CHUNK_TOKEN_FRACTION of the model's input budget and the others
+    keep their size and overlap relative to it, so no chunk is longer than
+    what the embedding model reads.
+    """
+    specs = parse_chunk_specs(value)
+    if settings.CHUNK_LENGTH_UNIT != "tokens":
+        return specs
+
+    char_sizes = [spec.size for spec in specs if spec.unit == "chars"]
+    if not char_sizes:
+        return specs
+    budget = int((settings.EMBEDDING_MAX_SEQ_LENGTH - _SPECIAL_TOKENS) * settings.CHUNK_TOKEN_FRACTION)
+    largest = max(char_sizes)
+    resolved = []
+    for spec in specs:
+        if spec.unit == "chars":
+            size = max(1, round(budget * spec.size / largest))
+            spec = ChunkSpec(spec.chunk_type, size, min(size - 1, round(size * spec.overlap / spec.size)), "tokens")
+        resolved.append(spec)
+    return resolved
+
+@dataclass
+class Chunk:
+    """A chunk of text with its character span in the source."""
+
+    chunk_type: str
+    content: str
+    start: int
+    end: int
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+class BoundaryIndex:
+    """Candidate split points of a text, found in one scan.
+
+    positions[level] holds, in order, every offset where the text may be
+    split at that strength or a stronger one, so a chunk end is one binary
+    search per level. Line starts are kept for line windows. With tokenize,
+    the character offset where each model token starts is kept too, from
+    one call to the tokenizer's offset mapping.
+    """
+
+    def __init__(self, text: str, tokenize: bool = False):
+        self.text = text
+        self.positions = [array("q") for _ in _LEVELS]
+        self.line_starts = array("q", [0])
+        self.token_starts: Optional[array] = None
+        if tokenize:
+            # Imported lazily so character chunking never loads the tokenizer
+            from app.services.embeddings import get_tokenizer
+
+            encoding = get_tokenizer()(
+                text, add_special_tokens=False, return_offsets_mapping=True, truncation=False, verbose=False
+            )
+            self.token_starts = array("q", (start for start, _ in encoding["offset_mapping"]))
+
+        for match in _BOUNDARY_RE.finditer(text):
+            token = match.group()
+            offset = match.start()
+            if token[0] == "\n":
+                level = PARAGRAPH if len(token) > 1 else LINE
+                self.line_starts.extend(range(offset + 1, match.end() + 1))
+            elif token == ". ":
+                # Keep the period with the sentence it ends
+                level, offset = SENTENCE, offset + 1
+            else:
+                level = WORD
+            for weaker in range(level, len(_LEVELS)):
+                self.positions[weaker].append(offset)
+
+    def split_before(self, start: int, limit: int) -> Tuple[Optional[int], int]:
+        """The strongest boundary in (start, limit], latest first: (level, offset), or (None, limit)."""
+        for level in _LEVELS:
+            positions = self.positions[level]
+            i = bisect_right(positions, limit) - 1
+            if i >= 0 and positions[i] > start:
+                return level, positions[i]
+        return None, limit
+
+    def overlap_start(self, level: Optional[int], lower: int, start: int, end: int) -> int:
+        """Earliest boundary of the given level in [lower, end) after start, else end."""
+        if level is None:
+            return max(lower, start + 1)
+        positions = self.positions[level]
+        # Search from after start too: a chunk shorter than the overlap has boundaries below lower
+        i = bisect_left(positions, max(lower, start + 1))
+        if i < len(positions) and positions[i] < end:
+            return positions[i]
+        return end
+
+    def token_index(self, offset: int) -> int:
+        """Number of tokens starting before offset."""
+        return bisect_left(self.token_starts, offset)
+
+    def token_count(self, start: int, end: int) -> int:
+        return self.token_index(end) - self.token_index(start)
+
+def _char_chunks(index: BoundaryIndex, spec: ChunkSpec, line_offset: int) -> Iterator[Chunk]:
+    text = index.text
+    length = len(text)
+    start = 0
+    while start < length:
+        limit = start + spec.size
+        if limit >= length:
+            level, end = None, length
+        else:
+            level, end = index.split_before(start, limit)
+
+        yield _chunk(index, spec.chunk_type, text[start:end].strip(), start, end)
+        if end >= length:
+            break
+
+        # Start the next chunk at the earliest same-strength boundary within the overlap
+        start = index.overlap_start(level, end - spec.overlap, start, end) if spec.overlap else end
+
+def _token_chunks(index: BoundaryIndex, spec: ChunkSpec, line_offset: int) -> Iterator[Chunk]:
+    text = index.text
+    token_starts = index.token_starts
+    length = len(text)
+    start = 0
+    while start < length:
+        # The first token that doesn't fit bounds the chunk; split at the strongest boundary before it
+        last_token = index.token_index(start) + spec.size
+        if last_token >= len(token_starts):
+            level, end = None, length
+        else:
+            level, end = index.split_before(start, token_starts[last_token])
+
+        yield _chunk(index, spec.chunk_type, text[start:end].strip(), start, end)
+        if end >= length:
+            break
+
+        lower = token_starts[max(index.token_index(end) - spec.overlap, 0)] if spec.overlap else end
+        start = index.overlap_start(level, lower, start, end) if spec.overlap else end
+
+def _chunk(index: BoundaryIndex, chunk_type: str, content: str, start: int, end: int, **metadata: Any) -> Chunk:
+    if index.token_starts is not None:
+        metadata["token_count"] = index.token_count(start, end)
+    return Chunk(chunk_type, content, start, end, metadata)
+
+def _line_chunks(index: BoundaryIndex, spec: ChunkSpec, line_offset: int) -> Iterator[Chunk]:
+    text = index.text
+    line_starts = index.line_starts
+    line_count = len(line_starts)
+    stride = spec.overlap or spec.size
+    for i in range(0, line_count, stride):
+        last = min(i + spec.size, line_count)
+        start = line_starts[i]
+        end = line_starts[last] - 1 if last < line_count else len(text)
+        yield _chunk(
+            index,
+            spec.chunk_type,
+            text[start:end].strip(),
+            start,
+            end,
+            start_line=line_offset + i + 1,
+            end_line=line_offset + last
+        )
+
+# Chunkers yield every chunk they cut, including whitespace-only ones
+_CHUNKERS = {"chars": _char_chunks, "tokens": _token_chunks, "lines": _line_chunks}
+
+def iter_chunks(text: str, specs: Sequence[ChunkSpec], line_offset: int = 0) -> Iterator[Chunk]:
+    """Yield the chunks of every spec, spec by spec, from one shared boundary index.
+
+    Args:
+        text: Text to chunk
+        specs: Granularities to emit, in output order
+        line_offset: Lines preceding text in its document, added to line numbers
+    """
+    if not text:
+        return
+    index = BoundaryIndex(text, tokenize=any(spec.unit == "tokens" for spec in specs))
+    for spec in specs:
+        for chunk in _CHUNKERS[spec.unit](index, spec, line_offset):
+            if chunk.content:
+                yield chunk
+
+def split_final_chunks(text: str, spec: ChunkSpec, line_offset: int = 0) -> Tuple[List[Chunk], int]:
+    """Chunk the start of a text that continues past its end.
+
+    Chunks that reach the end of text may still grow, so chunking stops at
+    the first of them. Chunking the rest of the document from the returned
+    offset then gives the same chunks as chunking it whole; for line
+    windows that offset is a line on the spec's stride grid.
+
+    Returns:
+        Tuple of (chunks more text can't change, offset to resume from)
+    """
+    if not text:
+        return [], 0
+    index = BoundaryIndex(text, tokenize=spec.unit == "tokens")
+    final = []
+    for chunk in _CHUNKERS[spec.unit](index, spec, line_offset):
+        if chunk.end >= len(text):
+            return final, chunk.start
+        if chunk.content:
+            final.append(chunk)
+    return final, len(text)
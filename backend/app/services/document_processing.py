@@ -1,9 +1,10 @@
 import os
 import logging
-from typing import List
+from typing import Iterable, List
 from langchain_community.document_loaders import TextLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
+from app.core.config import settings
+from app.services.chunking import Chunk, iter_chunks, resolve_chunk_specs, split_final_chunks
 
 # Initialize logging
 logger = logging.getLogger(__name__)
@@ -13,6 +14,7 @@ class DocumentProcessor:
 
     def __init__(self, document_path: str):
         self.document_path = document_path
+        self.specs = resolve_chunk_specs(settings.DOCUMENT_CHUNK_SPECS)
         if not os.path.exists(document_path):
             raise FileNotFoundError(f"Document not found at {document_path}")
 
@@ -23,12 +25,14 @@ class DocumentProcessor:
             raw_documents = loader.load()
             raw_content = raw_documents[0].page_content
 
-            all_docs = []
-
-            # Ensure correct function names are used
-            all_docs.extend(self._create_chunks(raw_content, chunk_size=300, overlap=150, chunk_type="small"))
-            all_docs.extend(self._create_chunks(raw_content, chunk_size=800, overlap=200, chunk_type="medium"))
-            all_docs.extend(self._create_line_chunks(raw_content))
+            # Every granularity comes from one boundary scan of the text
+            all_docs = [
+                Document(
+                    page_content=chunk.content,
+                    metadata={"source": self.document_path, "chunk_type": chunk.chunk_type, **chunk.metadata}
+                )
+                for chunk in iter_chunks(raw_content, self.specs)
+            ]
 
             if not all_docs:
                 logger.error("No document chunks were created.")
@@ -46,19 +50,6 @@ class DocumentProcessor:
             logger.exception(f"Error processing document: {str(e)}")
             return []
 
-    def _create_chunks(self, content: str, chunk_size: int, overlap: int, chunk_type: str) -> List[Document]:
-        """Create document chunks with the given size and overlap"""
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=overlap,
-            separators=["\n\n", "\n", ". ", " ", ""]
-        )
-        chunks = splitter.split_text(content)
-        return [
-            Document(page_content=chunk, metadata={"source": self.document_path, "chunk_type": chunk_type})
-            for chunk in chunks
-        ]
-        
     def get_full_document(self) -> str:
         """Get the full document content as a fallback"""
         try:
@@ -68,64 +59,83 @@ class DocumentProcessor:
             logger.exception(f"Error reading full document: {e}")
             return ""
 
-    def _create_line_chunks(self, content: str) -> List[Document]:
-        """Create line-based document chunks"""
-        lines = content.split("\n")
-        line_docs = []
-        window_size = 10
-        stride = 5
-
-        for i in range(0, len(lines), stride):
-            window = lines[i : i + window_size]
-            if window:
-                chunk_text = "\n".join(window).strip()
-                if chunk_text:
-                    doc = Document(
-                        page_content=chunk_text,
-                        metadata={
-                            "source": self.document_path,
-                            "chunk_type": "line",
-                            "start_line": i + 1,
-                            "end_line": min(i + len(window), len(lines)),
-                        }
-                    )
-                    line_docs.append(doc)
-
-        logger.info(f"Created {len(line_docs)} line-based chunks")
-        return line_docs
-
 class TextDocumentProcessor:
     """Handles text content chunking from database content"""
 
+    # Characters buffered before a streamed window is chunked
+    STREAM_WINDOW = 8000
+
     def __init__(self):
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-            separators=["\n\n", "\n", ". ", " ", ""]
+        self.specs = resolve_chunk_specs(settings.NOTE_CHUNK_SPECS)
+
+    @staticmethod
+    def _document(chunk: Chunk) -> Document:
+        return Document(
+            page_content=chunk.content,
+            metadata={
+                "chunk_type": chunk.chunk_type,
+                "source": "database",
+                **chunk.metadata
+            }
         )
 
     def process(self, content: str) -> List[Document]:
         """Process text content and return chunks"""
         try:
             # Split text into chunks
-            chunks = self.text_splitter.split_text(content)
-            
-            # Create Document objects
-            documents = [
-                Document(
-                    page_content=chunk,
-                    metadata={
-                        "chunk_type": "text",
-                        "source": "database"
-                    }
-                )
-                for chunk in chunks
-            ]
+            documents = [self._document(chunk) for chunk in iter_chunks(content, self.specs)]
             
             logger.info(f"Created {len(documents)} chunks from text content")
             return documents
             
         except Exception as e:
             logger.exception(f"Error processing text content: {str(e)}")
-            return [] 
\ No newline at end of file
+            return []
+
+    def process_stream(self, pieces: Iterable[str]) -> List[Document]:
+        """Chunk text arriving as pages or paragraphs, without joining the whole text.
+
+        Pieces are buffered until STREAM_WINDOW characters, then each spec
+        chunks the buffer from where it left off and keeps only the chunks
+        more text can't change (see split_final_chunks). Each spec resumes at
+        its own offset, so the output matches process() on the joined text.
+        Only a spec stuck on one chunk past 4 * STREAM_WINDOW characters (e.g. a
+        line window over one huge line) is cut early. Errors from the pieces
+        iterator propagate to the caller.
+        """
+        documents: List[List[Document]] = [[] for _ in self.specs]
+        resume = [0] * len(self.specs)
+        parts: List[str] = []
+        size = 0
+        line_offset = 0
+        for piece in pieces:
+            parts.append(piece)
+            size += len(piece)
+            if size < self.STREAM_WINDOW:
+                continue
+
+            window = "".join(parts)
+            for i, spec in enumerate(self.specs):
+                start = resume[i]
+                lines = line_offset + window.count("\n", 0, start)
+                chunks, end = split_final_chunks(window[start:], spec, lines)
+                if end == 0 and size >= 4 * self.STREAM_WINDOW:
+                    chunks, end = list(iter_chunks(window[start:], [spec], lines)), len(window) - start
+                documents[i].extend(self._document(chunk) for chunk in chunks)
+                resume[i] = start + end
+
+            # Keep only what some spec still has to chunk
+            cut = min(resume)
+            line_offset += window.count("\n", 0, cut)
+            resume = [offset - cut for offset in resume]
+            window = window[cut:]
+            parts, size = [window], len(window)
+
+        window = "".join(parts)
+        for i, spec in enumerate(self.specs):
+            lines = line_offset + window.count("\n", 0, resume[i])
+            documents[i].extend(self._document(chunk) for chunk in iter_chunks(window[resume[i]:], [spec], lines))
+
+        streamed = [document for spec_documents in documents for document in spec_documents]
+        logger.info(f"Created {len(streamed)} chunks from streamed text")
+        return streamed
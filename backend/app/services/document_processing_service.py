@@ -1,6 +1,10 @@
+import hashlib
 import logging
-from typing import List, Dict, Any, Optional
+from dataclasses import dataclass
+from typing import List, Dict, Any, Iterable, Optional
+from sqlalchemy import select, insert, delete
 from sqlalchemy.orm import Session
+from langchain.schema import Document
 from app.models.note import Note
 from app.models.document_chunks import DocumentChunk
 from app.services.document_processing import TextDocumentProcessor
@@ -8,6 +12,32 @@ import uuid
 
 logger = logging.getLogger(__name__)
 
+# Postgres caps bind parameters per statement at 32767
+_MAX_BIND_PARAMS = 32767
+
+def content_hash(text: str) -> str:
+    """SHA-256 hex digest of a chunk's text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def file_content_hash(file_path: str, block_size: int = 1024 * 1024) -> str:
+    """SHA-256 hex digest of a file's bytes, read in blocks. Blocking."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        while block := file.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+@dataclass(frozen=True)
+class ChunkRecord:
+    """A stored document_chunks row, detached from the ORM session."""
+
+    id: uuid.UUID
+    document_id: uuid.UUID
+    content: str
+    chunk_type: str
+    chunk_metadata: Dict[str, Any]
+    content_hash: str
+
 class DocumentProcessingService:
     """Service for processing documents and storing their chunks."""
     
@@ -23,41 +53,89 @@ class DocumentProcessingService:
         self.db = db
         self.document_processor = TextDocumentProcessor()
     
-    async def process_document(self, note: Note) -> List[DocumentChunk]:
-        """Process a document into chunks and store them."""
+    async def process_document(self, note: Note, chunks: Optional[List[Document]] = None) -> List[ChunkRecord]:
+        """Process a document into chunks and store them.
+
+        Rows are written with multi-row INSERT statements on the session's
+        connection, one round-trip per batch, without going through the ORM
+        unit of work. IDs are generated here, so the returned records carry
+        them without reading anything back.
+
+        Args:
+            note: The note to store chunks for
+            chunks: Chunks already split from the note, e.g. while streaming its upload;
+                note.note_text is split when omitted
+        """
         try:
             # Process document into chunks
-            chunks = self.document_processor.process(note.note_text)
+            if chunks is None:
+                chunks = self.document_processor.process(note.note_text)
             
             if not chunks:
                 logger.warning(f"No chunks created for note {note.id}")
                 return []
             
-            # Create document chunks
-            document_chunks = []
-            for chunk in chunks:
-                # Create document chunk
-                doc_chunk = DocumentChunk(
+            records = [
+                ChunkRecord(
+                    id=uuid.uuid4(),
                     document_id=note.id,
                     content=chunk.page_content,
                     chunk_type=chunk.metadata.get("chunk_type", "text"),
-                    chunk_metadata=chunk.metadata
+                    chunk_metadata=chunk.metadata,
+                    content_hash=content_hash(chunk.page_content)
                 )
-                self.db.add(doc_chunk)
-                document_chunks.append(doc_chunk)
+                for chunk in chunks
+            ]
             
-            # Flush to get chunk IDs without committing transaction
-            await self.db.flush()
+            # Insert in the caller's transaction without committing it
+            rows = [vars(record) for record in records]
+            batch_size = _MAX_BIND_PARAMS // len(rows[0])
+            for start in range(0, len(rows), batch_size):
+                await self.db.execute(insert(DocumentChunk).values(rows[start:start + batch_size]))
             
             # Log success
-            logger.info(f"Successfully processed document {note.id} into {len(document_chunks)} chunks")
-            return document_chunks
+            logger.info(f"Successfully processed document {note.id} into {len(records)} chunks")
+            return records
             
         except Exception as e:
             await self.db.rollback()
             logger.error(f"Error processing document {note.id}: {str(e)}")
             raise
     
+    async def find_indexed_chunks(
+        self,
+        user_id: uuid.UUID,
+        hashes: Iterable[str],
+        exclude_document_id: Optional[uuid.UUID] = None
+    ) -> Dict[str, uuid.UUID]:
+        """Find an existing chunk of the user's other notes for each content hash.
+
+        Args:
+            user_id: Owner of the notes to search
+            hashes: Content hashes of the chunks being indexed
+            exclude_document_id: Note whose own chunks should not be matched
+
+        Returns:
+            Dict mapping each matched content hash to one chunk ID with that content
+        """
+        hashes = list(set(hashes))
+        if not hashes:
+            return {}
+
+        stmt = (
+            select(DocumentChunk.content_hash, DocumentChunk.id)
+            .join(Note, Note.id == DocumentChunk.document_id)
+            .where(Note.user_id == user_id, DocumentChunk.content_hash.in_(hashes))
+        )
+        if exclude_document_id is not None:
+            stmt = stmt.where(DocumentChunk.document_id != exclude_document_id)
+
+        result = await self.db.execute(stmt)
+        matches: Dict[str, uuid.UUID] = {}
+        for chunk_hash, chunk_id in result.all():
+            matches.setdefault(chunk_hash, chunk_id)
+        return matches
+    
     async def get_document_chunks(self, chunk_ids: List[uuid.UUID]) -> List[Dict[str, Any]]:
         """Get document chunks by their IDs."""
         try:
@@ -89,9 +167,7 @@ class DocumentProcessingService:
         """Delete all chunks for a document."""
         try:
             # Delete chunks
-            await self.db.execute(
-                self.db.query(DocumentChunk).filter(DocumentChunk.document_id == note_id).delete()
-            )
+            await self.db.execute(delete(DocumentChunk).where(DocumentChunk.document_id == note_id))
             # Let the calling function handle commit
             
             logger.info(f"Deleted all chunks for document {note_id}")
@@ -0,0 +1,269 @@
+import os
+import fcntl
+import hashlib
+import logging
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_EMPTY_KEY = bytes(32)
+
+class DiskEmbeddingStore:
+    """Fixed-size, memory-mapped hash table of embeddings shared between processes.
+
+    Each slot holds a 32-byte content key and a float32 vector. Lookups probe a
+    small window of slots starting at the key's home position; when the window
+    is full the home slot is overwritten. The file is mapped with MAP_SHARED, so
+    every uvicorn worker sees the same entries and they survive restarts.
+    """
+
+    PROBES = 4
+    # Seconds between directory scans for a table another worker may have created
+    RESCAN_SECONDS = 5.0
+
+    def __init__(self, directory: str, slots: int):
+        self.directory = directory
+        self.slots = slots
+        self.evictions = 0
+        self._mmap = None
+        self._next_scan = 0.0
+        self._lock_path = os.path.join(directory, "embeddings.lock")
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, dim: int) -> str:
+        return os.path.join(self.directory, f"embeddings_{dim}d_{self.slots}.bin")
+
+    def _dtype(self, dim: int) -> np.dtype:
+        return np.dtype([("key", "V32"), ("vec", "<f4", (dim,))])
+
+    def _open(self, dim: Optional[int] = None) -> bool:
+        """Map the table file, creating it if a dimension is known."""
+        if self._mmap is not None:
+            return True
+
+        if dim is None:
+            # Lookups run this on every miss until the table exists, so don't rescan the directory each time
+            now = time.monotonic()
+            if now < self._next_scan:
+                return False
+            # Reuse a table another worker (or a previous run) already created
+            suffix = f"d_{self.slots}.bin"
+            for name in os.listdir(self.directory):
+                if name.startswith("embeddings_") and name.endswith(suffix):
+                    dim = int(name[len("embeddings_"):-len(suffix)])
+                    break
+            if dim is None:
+                self._next_scan = now + self.RESCAN_SECONDS
+                return False
+
+        path = self._path(dim)
+        dtype = self._dtype(dim)
+        if not os.path.exists(path):
+            # Size a temp file fully, then link it into place so other workers never see a short file
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.truncate(dtype.itemsize * self.slots)
+            try:
+                os.link(tmp_path, path)
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(tmp_path)
+
+        self._mmap = np.memmap(path, dtype=dtype, mode="r+", shape=(self.slots,))
+        logger.info(f"Opened on-disk embedding cache at {path}")
+        return True
+
+    def _probe(self, key: bytes) -> List[int]:
+        home = int.from_bytes(key[:8], "little") % self.slots
+        return [(home + i) % self.slots for i in range(self.PROBES)]
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        if not self._open():
+            return None
+
+        for slot in self._probe(key):
+            stored = self._mmap["key"][slot].tobytes()
+            if stored == _EMPTY_KEY:
+                return None
+            if stored == key:
+                vector = np.array(self._mmap["vec"][slot], dtype=np.float32)
+                # A concurrent writer may have replaced the slot while we copied it
+                if self._mmap["key"][slot].tobytes() == key:
+                    return vector
+                return None
+        return None
+
+    def put(self, key: bytes, vector: np.ndarray) -> None:
+        self.put_many([(key, vector)])
+
+    def put_many(self, items: Sequence[Tuple[bytes, np.ndarray]]) -> None:
+        """Write several entries under one acquisition of the file lock."""
+        if not items or not self._open(dim=len(items[0][1])):
+            return
+        dim = self._mmap.dtype["vec"].shape[0]
+        items = [(key, vector) for key, vector in items if len(vector) == dim]
+        if not items:
+            return
+
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                for key, vector in items:
+                    probes = self._probe(key)
+                    target = None
+                    for slot in probes:
+                        stored = self._mmap["key"][slot].tobytes()
+                        if stored == key or stored == _EMPTY_KEY:
+                            target = slot
+                            break
+                    if target is None:
+                        target = probes[0]
+                        self.evictions += 1
+
+                    # Clear the key first so readers never pair it with a half-written vector
+                    self._mmap["key"][target] = np.void(_EMPTY_KEY)
+                    self._mmap["vec"][target] = vector
+                    self._mmap["key"][target] = np.void(key)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def flush(self) -> None:
+        if self._mmap is not None:
+            self._mmap.flush()
+
+class EmbeddingCache:
+    """Content-addressed embedding cache with an in-memory LRU and optional disk tier.
+
+    Entries are keyed on a hash of the model name and the whitespace-normalized
+    text, so the same text never reaches the model twice while it is cached.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        max_entries: int,
+        disk_dir: Optional[str] = None,
+        disk_slots: int = 65536,
+    ):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.disk = DiskEmbeddingStore(disk_dir, disk_slots) if disk_dir else None
+        self._entries: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 or self.disk is not None
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Normalize text so trivially different inputs share a cache entry."""
+        return " ".join(unicodedata.normalize("NFC", text).split())
+
+    def key(self, text: str) -> bytes:
+        payload = f"{self.model_name}\0{self.normalize(text)}".encode("utf-8")
+        return hashlib.sha256(payload).digest()
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """Return the cached embedding for text, or None on a miss.
+
+        The returned vector is shared with the cache and read-only.
+        """
+        if not self.enabled:
+            return None
+
+        key = self.key(text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+
+        if self.disk is not None:
+            vector = self.disk.get(key)
+            if vector is not None:
+                vector.flags.writeable = False
+                self._remember(key, vector)
+                with self._lock:
+                    self.disk_hits += 1
+                return vector
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        return [self.get(text) for text in texts]
+
+    def put(self, text: str, embedding: np.ndarray) -> None:
+        """Store an embedding in every enabled tier."""
+        self.put_many([text], [embedding])
+
+    def put_many(self, texts: Sequence[str], embeddings: Sequence[np.ndarray]) -> None:
+        """Store a batch of embeddings in every enabled tier, taking the disk lock once. Blocking."""
+        if not self.enabled:
+            return
+
+        items = []
+        for text, embedding in zip(texts, embeddings):
+            key = self.key(text)
+            # Own a read-only copy so callers can't mutate cached vectors (rows may be views of a batch)
+            vector = np.array(embedding, dtype=np.float32)
+            vector.flags.writeable = False
+            self._remember(key, vector)
+            items.append((key, vector))
+        if self.disk is not None:
+            try:
+                self.disk.put_many(items)
+            except OSError as e:
+                logger.warning(f"Failed to write embeddings to disk cache: {str(e)}")
+
+    def _remember(self, key: bytes, vector: np.ndarray) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss/eviction counters for monitoring."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk_evictions": self.disk.evictions if self.disk is not None else 0,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def close(self) -> None:
+        if self.disk is not None:
+            self.disk.flush()
+
+# Create a singleton instance
+embedding_cache = EmbeddingCache(
+    model_name=settings.DEFAULT_EMBEDDING_MODEL,
+    max_entries=settings.EMBEDDING_CACHE_SIZE,
+    disk_dir=settings.EMBEDDING_CACHE_DIR or None,
+    disk_slots=settings.EMBEDDING_CACHE_DISK_SLOTS,
+)
@@ -1,7 +1,12 @@
+import asyncio
 import logging
-from typing import List
+from typing import List, Optional, Set, Tuple
+import numpy as np
+from langchain_core.embeddings import Embeddings
 from sentence_transformers import SentenceTransformer
 from app.core.config import settings
+from app.core.executors import ExecutorSaturatedError, run_embedding, run_vector_io_unbounded
+from app.services.embedding_cache import embedding_cache
 
 logger = logging.getLogger(__name__)
 
@@ -20,25 +25,275 @@ def get_model() -> SentenceTransformer:
             raise
     return _model
 
-def get_embeddings(text: str) -> List[float]:
+_tokenizer = None
+
+def get_tokenizer():
+    """Get or initialize the embedding model's fast (Rust) tokenizer.
+
+    Reuses the loaded model's tokenizer when there is one, so measuring
+    chunk lengths doesn't require loading the model weights.
+    """
+    global _tokenizer
+    if _tokenizer is None:
+        if _model is not None:
+            _tokenizer = _model.tokenizer
+        else:
+            from transformers import AutoTokenizer
+            _tokenizer = AutoTokenizer.from_pretrained(settings.DEFAULT_EMBEDDING_MODEL, use_fast=True)
+            logger.info(f"Initialized tokenizer: {settings.DEFAULT_EMBEDDING_MODEL}")
+    return _tokenizer
+
+def get_embeddings(text: str) -> np.ndarray:
     """Generate embeddings for a given text using sentence transformers.
     
     Args:
         text: The text to generate embeddings for
         
     Returns:
-        List of floats representing the text embedding
+        float32 vector representing the text embedding
     """
     try:
-        model = get_model()
-        embedding = model.encode(text, convert_to_numpy=True)
+        cached = embedding_cache.get(text)
+        if cached is not None:
+            return cached
         
-        # Convert to list for JSON serialization
-        embedding_list = embedding.tolist()
+        model = get_model()
+        embedding = np.asarray(model.encode(text, convert_to_numpy=True), dtype=np.float32)
+        embedding_cache.put(text, embedding)
         
         logger.debug(f"Successfully generated embedding for text of length {len(text)}")
-        return embedding_list
+        return embedding
         
     except Exception as e:
         logger.error(f"Error generating embeddings: {str(e)}")
-        raise 
\ No newline at end of file
+        raise
+
+def _encode_batch(texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+    """Encode texts with one model call into a float32 matrix.
+
+    Kept free of cache access so it can run in a worker process.
+    """
+    model = get_model()
+    embeddings = np.asarray(model.encode(
+        list(texts),
+        batch_size=batch_size or settings.EMBEDDING_BATCH_SIZE,
+        convert_to_numpy=True,
+        show_progress_bar=False
+    ), dtype=np.float32)
+
+    logger.debug(f"Successfully generated {len(texts)} embeddings in one batch")
+    return embeddings
+
+def _cache_embeddings(texts: List[str], embeddings: np.ndarray) -> None:
+    embedding_cache.put_many(texts, embeddings)
+
+def _stack(rows: List[np.ndarray]) -> np.ndarray:
+    """Stack embedding rows into one float32 matrix."""
+    if not rows:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.stack(rows).astype(np.float32, copy=False)
+
+def get_embeddings_batch(texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+    """Generate embeddings for several texts with a single model call.
+
+    The model pads each batch to its longest member, so encoding many texts
+    together is much cheaper than calling get_embeddings once per text. Cached
+    texts and duplicates within the batch are only encoded once.
+
+    Args:
+        texts: The texts to generate embeddings for
+        batch_size: Forward-pass batch size (defaults to EMBEDDING_BATCH_SIZE)
+
+    Returns:
+        float32 matrix with one row per text, in the same order as texts
+    """
+    if not texts:
+        return _stack([])
+
+    try:
+        results = embedding_cache.get_many(texts)
+        missing = list(dict.fromkeys(text for text, result in zip(texts, results) if result is None))
+
+        if missing:
+            embeddings = _encode_batch(missing, batch_size)
+            _cache_embeddings(missing, embeddings)
+            encoded = dict(zip(missing, embeddings))
+            results = [result if result is not None else encoded[text] for text, result in zip(texts, results)]
+
+        return _stack(results)
+
+    except Exception as e:
+        logger.error(f"Error generating batch embeddings: {str(e)}")
+        raise
+
+class SharedModelEmbeddings(Embeddings):
+    """LangChain embeddings adapter backed by the process-wide model.
+
+    Lets LangChain components (e.g. the Chroma wrapper) embed text without
+    loading a second copy of the sentence transformer. LangChain expects
+    Python lists, so this is the only place embeddings are converted.
+    """
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return get_embeddings_batch(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return get_embeddings(text).tolist()
+
+class EmbeddingBatcher:
+    """Collects concurrent embedding requests and encodes them as one batch.
+
+    Callers await embed()/embed_many(); a background task drains the queue,
+    waiting at most max_wait_ms for more requests once the first one arrives,
+    and sends up to max_batch_size texts to the embedding executor in a single
+    call. Up to EMBEDDING_WORKERS batches are encoded concurrently, and new
+    requests are rejected with ExecutorSaturatedError once max_pending texts
+    are already waiting.
+    """
+
+    def __init__(
+        self,
+        max_batch_size: Optional[int] = None,
+        max_wait_ms: Optional[float] = None,
+        max_pending: Optional[int] = None,
+    ):
+        self.max_batch_size = max_batch_size or settings.EMBEDDING_MAX_BATCH_SIZE
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else settings.EMBEDDING_MAX_WAIT_MS) / 1000.0
+        self.max_pending = max_pending or settings.EMBEDDING_MAX_PENDING
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._in_flight: Set[asyncio.Task] = set()
+
+    def _ensure_worker(self) -> None:
+        """Start the batching task on the running event loop if needed."""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(settings.EMBEDDING_WORKERS)
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def embed(self, text: str) -> np.ndarray:
+        """Embed a single text through the shared batch queue."""
+        return (await self.embed_many([text]))[0]
+
+    async def embed_many(self, texts: List[str]) -> np.ndarray:
+        """Embed several texts through the shared batch queue, preserving order.
+
+        Cached texts are answered immediately without waiting for a batch.
+
+        Returns:
+            float32 matrix with one row per text
+        """
+        if not texts:
+            return _stack([])
+
+        results = embedding_cache.get_many(texts)
+        missing = list(dict.fromkeys(text for text, result in zip(texts, results) if result is None))
+        if not missing:
+            return _stack(results)
+
+        self._ensure_worker()
+        if self._queue.qsize() >= self.max_pending:
+            raise ExecutorSaturatedError("embedding")
+
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in missing:
+            future = loop.create_future()
+            self._queue.put_nowait((text, future))
+            futures.append(future)
+
+        encoded = dict(zip(missing, await asyncio.gather(*futures)))
+        return _stack([result if result is not None else encoded[text] for text, result in zip(texts, results)])
+
+    async def _collect_batch(self) -> List[Tuple[str, asyncio.Future]]:
+        """Wait for the first request, then gather more until full or timed out."""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            # Take whatever is already queued without yielding
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self) -> None:
+        """Background loop that hands queued texts to the executor in batches."""
+        loop = asyncio.get_running_loop()
+        while True:
+            # Wait for a free worker first so requests keep accumulating meanwhile
+            await self._slots.acquire()
+            try:
+                batch = await self._collect_batch()
+            except BaseException:
+                self._slots.release()
+                raise
+
+            task = loop.create_task(self._encode(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _encode(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        """Encode one batch and resolve its callers' futures."""
+        try:
+            # Skip requests whose callers have already gone away
+            batch = [(text, future) for text, future in batch if not future.done()]
+            if not batch:
+                return
+
+            texts = [text for text, _ in batch]
+            try:
+                embeddings = await run_embedding(_encode_batch, texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+            for (_, future), embedding in zip(batch, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
+            logger.debug(f"Embedding batcher encoded a batch of {len(batch)} texts")
+
+            # Callers already have their vectors; the disk tier's file lock is taken off the event loop
+            try:
+                await run_vector_io_unbounded(_cache_embeddings, texts, embeddings)
+            except Exception as e:
+                logger.warning(f"Failed to cache embedded batch: {str(e)}")
+        finally:
+            self._slots.release()
+
+    async def close(self) -> None:
+        """Stop the batching task and fail any requests still queued."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        for task in list(self._in_flight):
+            task.cancel()
+
+        if self._queue is not None:
+            while not self._queue.empty():
+                _, future = self._queue.get_nowait()
+                if not future.done():
+                    future.set_exception(RuntimeError("Embedding batcher is shut down"))
+
+# Shared batcher used by query and ingest paths
+embedding_batcher = EmbeddingBatcher()
@@ -1,34 +1,154 @@
+import time
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from multiprocessing.pool import AsyncResult, Pool
+from typing import Deque, Iterator, List, Optional, Tuple
 import PyPDF2
 import docx
-import os
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Characters read per block when streaming plain text files
+TEXT_BLOCK_SIZE = 64 * 1024
+
+class ExtractionError(ValueError):
+    """Raised for uploads that can't be extracted and shouldn't be retried."""
 
 def process_file(file_path: str, content_type: str) -> str:
     """Process different file types and extract text."""
-    
+    return "".join(iter_file_text(file_path, content_type))
+
+def iter_file_text(file_path: str, content_type: str) -> Iterator[str]:
+    """Extract text piece by piece: one PDF page, DOCX paragraph or text block at a time."""
+
     if content_type == "application/pdf":
-        return extract_text_from_pdf(file_path)
+        return iter_pdf_pages(file_path)
     elif content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-        return extract_text_from_docx(file_path)
+        return iter_docx_paragraphs(file_path)
     elif content_type == "text/plain":
-        return extract_text_from_txt(file_path)
+        return iter_txt_blocks(file_path)
     else:
-        raise ValueError(f"Unsupported content type: {content_type}")
+        raise ExtractionError(f"Unsupported content type: {content_type}")
+
+# PDF pool state; the pool is created on first use and replaced after a timeout
+_pdf_pool: Optional[Pool] = None
+_pdf_pool_generation = 0
+_pdf_pool_lock = threading.Lock()
+
+# Seconds between checks that the pool wasn't restarted while waiting on a page range
+_POOL_CHECK_SECONDS = 1.0
+
+# Page ranges submitted ahead of the consumer, per pool process
+_RANGES_PER_PROCESS = 2
+
+def _get_pdf_pool() -> Tuple[Pool, int]:
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            # Spawn so workers don't inherit the parent's torch/thread state
+            _pdf_pool = multiprocessing.get_context("spawn").Pool(settings.PDF_EXTRACTION_PROCESSES)
+            logger.info(f"Started PDF extraction pool with {settings.PDF_EXTRACTION_PROCESSES} processes")
+        return _pdf_pool, _pdf_pool_generation
+
+def _restart_pdf_pool(generation: int) -> None:
+    """Kill the pool, stopping whatever page is pinning a worker; the next extraction starts a new one."""
+    global _pdf_pool, _pdf_pool_generation
+    with _pdf_pool_lock:
+        if _pdf_pool is None or generation != _pdf_pool_generation:
+            return
+        _pdf_pool.terminate()
+        _pdf_pool = None
+        _pdf_pool_generation += 1
 
-def extract_text_from_pdf(file_path: str) -> str:
-    text = ""
+def shutdown_pdf_pool() -> None:
+    """Stop the PDF extraction pool. Called during application shutdown."""
+    global _pdf_pool, _pdf_pool_generation
+    with _pdf_pool_lock:
+        if _pdf_pool is not None:
+            _pdf_pool.terminate()
+            _pdf_pool = None
+            _pdf_pool_generation += 1
+            logger.info("Stopped PDF extraction pool")
+
+def _extract_page_range(task: Tuple[str, int, int]) -> List[str]:
+    """Extract pages [start, stop) of a PDF. Runs in a pool process.
+
+    The file is opened per range and closed before returning, so no worker
+    keeps a deleted upload's disk space; PDF_PAGES_PER_TASK amortizes the parse.
+    """
+    file_path, start, stop = task
+    with open(file_path, "rb") as file:
+        pages = PyPDF2.PdfReader(file).pages
+        return [(pages[i].extract_text() or "") + "\n" for i in range(start, stop)]
+
+def iter_pdf_pages(file_path: str) -> Iterator[str]:
+    """Yield a PDF's pages in order.
+
+    With PDF_EXTRACTION_PROCESSES > 0, ranges of PDF_PAGES_PER_TASK pages
+    are extracted in parallel on a process pool and yielded in page order.
+    At most _RANGES_PER_PROCESS ranges per process are submitted ahead of
+    the consumer, so a slow reader holds a bounded number of extracted
+    pages; closing the generator early stops further submissions (ranges
+    already running finish and are discarded). A document taking longer
+    than PDF_EXTRACTION_TIMEOUT_SECONDS has its pool terminated, which stops
+    the worker stuck on it. Documents with more than PDF_MAX_PAGES pages are
+    rejected up front.
+    """
     with open(file_path, "rb") as file:
         reader = PyPDF2.PdfReader(file)
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-    return text
+        page_count = len(reader.pages)
+        if page_count > settings.PDF_MAX_PAGES:
+            raise ExtractionError(f"PDF has {page_count} pages; the limit is {settings.PDF_MAX_PAGES}")
+
+        if settings.PDF_EXTRACTION_PROCESSES <= 0:
+            # PdfReader resolves objects from the file on demand, so only the current page is parsed
+            for page in reader.pages:
+                yield (page.extract_text() or "") + "\n"
+            return
+
+    step = max(1, settings.PDF_PAGES_PER_TASK)
+    tasks = deque((file_path, start, min(start + step, page_count)) for start in range(0, page_count, step))
+    window = max(1, _RANGES_PER_PROCESS * settings.PDF_EXTRACTION_PROCESSES)
+    pool, generation = _get_pdf_pool()
+    in_flight: Deque[AsyncResult] = deque()
+    deadline = time.monotonic() + settings.PDF_EXTRACTION_TIMEOUT_SECONDS
+
+    while tasks or in_flight:
+        # Top the window up; results are consumed in submission order
+        while tasks and len(in_flight) < window:
+            if generation != _pdf_pool_generation:
+                raise RuntimeError("PDF extraction pool was restarted; retry the document")
+            in_flight.append(pool.apply_async(_extract_page_range, (tasks.popleft(),)))
+
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                pages = in_flight[0].get(timeout=min(max(remaining, 0), _POOL_CHECK_SECONDS))
+                break
+            except multiprocessing.TimeoutError:
+                if generation != _pdf_pool_generation:
+                    # Another document's timeout terminated the pool under this one
+                    raise RuntimeError("PDF extraction pool was restarted; retry the document")
+                if time.monotonic() >= deadline:
+                    _restart_pdf_pool(generation)
+                    raise ExtractionError(
+                        f"PDF extraction took longer than {settings.PDF_EXTRACTION_TIMEOUT_SECONDS} seconds"
+                    )
+        in_flight.popleft()
+        yield from pages
 
-def extract_text_from_docx(file_path: str) -> str:
+def iter_docx_paragraphs(file_path: str) -> Iterator[str]:
     doc = docx.Document(file_path)
-    text = ""
     for para in doc.paragraphs:
-        text += para.text + "\n"
-    return text
+        yield para.text + "\n"
 
-def extract_text_from_txt(file_path: str) -> str:
+def iter_txt_blocks(file_path: str) -> Iterator[str]:
     with open(file_path, "r", encoding="utf-8") as file:
-        return file.read() 
\ No newline at end of file
+        while True:
+            block = file.read(TEXT_BLOCK_SIZE)
+            if not block:
+                break
+            yield block
@@ -0,0 +1,347 @@
+import os
+import uuid
+import asyncio
+import socket
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from langchain.schema import Document
+from sqlalchemy import select, update, and_, or_
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.db import async_session
+from app.core.executors import run_extraction
+from app.models.ingestion_job import IngestionJob
+from app.models.note import Note
+from app.services.document_processing import TextDocumentProcessor
+from app.services.document_processing_service import file_content_hash
+from app.services.file_processor import ExtractionError, iter_file_text
+from app.services.rag_service import RAGService
+
+logger = logging.getLogger(__name__)
+
+class LeaseLostError(Exception):
+    """Raised when a worker no longer owns the job it is processing."""
+
+    def __init__(self, job_id: uuid.UUID):
+        super().__init__(f"Lost the lease on ingestion job {job_id}")
+        self.job_id = job_id
+
+def extract_chunks(file_path: str, content_type: str) -> Tuple[str, List[Document]]:
+    """Extract an upload's text and chunk it in one pass. Blocking.
+
+    Pages or paragraphs flow from the file straight into the streaming
+    chunker, so the file is never read whole; the pieces are also joined
+    once for the note's note_text.
+
+    Returns:
+        Tuple of (full note text, chunks)
+    """
+    pieces: List[str] = []
+
+    def collect():
+        for piece in iter_file_text(file_path, content_type):
+            pieces.append(piece)
+            yield piece
+
+    chunks = TextDocumentProcessor().process_stream(collect())
+    return "".join(pieces), chunks
+
+class IngestionWorkerPool:
+    """Bounded pool of background workers that process note uploads.
+
+    Uploads are queued as rows of the ingestion_jobs table and claimed with
+    SELECT ... FOR UPDATE SKIP LOCKED, so workers in any number of replicas
+    share one queue without handing a job out twice. Each progress update
+    renews the claim (locked_at); a job whose claim is older than
+    INGESTION_JOB_TIMEOUT_SECONDS is assumed abandoned by a crashed worker and
+    claimed again. Failed attempts are requeued with a linear backoff until
+    max_attempts, then the job is marked failed with the last error.
+    """
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers or settings.INGESTION_WORKERS
+        self.host = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._active = 0
+        self._completed = 0
+        self._failed = 0
+
+    async def start(self) -> None:
+        """Start the worker tasks. Called during application startup."""
+        if self._tasks:
+            return
+        os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._run_worker(f"{self.host}:{i}"), name=f"ingestion-worker-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(f"Started {self.workers} ingestion workers")
+
+    async def close(self) -> None:
+        """Stop the workers; jobs they were running go back to the queue."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Stopped ingestion workers")
+
+    async def enqueue(
+        self,
+        db: Session,
+        user_id: uuid.UUID,
+        file_name: str,
+        content_type: str,
+        file_path: str
+    ) -> IngestionJob:
+        """Queue an uploaded file for processing and wake an idle worker.
+
+        Args:
+            db: Database session; the job is committed before returning
+            user_id: Owner of the note being uploaded
+            file_name: Original file name, used as the note's file_name
+            content_type: MIME type of the upload
+            file_path: Location of the upload under UPLOAD_DIR; removed once the job finishes
+
+        Returns:
+            IngestionJob: The queued job
+        """
+        job = IngestionJob(
+            id=uuid.uuid4(),
+            user_id=user_id,
+            file_name=file_name,
+            content_type=content_type,
+            file_path=file_path,
+            status="queued",
+            progress=0.0,
+            chunks_indexed=0,
+            attempts=0,
+            max_attempts=settings.INGESTION_MAX_ATTEMPTS
+        )
+        db.add(job)
+        await db.commit()
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    async def _run_worker(self, worker_id: str) -> None:
+        while True:
+            # Clear before claiming so an enqueue during the claim still wakes this worker
+            self._wakeup.clear()
+            try:
+                job = await self._claim(worker_id)
+            except Exception as e:
+                logger.error(f"Error claiming ingestion job: {str(e)}")
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=settings.INGESTION_POLL_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._process(job)
+
+    async def _claim(self, worker_id: str) -> Optional[IngestionJob]:
+        """Claim the oldest runnable job, or a job whose worker stopped renewing its claim."""
+        while True:
+            now = datetime.now(timezone.utc)
+            stale = now - timedelta(seconds=settings.INGESTION_JOB_TIMEOUT_SECONDS)
+            async with async_session() as session:
+                stmt = (
+                    select(IngestionJob)
+                    .where(or_(
+                        and_(IngestionJob.status == "queued", IngestionJob.available_at <= now),
+                        and_(IngestionJob.status == "processing", IngestionJob.locked_at < stale)
+                    ))
+                    .order_by(IngestionJob.available_at)
+                    .limit(1)
+                    .with_for_update(skip_locked=True)
+                )
+                job = (await session.execute(stmt)).scalars().first()
+                if job is None:
+                    return None
+
+                if job.status == "processing" and job.attempts >= job.max_attempts:
+                    # The worker died during the last attempt
+                    job.status = "failed"
+                    job.stage = None
+                    job.error = "Processing timed out"
+                    job.finished_at = now
+                    job.locked_by = None
+                    job.locked_at = None
+                    await session.commit()
+                    self._remove_upload(job.file_path)
+                    self._failed += 1
+                    continue
+
+                job.status = "processing"
+                job.stage = "extracting"
+                job.progress = 0.0
+                job.attempts += 1
+                job.locked_by = worker_id
+                job.locked_at = now
+                await session.commit()
+                return job
+
+    async def _update(self, job: IngestionJob, **values: Any) -> bool:
+        """Update a job this worker still owns; returns False if the claim was lost."""
+        values["updated_at"] = datetime.now(timezone.utc)
+        async with async_session() as session:
+            result = await session.execute(
+                update(IngestionJob)
+                .where(
+                    IngestionJob.id == job.id,
+                    IngestionJob.status == "processing",
+                    IngestionJob.locked_by == job.locked_by,
+                    IngestionJob.attempts == job.attempts
+                )
+                .values(**values)
+            )
+            await session.commit()
+            return result.rowcount > 0
+
+    async def _process(self, job: IngestionJob) -> None:
+        self._active += 1
+        try:
+            chunks_indexed = await self._ingest(job)
+            done = await self._update(
+                job,
+                status="completed",
+                stage=None,
+                progress=1.0,
+                chunks_indexed=chunks_indexed,
+                error=None,
+                finished_at=datetime.now(timezone.utc),
+                locked_by=None,
+                locked_at=None
+            )
+            if done:
+                self._remove_upload(job.file_path)
+                self._completed += 1
+                logger.info(f"Ingestion job {job.id} indexed {chunks_indexed} chunks into note {job.note_id}")
+        except LeaseLostError as e:
+            logger.warning(str(e))
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back without spending an attempt
+            await self._update(
+                job,
+                status="queued",
+                stage=None,
+                attempts=job.attempts - 1,
+                available_at=datetime.now(timezone.utc),
+                locked_by=None,
+                locked_at=None
+            )
+            raise
+        except Exception as e:
+            await self._fail(job, e)
+        finally:
+            self._active -= 1
+
+    async def _ingest(self, job: IngestionJob) -> int:
+        """Extract, chunk and index one upload. Returns the number of chunks indexed."""
+        async def progress(stage: str, fraction: float) -> None:
+            if not await self._update(job, stage=stage, progress=fraction, locked_at=datetime.now(timezone.utc)):
+                raise LeaseLostError(job.id)
+
+        # Hash the stored upload first so a re-upload is recognized without extracting anything
+        note_hash = await run_extraction(file_content_hash, job.file_path)
+        if job.note_id is None:
+            async with async_session() as db:
+                duplicate = (await db.execute(
+                    select(Note.id).where(Note.user_id == job.user_id, Note.content_hash == note_hash).limit(1)
+                )).scalar()
+            if duplicate is not None:
+                # Identical to a note the user already has indexed; nothing to chunk or embed
+                job.note_id = duplicate
+                if not await self._update(job, note_id=duplicate):
+                    raise LeaseLostError(job.id)
+                logger.info(f"Ingestion job {job.id} matches existing note {duplicate}; skipping indexing")
+                return 0
+
+        note_text, chunks = await run_extraction(extract_chunks, job.file_path, job.content_type)
+        await progress("chunking", 0.3)
+
+        async with async_session() as db:
+            rag_service = RAGService(db)
+
+            note = await db.get(Note, job.note_id) if job.note_id else None
+            if note is not None:
+                # An earlier attempt created the note; drop whatever it indexed before starting over
+                await rag_service.delete_note(note.id, user_id=job.user_id)
+                await db.commit()
+            else:
+                # content_hash stays unset until indexing commits, so a failed attempt is never a duplicate match
+                note = Note(
+                    id=uuid.uuid4(),
+                    user_id=job.user_id,
+                    note_text=note_text,
+                    file_name=job.file_name
+                )
+                db.add(note)
+                await db.commit()
+                job.note_id = note.id
+                if not await self._update(job, note_id=note.id):
+                    raise LeaseLostError(job.id)
+
+            chunks_indexed = await rag_service.process_note(note, progress, chunks)
+            note.content_hash = note_hash
+            await db.commit()
+            return chunks_indexed
+
+    async def _fail(self, job: IngestionJob, error: Exception) -> None:
+        now = datetime.now(timezone.utc)
+        message = str(error) or type(error).__name__
+        # Unsupported, oversized or runaway documents would fail the same way again
+        if job.attempts < job.max_attempts and not isinstance(error, ExtractionError):
+            delay = settings.INGESTION_RETRY_BACKOFF_SECONDS * job.attempts
+            logger.warning(
+                f"Ingestion job {job.id} failed on attempt {job.attempts}/{job.max_attempts}, "
+                f"retrying in {delay:.0f}s: {message}"
+            )
+            await self._update(
+                job,
+                status="queued",
+                stage=None,
+                error=message,
+                available_at=now + timedelta(seconds=delay),
+                locked_by=None,
+                locked_at=None
+            )
+            return
+
+        logger.error(f"Ingestion job {job.id} failed on attempt {job.attempts}/{job.max_attempts}: {message}")
+        if await self._update(
+            job,
+            status="failed",
+            stage=None,
+            error=message,
+            finished_at=now,
+            locked_by=None,
+            locked_at=None
+        ):
+            self._remove_upload(job.file_path)
+            self._failed += 1
+
+    @staticmethod
+    def _remove_upload(file_path: str) -> None:
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Return worker counters for monitoring."""
+        return {
+            "workers": len(self._tasks),
+            "active": self._active,
+            "completed": self._completed,
+            "failed": self._failed,
+        }
+
+# Create a singleton instance
+ingestion_workers = IngestionWorkerPool()
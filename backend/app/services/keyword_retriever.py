@@ -1,37 +1,110 @@
 import re
+import zlib
 import logging
+from array import array
+from collections import Counter
 import numpy as np
 from langchain.schema import Document
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 
 # Initialize logging
 logger = logging.getLogger(__name__)
 
+# Word tokens of two or more characters, matching scikit-learn's default pattern
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+# Size of the hashed feature space for unigrams and bigrams
+N_FEATURES = 2 ** 20
+
+ENGLISH_STOP_WORDS = frozenset("""
+a about above after again against all almost also am among an and any are as at be because been
+before being below between both but by can cannot could did do does doing down during each either
+else ever every few for from further had has have having he her here hers herself him himself his
+how however i if in into is it its itself just least less may me might more most much must my myself
+neither no nor not now of off often on once only or other our ours ourselves out over own per rather
+same she should since so some such than that the their theirs them themselves then there these they
+this those though through thus to too under until up upon us very via was we were what when where
+whether which while who whom whose why will with within without would yet you your yours yourself
+yourselves
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase text and split it into word tokens, dropping stop words."""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in ENGLISH_STOP_WORDS]
+
+def hash_features(tokens: List[str], ngram_range: Tuple[int, int] = (1, 2), n_features: int = N_FEATURES) -> Tuple[np.ndarray, np.ndarray]:
+    """Hash the n-grams of a token list into feature ids.
+
+    Uses CRC32 so feature ids are stable across processes and restarts.
+
+    Returns:
+        Tuple of (sorted unique feature ids, term counts)
+    """
+    counts = Counter()
+    min_n, max_n = ngram_range
+    for n in range(min_n, max_n + 1):
+        for i in range(len(tokens) - n + 1):
+            gram = " ".join(tokens[i:i + n])
+            counts[zlib.crc32(gram.encode("utf-8")) % n_features] += 1
+
+    if not counts:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+
+    features = np.fromiter(counts.keys(), dtype=np.int32, count=len(counts))
+    values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+    order = np.argsort(features)
+    return features[order], values[order]
+
 class KeywordRetriever:
-    """Keyword-based document retriever using TF-IDF similarity."""
+    """Keyword-based document retriever using TF-IDF similarity.
+
+    Documents are indexed incrementally: each added chunk appends its hashed
+    n-gram counts to a CSR row store and to per-feature postings, and document
+    frequencies are kept as running counts. IDF weights and row norms are only
+    recomputed, lazily, on the first query after the index changes, so adding
+    or deleting notes never refits the corpus.
+    """
 
     def __init__(self):
         """Initialize keyword retriever"""
-        self.documents = []
-        self.chunks = []
-        self.vectorizer = None
-        self.vectors = None
         self.top_k = 5  # Number of top chunks to retrieve
+        self._reset()
+
+    def _reset(self):
+        """Clear all indexed data"""
+        self.chunks = []
+        # CSR rows: one row per chunk with its feature ids and term counts
+        self._indptr = array("q", [0])
+        self._indices = array("i")
+        self._data = array("f")
+        # Inverted postings: feature id -> (row ids, term counts)
+        self._postings: Dict[int, Tuple[array, array]] = {}
+        self._df = np.zeros(N_FEATURES, dtype=np.int32)
+        self._alive = array("b")
+        self._rows_by_document: Dict[str, List[int]] = {}
+        self._live_count = 0
+        # Derived at query time
+        self._idf = None
+        self._row_norms = None
+        self._dirty = True
+
+    @property
+    def documents(self) -> List[Document]:
+        """Documents currently in the index"""
+        return [chunk["document"] for row, chunk in enumerate(self.chunks) if self._alive[row]]
 
     def initialize(self, documents: List[Document]) -> bool:
         """Initialize retriever with documents
-        
+
         Args:
             documents: List of Document objects
-            
+
         Returns:
             bool: Whether initialization was successful
         """
         try:
-            self.documents = documents
-            self._process_documents()
+            self._reset()
+            self._index_documents(documents)
             logger.info(f"✅ Initialized keyword retriever with {len(documents)} documents")
             return True
         except Exception as e:
@@ -40,69 +113,172 @@ class KeywordRetriever:
 
     def add_documents(self, documents: List[Document]) -> bool:
         """Add documents to the retriever
-        
+
         Args:
             documents: List of Document objects
-            
+
         Returns:
             bool: Whether documents were added successfully
         """
         try:
-            self.documents.extend(documents)
-            self._process_documents()  # Reprocess all documents
+            self._index_documents(documents)
             logger.info(f"✅ Added {len(documents)} documents to keyword retriever")
             return True
         except Exception as e:
             logger.exception(f"❌ Error adding documents: {str(e)}")
             return False
 
-    def _process_documents(self):
-        """Process documents into TF-IDF vectors"""
-        self.chunks = []
-        
-        for doc in self.documents:
+    def delete_document(self, document_id: str) -> int:
+        """Remove every chunk belonging to a document
+
+        Args:
+            document_id: The document_id metadata value of the chunks to remove
+
+        Returns:
+            int: Number of chunks removed
+        """
+        rows = self._rows_by_document.pop(str(document_id), [])
+        removed = 0
+        for row in rows:
+            if not self._alive[row]:
+                continue
+            start, end = self._indptr[row], self._indptr[row + 1]
+            features = np.frombuffer(self._indices, dtype=np.int32)[start:end]
+            self._df[features] -= 1
+            self._alive[row] = 0
+            self._live_count -= 1
+            removed += 1
+
+        if removed:
+            self._dirty = True
+            # Reclaim space once most rows are tombstones
+            if self._live_count < len(self.chunks) // 2:
+                self._compact()
+            logger.info(f"Removed {removed} chunks of document {document_id} from keyword retriever")
+        return removed
+
+    def _index_documents(self, documents: List[Document]):
+        """Append documents to the CSR rows, postings and document frequencies"""
+        for doc in documents:
+            features, counts = hash_features(tokenize(doc.page_content))
+            row = len(self.chunks)
+
             self.chunks.append({
                 "text": doc.page_content,
                 "metadata": doc.metadata,
                 "document": doc
             })
-        
-        if self.chunks:
-            # Prepare TF-IDF vectorizer with n-grams for better phrase matching
-            self.vectorizer = TfidfVectorizer(ngram_range=(1, 2), stop_words="english")
-            doc_texts = [chunk["text"] for chunk in self.chunks]
-            self.vectors = self.vectorizer.fit_transform(doc_texts)
+            self._indices.extend(features.tolist())
+            self._data.extend(counts.tolist())
+            self._indptr.append(len(self._indices))
+            self._alive.append(1)
+            self._live_count += 1
+
+            for feature, count in zip(features.tolist(), counts.tolist()):
+                postings = self._postings.get(feature)
+                if postings is None:
+                    postings = self._postings[feature] = (array("i"), array("f"))
+                postings[0].append(row)
+                postings[1].append(count)
+            self._df[features] += 1
+
+            document_id = doc.metadata.get("document_id")
+            if document_id is not None:
+                self._rows_by_document.setdefault(str(document_id), []).append(row)
+
+        if documents:
+            self._dirty = True
+
+    def _compact(self):
+        """Rebuild the index without deleted rows"""
+        live_documents = self.documents
+        self._reset()
+        self._index_documents(live_documents)
+
+    def _prepare(self):
+        """Recompute IDF weights and row norms if the index changed since the last query"""
+        if not self._dirty:
+            return
+
+        n_docs = max(self._live_count, 0)
+        # Smoothed IDF, as in scikit-learn's TfidfTransformer
+        self._idf = (np.log((1 + n_docs) / (1 + self._df)) + 1).astype(np.float32)
+
+        indptr = np.frombuffer(self._indptr, dtype=np.int64)
+        indices = np.frombuffer(self._indices, dtype=np.int32)
+        data = np.frombuffer(self._data, dtype=np.float32)
+        entry_rows = np.repeat(np.arange(len(self.chunks)), np.diff(indptr))
+        weights = data * self._idf[indices]
+        self._row_norms = np.sqrt(np.bincount(entry_rows, weights=weights * weights, minlength=len(self.chunks)))
+        self._dirty = False
+
+    def search(self, query: str, k: Optional[int] = None) -> List[Tuple[Dict[str, Any], float]]:
+        """Score chunks against a query using cosine similarity of TF-IDF vectors
+
+        Args:
+            query: Search query
+            k: Maximum number of results (defaults to top_k)
+
+        Returns:
+            List of (chunk, score) pairs, best first
+        """
+        k = k or self.top_k
+        if not self._live_count:
+            return []
+
+        self._prepare()
+        features, counts = hash_features(tokenize(query))
+        if not len(features):
+            return []
+
+        query_weights = counts * self._idf[features]
+        query_norm = np.linalg.norm(query_weights)
+        if query_norm == 0:
+            return []
+
+        # Accumulate dot products from the postings of the query features only
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        for feature, query_weight in zip(features.tolist(), query_weights.tolist()):
+            postings = self._postings.get(feature)
+            if postings is None:
+                continue
+            rows = np.frombuffer(postings[0], dtype=np.int32)
+            term_counts = np.frombuffer(postings[1], dtype=np.float32)
+            np.add.at(scores, rows, term_counts * (self._idf[feature] * query_weight))
+
+        alive = np.frombuffer(self._alive, dtype=np.int8).astype(bool)
+        scores[~alive] = 0
+        norms = self._row_norms * query_norm
+        np.divide(scores, norms, out=scores, where=norms > 0)
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.chunks[i], float(scores[i])) for i in top if scores[i] > 0]
 
     def retrieve(self, query: str) -> str:
         """Retrieve relevant document chunks based on query
-        
+
         Args:
             query: Search query
-            
+
         Returns:
             str: Concatenated relevant content
         """
-        if not self.chunks:
+        if not self._live_count:
             logger.warning("No documents available for retrieval")
             return ""
 
         try:
-            # Transform query using existing vectorizer
-            query_vector = self.vectorizer.transform([query])
-            
-            # Compute cosine similarity between query and document chunks
-            scores = cosine_similarity(query_vector, self.vectors)[0]
-            top_indices = np.argsort(scores)[-self.top_k:][::-1]  # Get top_k most relevant chunks
-            
             # Filter low-confidence results
-            retrieved_chunks = [self.chunks[i] for i in top_indices if scores[i] > 0.1]
-            
+            retrieved_chunks = [chunk for chunk, score in self.search(query) if score > 0.1]
+
             # Last used chunks for source tracking
             self.last_retrieved_chunks = retrieved_chunks
-            
+
             # Merge chunks into a single context
             merged_context = "\n\n".join([chunk["text"] for chunk in retrieved_chunks])
-            
+
             return merged_context
 
         except Exception as e:
@@ -111,42 +287,43 @@ class KeywordRetriever:
 
     def get_most_relevant_content(self) -> str:
         """Get most relevant content as fallback
-        
+
         Returns:
             str: Combined content from top documents
         """
-        if not self.chunks:
+        live_chunks = [chunk for row, chunk in enumerate(self.chunks) if self._alive[row]]
+        if not live_chunks:
             return ""
-            
+
         # Return top 3 documents by length as fallback
-        sorted_chunks = sorted(self.chunks, key=lambda x: len(x["text"]), reverse=True)
+        sorted_chunks = sorted(live_chunks, key=lambda x: len(x["text"]), reverse=True)
         top_chunks = sorted_chunks[:3]
         self.last_retrieved_chunks = top_chunks
-        
+
         return "\n\n".join([chunk["text"] for chunk in top_chunks])
 
     def get_documents_for_context(self, context: str) -> List[Document]:
         """Get the source documents used in the context
-        
+
         Args:
             context: The context string
-            
+
         Returns:
             List[Document]: Source documents
         """
         if not hasattr(self, 'last_retrieved_chunks'):
             return []
-            
+
         return [chunk["document"] for chunk in self.last_retrieved_chunks]
 
     def hybrid_search(self, query: str) -> str:
         """Implement hybrid search for compatibility with VectorStore interface
-        
+
         Args:
             query: Search query
-            
+
         Returns:
             str: Retrieved context
         """
         # For keyword retriever, this is the same as regular retrieve
-        return self.retrieve(query) 
\ No newline at end of file
+        return self.retrieve(query)
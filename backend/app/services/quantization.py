@@ -0,0 +1,138 @@
+import logging
+from typing import Optional, Tuple
+import numpy as np
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+STORAGE_MODES = ("float32", "float16", "int8", "pq")
+
+# Rows scored per block when codes are decoded, bounding the float32 scratch space
+_SCORE_BLOCK_ROWS = 4096
+
+class QuantizedMatrix:
+    """Compact in-memory copy of a matrix of unit-length vectors.
+
+    Supports approximate inner products against a query without expanding the
+    whole matrix back to float32:
+
+    - "float32": the vectors as-is (4 bytes per dimension)
+    - "float16": half precision (2x smaller)
+    - "int8": symmetric per-vector scalar quantization, one int8 code per
+      dimension plus a float32 scale (about 4x smaller)
+    - "pq": product quantization with VECTOR_PQ_SUBQUANTIZERS one-byte codes
+      per vector, scored with per-query lookup tables. Training needs at least
+      VECTOR_PQ_MIN_TRAINING_VECTORS vectors; smaller matrices use int8.
+
+    Scores are approximate outside float32 mode, so callers rescore the top
+    candidates against exact vectors (see rescore()).
+    """
+
+    def __init__(self, vectors: np.ndarray, mode: Optional[str] = None):
+        mode = mode or settings.VECTOR_STORAGE_MODE
+        if mode not in STORAGE_MODES:
+            raise ValueError(f"Unknown vector storage mode: {mode}")
+
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.count, self.dimension = vectors.shape
+        if mode == "pq" and (
+            self.count < settings.VECTOR_PQ_MIN_TRAINING_VECTORS
+            or self.dimension % settings.VECTOR_PQ_SUBQUANTIZERS
+        ):
+            mode = "int8"
+        self.mode = mode
+
+        self.scales: Optional[np.ndarray] = None
+        self.centroids: Optional[np.ndarray] = None
+        if mode == "float32":
+            self.codes = vectors
+        elif mode == "float16":
+            self.codes = vectors.astype(np.float16)
+        elif mode == "int8":
+            self.scales = np.abs(vectors).max(axis=1) / 127.0
+            safe = np.where(self.scales == 0, 1, self.scales)
+            self.codes = np.round(vectors / safe[:, None]).astype(np.int8)
+        else:
+            self.codes, self.centroids = self._train_pq(vectors)
+
+    @staticmethod
+    def _train_pq(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Train a product quantizer with FAISS and encode the vectors."""
+        import faiss
+
+        subquantizers = settings.VECTOR_PQ_SUBQUANTIZERS
+        pq = faiss.ProductQuantizer(vectors.shape[1], subquantizers, 8)
+        pq.train(vectors)
+        codes = pq.compute_codes(vectors)
+        centroids = faiss.vector_to_array(pq.centroids).reshape(subquantizers, pq.ksub, pq.dsub)
+        return codes, centroids
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the codes and their side tables."""
+        return sum(array.nbytes for array in (self.codes, self.scales, self.centroids) if array is not None)
+
+    def _decode(self, start: int, stop: int) -> np.ndarray:
+        codes = self.codes[start:stop]
+        if self.mode == "int8":
+            return codes.astype(np.float32) * self.scales[start:stop, None]
+        return codes.astype(np.float32)
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """Approximate inner products of every row with a query vector."""
+        query = np.asarray(query, dtype=np.float32)
+        if self.mode == "float32":
+            return self.codes @ query
+        if self.mode == "pq":
+            subquantizers, _, dsub = self.centroids.shape
+            # Table of each sub-vector of the query against every centroid of its subquantizer
+            tables = np.einsum("mkd,md->mk", self.centroids, query.reshape(subquantizers, dsub))
+            return tables[np.arange(subquantizers), self.codes].sum(axis=1)
+
+        scores = np.empty(self.count, dtype=np.float32)
+        for start in range(0, self.count, _SCORE_BLOCK_ROWS):
+            stop = min(start + _SCORE_BLOCK_ROWS, self.count)
+            scores[start:stop] = self._decode(start, stop) @ query
+        return scores
+
+    def top(self, query: np.ndarray, n: int, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """Rows of the n highest approximate scores, best first; rows outside mask are skipped."""
+        scores = self.scores(query)
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+            n = min(n, int(mask.sum()))
+        n = min(n, self.count)
+        if n <= 0:
+            return np.empty(0, dtype=np.int64)
+        rows = np.argpartition(-scores, n - 1)[:n]
+        return rows[np.argsort(-scores[rows])]
+
+def rescore(query: np.ndarray, vectors: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Exactly re-rank candidate vectors by cosine similarity to the query.
+
+    Args:
+        query: The query vector
+        vectors: float32 vectors of the candidates, e.g. rows of a memmap
+        k: Number of candidates to keep
+
+    Returns:
+        Tuple of (positions into vectors, best first; their cosine similarities)
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if not len(vectors):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    query = np.asarray(query, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1) * (np.linalg.norm(query) or 1.0)
+    scores = (vectors @ query) / np.where(norms == 0, 1, norms)
+    order = np.argsort(-scores)[:k]
+    return order, scores[order]
+
+def rescore_count(k: int) -> int:
+    """How many approximate candidates to fetch so k survive exact rescoring."""
+    if settings.VECTOR_STORAGE_MODE == "float32":
+        return k
+    return k * max(1, settings.VECTOR_RESCORE_FACTOR)
@@ -1,24 +1,35 @@
 import uuid
 import logging
-from typing import List, Dict, Any
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from typing import List, Dict, Any, AsyncIterator, Awaitable, Callable, Optional
+import numpy as np
 from app.core.config import settings
 from sqlalchemy.orm import Session
 from app.models.note import Note
 from app.services.document_processing_service import DocumentProcessingService
-from app.services.embeddings import get_embeddings
+from app.services.embeddings import embedding_batcher
 from app.services.vector_store import VectorStore
-from app.services.api_client import LilypadClient
+from app.services.api_client import get_lilypad_client
+from app.services.answer_cache import answer_cache
+from app.services.bm25_index import bm25_index, chunk_record
+from app.services.retrieval import HybridRetriever, RetrievedContext, ensure_sparse_index, sparse_search
+from app.core.executors import run_vector_io
 
 # Initialize logging
 logger = logging.getLogger(__name__)
 
-# Text splitter for chunking
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=1000,
-    chunk_overlap=200,
-    length_function=len,
-)
+NO_CONTEXT_ANSWER = "I couldn't find any relevant information in your notes to answer this question."
+
+SYSTEM_PROMPT = """You are a helpful AI assistant that answers questions based on the user's notes. 
+Use ONLY the provided context to answer questions. If you cannot find relevant information in the context, say so.
+
+IMPORTANT INSTRUCTIONS:
+1. When you want to show your reasoning process, wrap it in <think>...</think> tags
+2. You may include your step-by-step analysis in the <think> tags to show how you arrived at your answer
+3. For complex questions, break down your thinking process inside <think> tags
+4. After your thinking section, provide a clear and direct answer without the tags
+5. Your response can have both a <think> section AND a regular answer
+6. NEVER mention 'chunks', 'CHUNK X', or any metadata related to document retrieval in your main answer (outside of think tags)
+7. If you're unsure, simply state that the information isn't available in the provided context"""
 
 class RAGService:
     """Service for handling RAG operations using database storage and vector search."""
@@ -31,28 +42,94 @@ class RAGService:
         self.db = db
         self.document_processor = DocumentProcessingService(db)
         self.vector_store = VectorStore()
-        self.lilypad_client = LilypadClient()
+        self.lilypad_client = get_lilypad_client()
     
-    async def process_note(self, note: Note) -> None:
-        """Process a note and add it to the retrieval system."""
+    async def process_note(
+        self,
+        note: Note,
+        progress: Optional[Callable[[str, float], Awaitable[None]]] = None,
+        chunks: Optional[List[Any]] = None
+    ) -> int:
+        """Process a note and add it to the retrieval system.
+
+        Args:
+            note: The note to chunk and index
+            progress: Optional async callback receiving (stage, fraction done)
+            chunks: Optional pre-split chunks (see TextDocumentProcessor.process_stream)
+
+        Returns:
+            int: Number of chunks indexed
+        """
         try:
             # Process document into chunks and store in database
-            chunks = await self.document_processor.process_document(note)
+            chunks = await self.document_processor.process_document(note, chunks)
+            if progress:
+                await progress("indexing", 0.5)
+            
+            # Content the user already indexed in other notes keeps its stored vector
+            indexed_chunks = await self.document_processor.find_indexed_chunks(
+                note.user_id, (chunk.content_hash for chunk in chunks), exclude_document_id=note.id
+            )
             
             # Add chunks to vector store with embeddings
-            await self.vector_store.add_documents(chunks)
+            await self.vector_store.add_documents(chunks, user_id=note.user_id, db=self.db, indexed_chunks=indexed_chunks)
+            if progress:
+                await progress("indexing", 0.9)
+            
+            # Keep the user's BM25 shard in step with the vector store
+            await self._index_sparse(note.user_id, chunks)
+            
+            # The user's note set changed, so previously cached answers are stale
+            await answer_cache.bump_index_version(self.db, note.user_id)
             
             logger.info(f"Successfully processed note {note.id}")
+            return len(chunks)
 
         except Exception as e:
             logger.error(f"Error processing note {note.id}: {str(e)}")
             raise
     
-    async def get_relevant_chunks(self, query: str, user_id: uuid.UUID, limit: int = 5) -> List[Dict[str, Any]]:
-        """Get relevant chunks for a query using semantic search."""
+    async def _index_sparse(self, user_id: uuid.UUID, chunks: List[Any]) -> None:
+        """Add chunks to the user's BM25 shard, building the shard from the database if missing."""
+        if not chunks:
+            return
+        records = [chunk_record(chunk) for chunk in chunks]
+        if not await run_vector_io(bm25_index.add_chunks, user_id, records):
+            await ensure_sparse_index(self.db, user_id)
+    
+    async def sparse_search(self, query: str, user_id: uuid.UUID, limit: int = 5) -> List[Dict[str, Any]]:
+        """Search the user's chunks with BM25."""
+        return await sparse_search(self.db, query, user_id, limit)
+    
+    async def get_relevant_chunks(
+        self,
+        query: str,
+        user_id: uuid.UUID,
+        limit: int = 5,
+        query_embedding: Optional[np.ndarray] = None
+    ) -> RetrievedContext:
+        """Get relevant chunks for a query as a RetrievedContext.
+        
+        In "hybrid" retrieval mode, dense and BM25 results are fused with
+        reciprocal rank fusion. In "sparse_first" mode, BM25 runs first and
+        answers on its own when its best match scores at least BM25_MIN_SCORE,
+        so exact-term queries skip the dense vector search. Otherwise semantic
+        search is used.
+        """
         try:
-            # Get query embedding
-            query_embedding = get_embeddings(query)
+            if settings.RETRIEVAL_MODE == "hybrid":
+                retriever = HybridRetriever(self.vector_store, db=self.db)
+                return await retriever.retrieve(query, user_id, k=limit, query_embedding=query_embedding)
+            
+            if settings.RETRIEVAL_MODE == "sparse_first":
+                sparse_chunks = await self.sparse_search(query, user_id, limit)
+                if sparse_chunks and sparse_chunks[0]["score"] >= settings.BM25_MIN_SCORE:
+                    logger.debug(f"Answered retrieval from BM25 for user {user_id}")
+                    return RetrievedContext.from_dicts(sparse_chunks)
+            
+            # Get query embedding unless the caller already has it
+            if query_embedding is None:
+                query_embedding = await embedding_batcher.embed(query)
             
             # Search vector store for similar chunks
             # The similarity_search method now returns all needed chunk data
@@ -62,79 +139,115 @@ class RAGService:
                 user_id=user_id
             )
             
-            return similar_chunks
+            return RetrievedContext.from_dicts(similar_chunks)
             
         except Exception as e:
             logger.error(f"Error getting relevant chunks: {str(e)}")
             raise
     
+    def _build_messages(self, query: str, chunks: RetrievedContext) -> List[Dict[str, str]]:
+        """Build the Lilypad chat messages for a query and its retrieved context."""
+        context = chunks.render(separator="\n\n", detailed_headers=False)
+        
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": f"Context:\n{context}\n\nQuestion: {query}"}
+        ]
+    
     async def query_documents(self, query: str, user_id: uuid.UUID, limit: int = 5) -> Dict[str, Any]:
         """Query documents and get response from Lilypad."""
         try:
+            # Capture the index version before retrieval so answers racing a note change aren't cached
+            index_version = await answer_cache.index_version(self.db, user_id)
+            query_embedding = await embedding_batcher.embed(query)
+            
+            cached = answer_cache.lookup(user_id, query_embedding, index_version)
+            if cached is not None:
+                logger.info(f"Serving cached answer for user {user_id}")
+                return cached
+            
             # Get relevant chunks
-            chunks = await self.get_relevant_chunks(query, user_id, limit)
+            chunks = await self.get_relevant_chunks(query, user_id, limit, query_embedding=query_embedding)
             
             if not chunks:
                 logger.warning(f"No relevant chunks found for query: {query}")
                 return {
-                    "answer": "I couldn't find any relevant information in your notes to answer this question.",
+                    "answer": NO_CONTEXT_ANSWER,
                     "source_documents": []
                 }
             
-            # Format context from chunks
-            context_parts = []
-            for i, chunk in enumerate(chunks, 1):
-                context_parts.append(f"[CHUNK {i}]\n{chunk['content']}")
-            context = "\n\n".join(context_parts)
-            
             # Get chat completion from Lilypad
-            system_prompt = """You are a helpful AI assistant that answers questions based on the user's notes. 
-Use ONLY the provided context to answer questions. If you cannot find relevant information in the context, say so.
-
-IMPORTANT INSTRUCTIONS:
-1. When you want to show your reasoning process, wrap it in <think>...</think> tags
-2. You may include your step-by-step analysis in the <think> tags to show how you arrived at your answer
-3. For complex questions, break down your thinking process inside <think> tags
-4. After your thinking section, provide a clear and direct answer without the tags
-5. Your response can have both a <think> section AND a regular answer
-6. NEVER mention 'chunks', 'CHUNK X', or any metadata related to document retrieval in your main answer (outside of think tags)
-7. If you're unsure, simply state that the information isn't available in the provided context"""
-            
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Context:\n{context}\n\nQuestion: {query}"}
-            ]
-            
+            messages = self._build_messages(query, chunks)
             answer = await self.lilypad_client.get_chat_completion(messages)
             
-            # Format source documents to include metadata properly
-            formatted_chunks = []
-            for chunk in chunks:
-                # Convert chunk_metadata to metadata for API response validation
-                chunk_metadata = chunk.get('chunk_metadata', {})
-                formatted_chunk = {
-                    "content": chunk['content'],
-                    "metadata": chunk_metadata if chunk_metadata else {"source": "database"}
-                }
-                formatted_chunks.append(formatted_chunk)
-            
-            return {
+            result = {
                 "answer": answer,
-                "source_documents": formatted_chunks
+                "source_documents": chunks.source_payload()
             }
+            answer_cache.store(user_id, query_embedding, result, index_version)
+            return result
             
         except Exception as e:
             logger.error(f"Error querying documents: {str(e)}")
             raise
     
-    async def delete_note(self, note_id: uuid.UUID) -> None:
+    async def stream_query_documents(self, query: str, user_id: uuid.UUID, limit: int = 5) -> AsyncIterator[Dict[str, Any]]:
+        """Query documents and stream the Lilypad answer as it is generated.
+        
+        Yields a "sources" event with the retrieved documents first, then one
+        "delta" event per generated text fragment, then a final "answer" event
+        carrying the full cleaned answer.
+        """
+        index_version = await answer_cache.index_version(self.db, user_id)
+        query_embedding = await embedding_batcher.embed(query)
+        
+        cached = answer_cache.lookup(user_id, query_embedding, index_version)
+        if cached is not None:
+            logger.info(f"Serving cached answer for user {user_id}")
+            yield {"event": "sources", "data": cached["source_documents"]}
+            yield {"event": "delta", "data": cached["answer"]}
+            yield {"event": "answer", "data": cached["answer"]}
+            return
+        
+        chunks = await self.get_relevant_chunks(query, user_id, limit, query_embedding=query_embedding)
+        
+        if not chunks:
+            logger.warning(f"No relevant chunks found for query: {query}")
+            yield {"event": "sources", "data": []}
+            yield {"event": "delta", "data": NO_CONTEXT_ANSWER}
+            yield {"event": "answer", "data": NO_CONTEXT_ANSWER}
+            return
+        
+        source_documents = chunks.source_payload()
+        yield {"event": "sources", "data": source_documents}
+        
+        parts = []
+        messages = self._build_messages(query, chunks)
+        async for delta in self.lilypad_client.stream_chat_completion(messages):
+            parts.append(delta)
+            yield {"event": "delta", "data": delta}
+        
+        answer = self.lilypad_client.clean_response("".join(parts))
+        answer_cache.store(
+            user_id,
+            query_embedding,
+            {"answer": answer, "source_documents": source_documents},
+            index_version
+        )
+        yield {"event": "answer", "data": answer}
+    
+    async def delete_note(self, note_id: uuid.UUID, user_id: Optional[uuid.UUID] = None) -> None:
         """Delete a note and its associated chunks from the retrieval system."""
         try:
             # Delete chunks from database
             await self.document_processor.delete_document_chunks(note_id)
             
             # Remove from vector store
-            await self.vector_store.delete_documents(note_id)
+            await self.vector_store.delete_documents(note_id, user_id=user_id, db=self.db)
+            
+            if user_id:
+                await run_vector_io(bm25_index.delete_document, user_id, note_id)
+                await answer_cache.bump_index_version(self.db, user_id)
             
             logger.info(f"Successfully deleted note {note_id}")
             
@@ -160,14 +273,26 @@ async def query_notes(user_id: uuid.UUID, query: str, db: Session = None) -> Dic
     rag_service = RAGService(db)
     return await rag_service.query_documents(query, user_id)
 
-async def delete_note_embeddings(note_id: uuid.UUID, db: Session = None) -> bool:
+def stream_query_notes(user_id: uuid.UUID, query: str, db: Session = None) -> AsyncIterator[Dict[str, Any]]:
+    """Query the user's notes and stream the generated answer."""
+    if not db:
+        raise ValueError("Database session is required")
+        
+    rag_service = RAGService(db)
+    return rag_service.stream_query_documents(query, user_id)
+
+async def delete_note_embeddings(note_id: uuid.UUID, db: Session = None, user_id: Optional[uuid.UUID] = None) -> bool:
     """Delete a note's embeddings from the vector store."""
     try:
         # Create vector store directly if no db session
         vector_store = VectorStore()
         
         # Remove from vector store
-        await vector_store.delete_documents(note_id)
+        await vector_store.delete_documents(note_id, user_id=user_id, db=db)
+        
+        if user_id:
+            await run_vector_io(bm25_index.delete_document, user_id, note_id)
+            await answer_cache.bump_index_version(db, user_id)
         
         logger.info(f"Successfully deleted embeddings for note {note_id}")
         return True
@@ -0,0 +1,218 @@
+import asyncio
+import time
+import uuid
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from langchain.schema import Document
+from app.core.config import settings
+from app.core.executors import run_vector_io
+from app.services.bm25_index import bm25_index, load_user_chunks
+from app.services.embeddings import embedding_batcher
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class RetrievedChunk:
+    """A retrieved chunk with its identifiers, score and metadata."""
+
+    id: str
+    document_id: str
+    content: str
+    chunk_type: str = "text"
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    score: Optional[float] = None
+
+    @classmethod
+    def from_dict(cls, chunk: Dict[str, Any]) -> "RetrievedChunk":
+        """Build from the chunk dicts returned by the vector store and BM25 index."""
+        score = chunk.get("rrf_score", chunk.get("score"))
+        return cls(
+            id=str(chunk["id"]),
+            document_id=str(chunk["document_id"]),
+            content=chunk["content"],
+            chunk_type=chunk.get("chunk_type") or "text",
+            metadata=dict(chunk.get("chunk_metadata") or {}),
+            score=float(score) if score is not None else None,
+        )
+
+    def header(self, index: int) -> str:
+        if self.chunk_type == "line" and "start_line" in self.metadata:
+            return f"[CHUNK {index} - LINES {self.metadata['start_line']}-{self.metadata['end_line']}]"
+        return f"[CHUNK {index} - TYPE: {self.chunk_type}]"
+
+@dataclass
+class RetrievedContext:
+    """The chunks retrieved for a query, kept structured until rendered.
+
+    Prompt text is only built by render(), and source attribution reads the
+    carried ids and metadata, so neither needs another search.
+    """
+
+    chunks: List[RetrievedChunk] = field(default_factory=list)
+    timings: Dict[str, float] = field(default_factory=dict)
+    _rendered: Dict[Tuple[str, bool], str] = field(default_factory=dict, init=False, repr=False)
+
+    @classmethod
+    def from_dicts(cls, chunks: List[Dict[str, Any]], timings: Optional[Dict[str, float]] = None) -> "RetrievedContext":
+        return cls(chunks=[RetrievedChunk.from_dict(chunk) for chunk in chunks], timings=timings or {})
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def __iter__(self) -> Iterator[RetrievedChunk]:
+        return iter(self.chunks)
+
+    @property
+    def chunk_ids(self) -> List[str]:
+        return [chunk.id for chunk in self.chunks]
+
+    def render(self, separator: str = "\n\n---\n\n", detailed_headers: bool = True) -> str:
+        """Format the chunks as prompt context, caching the result."""
+        key = (separator, detailed_headers)
+        if key not in self._rendered:
+            self._rendered[key] = separator.join(
+                f"{chunk.header(i) if detailed_headers else f'[CHUNK {i}]'}\n{chunk.content}"
+                for i, chunk in enumerate(self.chunks, 1)
+            )
+        return self._rendered[key]
+
+    def __str__(self) -> str:
+        return self.render()
+
+    def source_documents(self) -> List[Document]:
+        """The chunks as LangChain documents, with ids and scores in their metadata."""
+        return [
+            Document(
+                page_content=chunk.content,
+                metadata={
+                    **chunk.metadata,
+                    "chunk_id": chunk.id,
+                    "document_id": chunk.document_id,
+                    "chunk_type": chunk.chunk_type,
+                    **({"score": chunk.score} if chunk.score is not None else {}),
+                }
+            )
+            for chunk in self.chunks
+        ]
+
+    def source_payload(self) -> List[Dict[str, Any]]:
+        """The chunks in the API's source_documents format."""
+        return [
+            {"content": chunk.content, "metadata": chunk.metadata if chunk.metadata else {"source": "database"}}
+            for chunk in self.chunks
+        ]
+
+def reciprocal_rank_fusion(rankings: List[List[Dict[str, Any]]], k: int = 60, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Fuse ranked chunk lists with reciprocal rank fusion.
+
+    Each chunk scores sum(1 / (k + rank)) over the lists it appears in, so
+    chunks ranked well by several retrievers rise to the top. Chunks are
+    deduplicated by id; the first list a chunk appears in supplies its fields.
+    """
+    fused: Dict[str, Dict[str, Any]] = {}
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk in enumerate(ranking, 1):
+            chunk_id = str(chunk["id"])
+            if chunk_id not in fused:
+                fused[chunk_id] = chunk
+                scores[chunk_id] = 0.0
+            scores[chunk_id] += 1.0 / (k + rank)
+
+    ordered = sorted(fused, key=lambda chunk_id: scores[chunk_id], reverse=True)
+    if limit is not None:
+        ordered = ordered[:limit]
+    return [{**fused[chunk_id], "rrf_score": scores[chunk_id]} for chunk_id in ordered]
+
+async def ensure_sparse_index(db, user_id: uuid.UUID) -> None:
+    """Build the user's BM25 shard from their DocumentChunk rows on first use."""
+    if db is None or bm25_index.has_shard(user_id):
+        return
+    records = await load_user_chunks(db, user_id)
+    await run_vector_io(bm25_index.build, user_id, records)
+
+async def sparse_search(db, query: str, user_id: uuid.UUID, k: int = 5) -> List[Dict[str, Any]]:
+    """Search the user's chunks with BM25, building the shard if needed."""
+    await ensure_sparse_index(db, user_id)
+    return await run_vector_io(bm25_index.search, user_id, query, k) or []
+
+async def _timed(awaitable: Awaitable[Any]) -> Tuple[Any, float]:
+    start = time.perf_counter()
+    result = await awaitable
+    return result, (time.perf_counter() - start) * 1000
+
+class HybridRetriever:
+    """Dense + BM25 retrieval fused with reciprocal rank fusion.
+
+    The query is embedded once (or the caller's embedding is reused), both
+    retrievers run concurrently over the same user's chunks, and their
+    rankings are fused and deduplicated by chunk id. The dense stage
+    contributes a similarity ranking and an MMR ranking derived from a single
+    candidate fetch. If one retriever fails the other's ranking is still
+    returned.
+    """
+
+    def __init__(self, vector_store, db=None, rrf_k: Optional[int] = None, candidate_k: Optional[int] = None):
+        self.vector_store = vector_store
+        self.db = db
+        self.rrf_k = rrf_k or settings.HYBRID_RRF_K
+        self.candidate_k = candidate_k or settings.HYBRID_CANDIDATE_K
+        self.mmr_lambda = settings.HYBRID_MMR_LAMBDA
+
+    async def retrieve(
+        self,
+        query: str,
+        user_id: uuid.UUID,
+        k: int = 5,
+        query_embedding: Optional[np.ndarray] = None
+    ) -> RetrievedContext:
+        """Retrieve the top-k chunks for a query from one user's notes."""
+        if user_id is None:
+            raise ValueError("Hybrid retrieval requires a user_id")
+
+        start = time.perf_counter()
+        timings: Dict[str, float] = {}
+        candidate_k = max(k, self.candidate_k)
+
+        if query_embedding is None:
+            query_embedding, timings["embed"] = await _timed(embedding_batcher.embed(query))
+
+        (dense, sparse) = await asyncio.gather(
+            _timed(self.vector_store.dense_search(
+                query_embedding,
+                k=candidate_k,
+                user_id=user_id,
+                fetch_k=candidate_k * 2,
+                lambda_mult=self.mmr_lambda
+            )),
+            _timed(sparse_search(self.db, query, user_id, candidate_k)),
+            return_exceptions=True
+        )
+
+        rankings = []
+        for stage, outcome in (("dense", dense), ("sparse", sparse)):
+            if isinstance(outcome, BaseException):
+                logger.error(f"{stage} retrieval failed for user {user_id}: {str(outcome)}")
+                continue
+            ranking, timings[stage] = outcome
+            if stage == "dense":
+                # Similarity and MMR rankings both come from the one dense candidate fetch
+                rankings.extend(ranking)
+            else:
+                rankings.append(ranking)
+
+        if not rankings:
+            raise RuntimeError("All retrieval stages failed")
+
+        fusion_start = time.perf_counter()
+        chunks = reciprocal_rank_fusion(rankings, k=self.rrf_k, limit=k)
+        timings["fusion"] = (time.perf_counter() - fusion_start) * 1000
+        timings["total"] = (time.perf_counter() - start) * 1000
+
+        logger.info(
+            f"Hybrid retrieval for user {user_id}: {len(chunks)} chunks, "
+            + ", ".join(f"{stage}={ms:.1f}ms" for stage, ms in timings.items())
+        )
+        return RetrievedContext.from_dicts(chunks, timings=timings)
@@ -0,0 +1,111 @@
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from app.core.config import settings
+
+# Metadata keys returned as top-level chunk fields rather than inside chunk_metadata
+RESERVED_METADATA_KEYS = ("chunk_id", "document_id", "chunk_type", "user_id")
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Scale vectors (or a single vector) to unit length, leaving zero vectors as-is."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+def cosine_scores(query: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    """Cosine similarity of each row of vectors to the query."""
+    if not len(vectors):
+        return np.empty(0, dtype=np.float32)
+    return normalize_rows(np.asarray(vectors, dtype=np.float32)) @ normalize_rows(np.asarray(query, dtype=np.float32))
+
+def chunk_from_metadata(content: str, metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a stored document and its metadata to the chunk dict format."""
+    return {
+        "id": metadata.get("chunk_id"),
+        "document_id": metadata.get("document_id"),
+        "content": content,
+        "chunk_type": metadata.get("chunk_type", "text"),
+        "chunk_metadata": {k: v for k, v in metadata.items() if k not in RESERVED_METADATA_KEYS}
+    }
+
+def matches_filter(chunk: Dict[str, Any], filter: Optional[Dict[str, Any]]) -> bool:
+    """Whether a chunk dict satisfies an equality filter on its fields or metadata."""
+    if not filter:
+        return True
+    for key, value in filter.items():
+        actual = chunk[key] if key in ("id", "document_id", "chunk_type") else (chunk.get("chunk_metadata") or {}).get(key)
+        if str(actual) != str(value):
+            return False
+    return True
+
+class VectorBackend(ABC):
+    """Storage engine behind VectorStore.
+
+    Backends receive precomputed embeddings and keep every user's vectors
+    separate. Searches return chunk dicts (id, document_id, content,
+    chunk_type, chunk_metadata, and score, the cosine similarity to the
+    query) nearest first, plus a float32 matrix of their vectors when
+    requested. A filter restricts results to chunks whose field
+    or metadata values equal the given ones.
+    """
+
+    name: str = "base"
+    # Whether add/delete_document are durable on return; otherwise persist() makes them durable
+    durable_writes: bool = False
+
+    @abstractmethod
+    async def add(
+        self,
+        user_id: uuid.UUID,
+        ids: List[str],
+        embeddings: np.ndarray,
+        metadatas: List[Dict[str, Any]],
+        documents: List[str],
+        db=None
+    ) -> None:
+        """Upsert chunks with precomputed embeddings into the user's index."""
+
+    @abstractmethod
+    async def search(
+        self,
+        user_id: uuid.UUID,
+        query_embedding: np.ndarray,
+        k: int,
+        include_vectors: bool = True,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[np.ndarray]]:
+        """Return the user's k nearest chunks and, optionally, their vectors."""
+
+    @abstractmethod
+    async def get_vectors(self, user_id: uuid.UUID, ids: List[str]) -> Dict[str, np.ndarray]:
+        """Return the stored vectors of the given chunks; chunks without one are left out."""
+
+    @abstractmethod
+    async def delete_document(self, document_id: uuid.UUID, user_id: Optional[uuid.UUID] = None, db=None) -> None:
+        """Delete every chunk of a document; with db, database-backed stores delete in the caller's transaction."""
+
+    @abstractmethod
+    async def persist(self) -> None:
+        """Flush pending writes to durable storage."""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        """Return counters for monitoring."""
+
+def create_backend(name: Optional[str] = None) -> VectorBackend:
+    """Instantiate the vector backend named by VECTOR_STORE_BACKEND.
+
+    Optional engines are imported lazily so deployments only need the
+    packages of the backend they use.
+    """
+    name = name or settings.VECTOR_STORE_BACKEND
+    if name == "chroma":
+        from app.services.vector_backends.chroma_backend import ChromaBackend
+        return ChromaBackend()
+    if name == "pgvector":
+        from app.services.vector_backends.pgvector_backend import PgVectorBackend
+        return PgVectorBackend()
+    if name == "faiss":
+        from app.services.vector_backends.faiss_backend import FaissBackend
+        return FaissBackend()
+    raise ValueError(f"Unknown vector store backend: {name}")
@@ -0,0 +1,348 @@
+import os
+import uuid
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+import chromadb
+from langchain_community.vectorstores import Chroma
+from app.core.config import settings
+from app.core.executors import run_vector_io
+from app.services.embeddings import SharedModelEmbeddings
+from app.services.quantization import QuantizedMatrix, rescore, rescore_count
+from app.services.vector_backends.base import (
+    VectorBackend, chunk_from_metadata, cosine_scores, matches_filter, normalize_rows
+)
+
+logger = logging.getLogger(__name__)
+
+class _Partition:
+    """One user's Chroma collection and, for small partitions, an exact-search matrix."""
+
+    __slots__ = ("collection", "count", "exact", "checked_at")
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.count = collection.count()
+        self.checked_at = time.monotonic()
+        # (chunks, ids, QuantizedMatrix of normalized vectors), loaded on first exact search
+        self.exact = None
+
+    def refresh(self) -> None:
+        """Drop the exact-search matrix if another worker changed the collection's size.
+
+        This process's own writes call invalidate(), so the count is only
+        re-read every VECTOR_PARTITION_REFRESH_SECONDS.
+        """
+        now = time.monotonic()
+        if now - self.checked_at < settings.VECTOR_PARTITION_REFRESH_SECONDS:
+            return
+        self.checked_at = now
+        count = self.collection.count()
+        if count != self.count:
+            self.count = count
+            self.exact = None
+
+    def invalidate(self) -> None:
+        self.count = self.collection.count()
+        self.checked_at = time.monotonic()
+        self.exact = None
+
+class ChromaBackend(VectorBackend):
+    """Chroma vector backend with one collection per user.
+
+    Each user's chunks live in their own collection, created lazily with the
+    configured HNSW parameters, so a query only touches that user's index.
+    Partitions with at most VECTOR_EXACT_SEARCH_MAX_CHUNKS chunks are searched
+    exactly with NumPy instead of through HNSW, over a matrix held in the
+    VECTOR_STORAGE_MODE encoding; compact encodings rescore their top
+    candidates against the float32 vectors stored in Chroma. Chunks still in the legacy
+    shared collection are moved into the user's partition on first access.
+
+    Chroma calls are blocking, so every public method runs them on the vector
+    I/O executor.
+    """
+
+    name = "chroma"
+    # PersistentClient commits every add and delete to SQLite before returning
+    durable_writes = True
+    LEGACY_COLLECTION = "document_chunks"
+
+    def __init__(self, persist_directory: Optional[str] = None):
+        self.persist_directory = persist_directory or settings.VECTOR_STORE_DIR
+
+        # Ensure the persist directory exists
+        os.makedirs(self.persist_directory, exist_ok=True)
+
+        # Share one persistent client between the partitions and the LangChain wrapper
+        self.client = chromadb.PersistentClient(path=self.persist_directory)
+
+        # Shared collection from before per-user partitions; drained lazily
+        self.legacy_collection = self.client.get_or_create_collection(
+            name=self.LEGACY_COLLECTION,
+            embedding_function=None
+        )
+
+        # LangChain wrapper, backed by the process-wide embedding model
+        self.store = Chroma(
+            client=self.client,
+            embedding_function=SharedModelEmbeddings(),
+            collection_name=self.LEGACY_COLLECTION
+        )
+
+        self._partitions: "OrderedDict[str, _Partition]" = OrderedDict()
+        self._partitions_lock = threading.Lock()
+        # Per-user locks held while a partition is opened, so slow legacy migrations don't block other users
+        self._opening: Dict[str, threading.Lock] = {}
+        # Open partitions as of the last change, read by stats() without taking a lock
+        self._partitions_snapshot: Tuple[_Partition, ...] = ()
+
+        logger.info(f"Initialized Chroma vector store at {self.persist_directory}")
+
+    @staticmethod
+    def _collection_name(user_id: uuid.UUID) -> str:
+        return f"user_{uuid.UUID(str(user_id)).hex}"
+
+    def _partition(self, user_id: uuid.UUID) -> _Partition:
+        """Get the user's partition, creating its collection on first use. Blocking."""
+        if user_id is None:
+            raise ValueError("Vector store operations require a user_id")
+
+        key = str(user_id)
+        with self._partitions_lock:
+            partition = self._partitions.get(key)
+            if partition is not None:
+                self._partitions.move_to_end(key)
+                return partition
+            opening = self._opening.setdefault(key, threading.Lock())
+
+        with opening:
+            # Another thread may have opened it while we waited
+            with self._partitions_lock:
+                partition = self._partitions.get(key)
+            if partition is not None:
+                return partition
+
+            try:
+                collection = self.client.get_or_create_collection(
+                    name=self._collection_name(user_id),
+                    embedding_function=None,
+                    metadata={
+                        "hnsw:space": settings.VECTOR_HNSW_SPACE,
+                        "hnsw:M": settings.VECTOR_HNSW_M,
+                        "hnsw:construction_ef": settings.VECTOR_HNSW_CONSTRUCTION_EF,
+                        "hnsw:search_ef": settings.VECTOR_HNSW_SEARCH_EF,
+                    }
+                )
+                self._migrate_legacy(user_id, collection)
+                partition = _Partition(collection)
+            finally:
+                if partition is None:
+                    with self._partitions_lock:
+                        self._opening.pop(key, None)
+
+            with self._partitions_lock:
+                self._partitions[key] = partition
+                while len(self._partitions) > settings.VECTOR_MAX_OPEN_PARTITIONS:
+                    self._partitions.popitem(last=False)
+                self._partitions_snapshot = tuple(self._partitions.values())
+                self._opening.pop(key, None)
+            return partition
+
+    def _migrate_legacy(self, user_id: uuid.UUID, collection) -> None:
+        """Move the user's chunks from the legacy shared collection into their partition."""
+        where = {"user_id": {"$eq": str(user_id)}}
+        legacy = self.legacy_collection.get(where=where, include=["embeddings", "documents", "metadatas"])
+        if not legacy["ids"]:
+            return
+
+        collection.upsert(
+            ids=legacy["ids"],
+            embeddings=legacy["embeddings"],
+            metadatas=legacy["metadatas"],
+            documents=legacy["documents"]
+        )
+        self.legacy_collection.delete(ids=legacy["ids"])
+        logger.info(f"Migrated {len(legacy['ids'])} chunks for user {user_id} into their own partition")
+
+    @staticmethod
+    def _where(filter: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Translate an equality filter into a Chroma where clause."""
+        if not filter:
+            return None
+        key_map = {"id": "chunk_id"}
+        clauses = [
+            {key_map.get(key, key): {"$eq": value if isinstance(value, (str, int, float, bool)) else str(value)}}
+            for key, value in filter.items()
+        ]
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    def _upsert(self, user_id: uuid.UUID, **records) -> None:
+        partition = self._partition(user_id)
+        partition.collection.upsert(**records)
+        partition.invalidate()
+
+    async def add(
+        self,
+        user_id: uuid.UUID,
+        ids: List[str],
+        embeddings: np.ndarray,
+        metadatas: List[Dict[str, Any]],
+        documents: List[str],
+        db=None
+    ) -> None:
+        """Upsert precomputed embeddings into the user's collection."""
+        # Chroma only accepts scalar metadata values and list embeddings
+        embeddings = np.asarray(embeddings, dtype=np.float32).tolist()
+        metadatas = [
+            {k: v for k, v in metadata.items() if isinstance(v, (str, int, float, bool))}
+            for metadata in metadatas
+        ]
+        await run_vector_io(
+            self._upsert,
+            user_id,
+            ids=ids,
+            embeddings=embeddings,
+            metadatas=metadatas,
+            documents=documents
+        )
+
+    async def search(
+        self,
+        user_id: uuid.UUID,
+        query_embedding: np.ndarray,
+        k: int,
+        include_vectors: bool = True,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[np.ndarray]]:
+        """Return the user's k nearest chunks and, optionally, their vectors."""
+        return await run_vector_io(self._search_partition, user_id, query_embedding, k, include_vectors, filter)
+
+    def _search_partition(
+        self,
+        user_id: uuid.UUID,
+        query_embedding: np.ndarray,
+        fetch_k: int,
+        include_vectors: bool,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[np.ndarray]]:
+        partition = self._partition(user_id)
+        partition.refresh()
+        n_results = min(fetch_k, partition.count)
+        if n_results <= 0:
+            return [], (np.empty((0, 0), dtype=np.float32) if include_vectors else None)
+
+        if partition.count <= settings.VECTOR_EXACT_SEARCH_MAX_CHUNKS:
+            return self._exact_search(partition, query_embedding, n_results, include_vectors, filter)
+
+        # Embeddings are always fetched: scores are computed from them, whatever the index's distance space
+        include = ["documents", "metadatas", "embeddings"]
+
+        results = partition.collection.query(
+            query_embeddings=[np.asarray(query_embedding, dtype=np.float32).tolist()],
+            n_results=n_results,
+            where=self._where(filter),
+            include=include
+        )
+
+        documents = results["documents"][0] if results.get("documents") else []
+        metadatas = results["metadatas"][0] if results.get("metadatas") else []
+        embeddings = results.get("embeddings")
+        vectors = np.asarray(embeddings[0] if embeddings is not None and len(embeddings) else [], dtype=np.float32)
+        chunks = [
+            {**chunk_from_metadata(content, metadata or {}), "score": float(score)}
+            for content, metadata, score in zip(documents, metadatas, cosine_scores(query_embedding, vectors))
+        ]
+        return chunks, (vectors if include_vectors else None)
+
+    def _exact_search(
+        self,
+        partition: _Partition,
+        query_embedding: np.ndarray,
+        n_results: int,
+        include_vectors: bool,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[np.ndarray]]:
+        """Brute-force cosine search over a small partition held in memory."""
+        if partition.exact is None:
+            data = partition.collection.get(include=["embeddings", "documents", "metadatas"])
+            chunks = [chunk_from_metadata(content, metadata or {}) for content, metadata in zip(data["documents"], data["metadatas"])]
+            vectors = np.asarray(data["embeddings"], dtype=np.float32).reshape(len(chunks), -1)
+            partition.exact = (chunks, data["ids"], QuantizedMatrix(normalize_rows(vectors)))
+
+        chunks, ids, matrix = partition.exact
+        query = normalize_rows(np.asarray(query_embedding, dtype=np.float32))
+        mask = None
+        if filter:
+            mask = np.fromiter((matches_filter(chunk, filter) for chunk in chunks), dtype=bool, count=len(chunks))
+
+        if matrix.mode == "float32":
+            top = matrix.top(query, n_results, mask)
+            vectors = matrix.codes[top]
+            scores = cosine_scores(query, vectors)
+        else:
+            top = matrix.top(query, rescore_count(n_results), mask)
+            if not len(top):
+                return [], (np.empty((0, matrix.dimension), dtype=np.float32) if include_vectors else None)
+            # Fetch the float32 originals of the approximate candidates and re-rank exactly
+            candidate_ids = [ids[i] for i in top]
+            stored = partition.collection.get(ids=candidate_ids, include=["embeddings"])
+            by_id = dict(zip(stored["ids"], stored["embeddings"]))
+            vectors = np.asarray([by_id[chunk_id] for chunk_id in candidate_ids], dtype=np.float32).reshape(len(top), -1)
+            order, scores = rescore(query, vectors, n_results)
+            top, vectors = top[order], vectors[order]
+
+        return (
+            [{**chunks[i], "score": float(score)} for i, score in zip(top, scores)],
+            (vectors if include_vectors else None)
+        )
+
+    def _get_vectors(self, user_id: uuid.UUID, ids: List[str]) -> Dict[str, np.ndarray]:
+        stored = self._partition(user_id).collection.get(ids=ids, include=["embeddings"])
+        return {
+            chunk_id: np.asarray(embedding, dtype=np.float32)
+            for chunk_id, embedding in zip(stored["ids"], stored["embeddings"])
+        }
+
+    async def get_vectors(self, user_id: uuid.UUID, ids: List[str]) -> Dict[str, np.ndarray]:
+        """Return the stored vectors of the given chunks from the user's collection."""
+        if not ids:
+            return {}
+        return await run_vector_io(self._get_vectors, user_id, ids)
+
+    def _delete_document(self, document_id: uuid.UUID, user_id: Optional[uuid.UUID]) -> None:
+        where = {"document_id": {"$eq": str(document_id)}}
+        if user_id is not None:
+            partition = self._partition(user_id)
+            partition.collection.delete(where=where)
+            partition.invalidate()
+            return
+
+        # Owner unknown: remove the document from every partition
+        for collection in self.client.list_collections():
+            name = getattr(collection, "name", collection)
+            if name == self.LEGACY_COLLECTION or name.startswith("user_"):
+                self.client.get_collection(name).delete(where=where)
+        for partition in self._partitions_snapshot:
+            partition.invalidate()
+
+    async def delete_document(self, document_id: uuid.UUID, user_id: Optional[uuid.UUID] = None, db=None) -> None:
+        """Delete every chunk of a document; without user_id all partitions are searched."""
+        await run_vector_io(self._delete_document, document_id, user_id)
+
+    async def persist(self) -> None:
+        """PersistentClient writes every change to disk as it is made; nothing to flush."""
+
+    def stats(self) -> Dict[str, Any]:
+        """Return partition counters for monitoring."""
+        partitions = self._partitions_snapshot
+        exact = [partition.exact for partition in partitions]
+        return {
+            "backend": self.name,
+            "open_partitions": len(partitions),
+            "exact_partitions": sum(1 for matrix in exact if matrix is not None),
+            "exact_vector_bytes": sum(matrix[2].nbytes for matrix in exact if matrix is not None),
+            "storage": settings.VECTOR_STORAGE_MODE,
+        }
@@ -0,0 +1,588 @@
+import os
+import json
+import uuid
+import fcntl
+import shutil
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+import numpy as np
+import faiss
+from app.core.config import settings
+from app.core.executors import run_vector_io
+from app.services.quantization import rescore, rescore_count
+from app.services.vector_backends.base import VectorBackend, chunk_from_metadata, matches_filter, normalize_rows
+
+logger = logging.getLogger(__name__)
+
+def faiss_id(chunk_id: str) -> int:
+    """Stable non-negative int64 id for a chunk UUID."""
+    return uuid.UUID(str(chunk_id)).int & ((1 << 63) - 1)
+
+def _read_index(path: str):
+    """Read an index memory-mapped, falling back to a regular read for index types that can't be mapped."""
+    try:
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        return faiss.read_index(path)
+
+class _FaissPartition:
+    """A user's index with its row-aligned ids, vectors and chunks.
+
+    Partitions opened for search are memory-mapped snapshots and never
+    change. The partition a process writes to is read fully into memory and
+    modified in place while holding its lock, which searches take too: adds
+    append rows to over-allocated arrays and the index, deletes drop ids from
+    the index and leave tombstones (chunk None) until compact() runs before
+    the next snapshot write.
+    """
+
+    __slots__ = (
+        "version", "index", "kind", "ids", "vectors", "chunks", "row_of", "document_rows", "size", "dead",
+        "writable", "lock"
+    )
+
+    def __init__(
+        self,
+        version: Optional[int],
+        index,
+        kind: Optional[str],
+        ids: np.ndarray,
+        vectors: np.ndarray,
+        chunks: List[Optional[Dict[str, Any]]],
+        writable: bool = False
+    ):
+        # Snapshot version this state derives from (None before the first write)
+        self.version = version
+        self.index = index
+        self.kind = kind
+        self.ids = ids
+        self.vectors = vectors
+        self.chunks = chunks
+        self.size = len(chunks)
+        self.dead = 0
+        self.writable = writable
+        self.lock = threading.Lock()
+        self._index_rows()
+
+    def _index_rows(self) -> None:
+        self.row_of = {int(label): row for row, label in enumerate(self.ids[:self.size])}
+        self.document_rows: Dict[str, List[int]] = {}
+        if self.writable:
+            for row, chunk in enumerate(self.chunks):
+                self.document_rows.setdefault(chunk["document_id"], []).append(row)
+
+    @classmethod
+    def load(cls, path: str, version: int, mmap: bool = True) -> "_FaissPartition":
+        index_path = os.path.join(path, "index.faiss")
+        index = _read_index(index_path) if mmap else faiss.read_index(index_path)
+        mmap_mode = "r" if mmap else None
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return cls(
+            version,
+            index,
+            meta.get("kind", "flat:float32"),
+            np.load(os.path.join(path, "ids.npy"), mmap_mode=mmap_mode),
+            np.load(os.path.join(path, "vectors.npy"), mmap_mode=mmap_mode),
+            meta["chunks"],
+            writable=not mmap
+        )
+
+    def __len__(self) -> int:
+        return self.size - self.dead
+
+    def append(self, ids: np.ndarray, vectors: np.ndarray, chunks: List[Dict[str, Any]]) -> None:
+        """Add rows, growing the arrays geometrically so appends are amortized O(rows)."""
+        needed = self.size + len(ids)
+        if needed > len(self.ids):
+            capacity = max(needed, 2 * len(self.ids), 64)
+            grown_ids = np.empty(capacity, dtype=np.int64)
+            grown_vectors = np.empty((capacity, self.vectors.shape[1]), dtype=np.float32)
+            grown_ids[:self.size] = self.ids[:self.size]
+            grown_vectors[:self.size] = self.vectors[:self.size]
+            self.ids, self.vectors = grown_ids, grown_vectors
+        self.ids[self.size:needed] = ids
+        self.vectors[self.size:needed] = vectors
+        for offset, (label, chunk) in enumerate(zip(ids.tolist(), chunks)):
+            row = self.size + offset
+            self.row_of[label] = row
+            self.document_rows.setdefault(chunk["document_id"], []).append(row)
+        self.chunks.extend(chunks)
+        self.size = needed
+
+    def drop(self, rows: List[int]) -> None:
+        """Tombstone rows; the caller removes their ids from the index."""
+        for row in rows:
+            chunk = self.chunks[row]
+            if chunk is None:
+                continue
+            self.row_of.pop(int(self.ids[row]), None)
+            document_rows = self.document_rows.get(chunk["document_id"], [])
+            if row in document_rows:
+                document_rows.remove(row)
+                if not document_rows:
+                    del self.document_rows[chunk["document_id"]]
+            self.chunks[row] = None
+            self.dead += 1
+
+    def compact(self) -> bool:
+        """Drop tombstoned rows from the arrays. Returns True if any were dropped."""
+        if not self.dead:
+            return False
+        keep = np.array([chunk is not None for chunk in self.chunks], dtype=bool)
+        self.ids = self.ids[:self.size][keep]
+        self.vectors = self.vectors[:self.size][keep]
+        self.chunks = [chunk for chunk in self.chunks if chunk is not None]
+        self.size = len(self.chunks)
+        self.dead = 0
+        self._index_rows()
+        return True
+
+class _PendingWrites:
+    """A user's in-memory partition and the writes it holds that are not on disk yet."""
+
+    __slots__ = ("partition", "ops")
+
+    def __init__(self, partition: _FaissPartition):
+        self.partition = partition
+        self.ops: List[Tuple[Any, ...]] = []
+
+class FaissBackend(VectorBackend):
+    """In-process FAISS vector backend with one index per user.
+
+    Each user's directory holds versioned snapshots (index.faiss, vectors.npy,
+    ids.npy, meta.json) and a CURRENT file naming the live one, the same
+    layout as the BM25 shards. Indexes are IndexIDMap2 wrappers keyed by a
+    63-bit hash of the chunk id over a flat or HNSW inner-product index on
+    normalized vectors, so scores are cosine similarities.
+
+    With VECTOR_STORAGE_MODE float16/int8/pq the index holds scalar- or
+    product-quantized codes instead of float32 vectors; searches fetch extra
+    candidates and rescore them exactly against the memory-mapped
+    vectors.npy, which stays on disk outside the page cache's hot set.
+
+    Writes update an in-memory copy of the user's partition in place, at a
+    cost proportional to the rows written rather than the partition size.
+    This process searches that copy until persist() writes it as a new
+    snapshot under a per-user file lock, and keeps it as the base for its
+    next writes. If another process wrote a snapshot in the meantime, the
+    pending writes are replayed on top of it. Other partitions are
+    memory-mapped and reopened when another writer swaps CURRENT.
+    """
+
+    name = "faiss"
+
+    def __init__(self, root: Optional[str] = None, dimension: Optional[int] = None):
+        self.root = root or settings.FAISS_INDEX_DIR
+        self.dimension = dimension or settings.EMBEDDING_DIMENSION
+        self.index_type = settings.FAISS_INDEX_TYPE
+        os.makedirs(self.root, exist_ok=True)
+
+        self._partitions: "OrderedDict[str, _FaissPartition]" = OrderedDict()
+        self._pending: Dict[str, _PendingWrites] = {}
+        self._user_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+        logger.info(f"Initialized FAISS vector store ({self.index_type}) at {self.root}")
+
+    def _user_dir(self, user_id: uuid.UUID) -> str:
+        if user_id is None:
+            raise ValueError("Vector store operations require a user_id")
+        return os.path.join(self.root, str(user_id))
+
+    def _current_version(self, user_id: uuid.UUID) -> Optional[int]:
+        try:
+            with open(os.path.join(self._user_dir(user_id), "CURRENT"), "r") as f:
+                return int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _index_kind(self, count: int) -> str:
+        """Index structure and storage mode for a partition of count vectors."""
+        mode = settings.VECTOR_STORAGE_MODE
+        if mode == "pq" and (
+            count < settings.VECTOR_PQ_MIN_TRAINING_VECTORS
+            or self.dimension % settings.VECTOR_PQ_SUBQUANTIZERS
+        ):
+            # Too few vectors to train the codebooks; scalar quantization needs no real training
+            mode = "int8"
+        return f"{self.index_type}:{mode}"
+
+    def _new_index(self, kind: str):
+        index_type, mode = kind.split(":")
+        metric = faiss.METRIC_INNER_PRODUCT
+        qtypes = {"float16": faiss.ScalarQuantizer.QT_fp16, "int8": faiss.ScalarQuantizer.QT_8bit}
+        if index_type == "hnsw":
+            if mode == "float32":
+                index = faiss.IndexHNSWFlat(self.dimension, settings.FAISS_HNSW_M, metric)
+            elif mode == "pq":
+                # L2 on unit vectors ranks like inner product; results are rescored exactly
+                index = faiss.IndexHNSWPQ(self.dimension, settings.VECTOR_PQ_SUBQUANTIZERS, settings.FAISS_HNSW_M)
+            else:
+                index = faiss.IndexHNSWSQ(self.dimension, qtypes[mode], settings.FAISS_HNSW_M, metric)
+            index.hnsw.efConstruction = settings.FAISS_HNSW_EF_CONSTRUCTION
+        elif mode == "pq":
+            index = faiss.IndexPQ(self.dimension, settings.VECTOR_PQ_SUBQUANTIZERS, 8, metric)
+        elif mode in qtypes:
+            index = faiss.IndexScalarQuantizer(self.dimension, qtypes[mode], metric)
+        else:
+            index = faiss.IndexFlatIP(self.dimension)
+        return faiss.IndexIDMap2(index)
+
+    def _build_index(self, kind: str, ids: np.ndarray, vectors: np.ndarray):
+        """Create an index of the given kind, train it on the vectors and add them."""
+        index = self._new_index(kind)
+        if len(ids):
+            if not index.is_trained:
+                index.train(vectors)
+            index.add_with_ids(vectors, ids)
+        return index
+
+    def _get_partition(self, user_id: uuid.UUID) -> Optional[_FaissPartition]:
+        """Return the user's partition: pending in-memory state first, else the live snapshot."""
+        key = str(user_id)
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is not None:
+                return pending.partition
+
+        version = self._current_version(user_id)
+        if version is None:
+            return None
+
+        with self._lock:
+            partition = self._partitions.get(key)
+            if partition is not None and partition.version == version:
+                self._partitions.move_to_end(key)
+                return partition
+
+        partition = _FaissPartition.load(os.path.join(self._user_dir(user_id), f"v{version}"), version)
+        with self._lock:
+            self._partitions[key] = partition
+            self._partitions.move_to_end(key)
+            while len(self._partitions) > settings.VECTOR_MAX_OPEN_PARTITIONS:
+                self._partitions.popitem(last=False)
+        return partition
+
+    def _user_lock(self, user_id: uuid.UUID) -> threading.Lock:
+        with self._lock:
+            return self._user_locks.setdefault(str(user_id), threading.Lock())
+
+    @contextmanager
+    def _write_lock(self, user_id: uuid.UUID) -> Iterator[None]:
+        """Serialize snapshot writers for one user across threads and worker processes."""
+        user_dir = self._user_dir(user_id)
+        os.makedirs(user_dir, exist_ok=True)
+        with self._user_lock(user_id), open(os.path.join(user_dir, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_snapshot(self, user_id: uuid.UUID) -> _FaissPartition:
+        """Read the current snapshot fully into memory, or start an empty partition."""
+        version = self._current_version(user_id)
+        if version is None:
+            return _FaissPartition(
+                None, None, None, np.empty(0, dtype=np.int64), np.empty((0, self.dimension), dtype=np.float32), [],
+                writable=True
+            )
+        return _FaissPartition.load(os.path.join(self._user_dir(user_id), f"v{version}"), version, mmap=False)
+
+    def _writable_partition(self, user_id: uuid.UUID) -> _FaissPartition:
+        """The in-memory partition this process last wrote, if still current, else a fresh load."""
+        version = self._current_version(user_id)
+        with self._lock:
+            partition = self._partitions.get(str(user_id))
+        if partition is not None and partition.writable and partition.version == version:
+            return partition
+        return self._load_snapshot(user_id)
+
+    def _rebuild(self, partition: _FaissPartition, kind: str) -> None:
+        partition.compact()
+        partition.kind = kind
+        partition.index = self._build_index(kind, partition.ids[:partition.size], partition.vectors[:partition.size])
+
+    def _remove(self, partition: _FaissPartition, rows: List[int]) -> int:
+        """Remove rows from a writable partition in place. Returns the number removed."""
+        rows = [row for row in rows if partition.chunks[row] is not None]
+        if not rows:
+            return 0
+        if not partition.kind.startswith("hnsw:"):
+            partition.index.remove_ids(faiss.IDSelectorBatch(partition.ids[rows].astype(np.int64)))
+        # HNSW graphs don't support removal: the labels stay in the graph, searches skip them, and
+        # the graph is rebuilt from the live vectors at the next snapshot write
+        partition.drop(rows)
+        return len(rows)
+
+    def _upsert(
+        self,
+        partition: _FaissPartition,
+        new_ids: np.ndarray,
+        new_vectors: np.ndarray,
+        new_chunks: List[Dict[str, Any]]
+    ) -> int:
+        """Add rows to a writable partition in place, replacing any with the same ids. Returns the change in chunks."""
+        replaced = 0
+        if partition.index is not None:
+            replaced = self._remove(partition, [partition.row_of[label] for label in new_ids.tolist() if label in partition.row_of])
+
+        partition.append(new_ids, new_vectors, list(new_chunks))
+        kind = self._index_kind(len(partition))
+        if partition.index is None or partition.kind != kind:
+            # New partition, changed settings, or enough vectors to train PQ codebooks
+            self._rebuild(partition, kind)
+        else:
+            partition.index.add_with_ids(new_vectors, new_ids)
+        return len(new_ids) - replaced
+
+    def _apply(self, partition: _FaissPartition, op: Tuple[Any, ...]) -> int:
+        """Apply a write to a writable partition in place. Returns the change in chunks."""
+        with partition.lock:
+            if op[0] == "add":
+                return self._upsert(partition, *op[1:])
+            if partition.index is None:
+                return 0
+            return -self._remove(partition, list(partition.document_rows.get(op[1], ())))
+
+    def _record(self, user_id: uuid.UUID, op: Tuple[Any, ...]) -> int:
+        """Apply a write to the user's in-memory partition and queue it for persist().
+
+        Returns:
+            int: Change in the number of chunks
+        """
+        key = str(user_id)
+        with self._user_lock(user_id):
+            with self._lock:
+                pending = self._pending.get(key)
+            if pending is None:
+                pending = _PendingWrites(self._writable_partition(user_id))
+            change = self._apply(pending.partition, op)
+            if not change and op[0] != "add":
+                return 0
+
+            with self._lock:
+                self._pending.setdefault(key, pending).ops.append(op)
+            return change
+
+    def _write(self, user_id: uuid.UUID, partition: _FaissPartition) -> int:
+        """Write a partition as the next snapshot version and make it current. Caller holds the write lock."""
+        user_dir = self._user_dir(user_id)
+        version = (self._current_version(user_id) or 0) + 1
+        path = os.path.join(user_dir, f"v{version}")
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+
+        with partition.lock:
+            if partition.compact() and partition.kind.startswith("hnsw:"):
+                self._rebuild(partition, partition.kind)
+            index = partition.index if partition.index is not None else self._new_index(self._index_kind(0))
+            faiss.write_index(index, os.path.join(path, "index.faiss"))
+            np.save(os.path.join(path, "ids.npy"), partition.ids[:partition.size].astype(np.int64))
+            np.save(os.path.join(path, "vectors.npy"), partition.vectors[:partition.size].astype(np.float32))
+            with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({"kind": partition.kind or self._index_kind(0), "chunks": partition.chunks}, f, default=str)
+
+        current_tmp = os.path.join(user_dir, f"CURRENT.{os.getpid()}.tmp")
+        with open(current_tmp, "w") as f:
+            f.write(str(version))
+        os.replace(current_tmp, os.path.join(user_dir, "CURRENT"))
+
+        # Keep the previous version for readers that resolved CURRENT just before the switch
+        for name in os.listdir(user_dir):
+            if name.startswith("v") and name[1:].isdigit() and int(name[1:]) < version - 1:
+                shutil.rmtree(os.path.join(user_dir, name), ignore_errors=True)
+        return version
+
+    def _flush_user(self, key: str) -> None:
+        with self._write_lock(key):
+            with self._lock:
+                pending = self._pending.get(key)
+            if pending is None:
+                return
+
+            partition = pending.partition
+            if partition.version != self._current_version(key):
+                # Another process wrote a snapshot since this state was loaded; replay on top of it
+                partition = self._load_snapshot(key)
+                for op in pending.ops:
+                    self._apply(partition, op)
+
+            partition.version = self._write(key, partition)
+            with self._lock:
+                self._pending.pop(key, None)
+                # Keep the written state in memory: it serves searches and is the base for the next write
+                self._partitions[key] = partition
+                self._partitions.move_to_end(key)
+                while len(self._partitions) > settings.VECTOR_MAX_OPEN_PARTITIONS:
+                    self._partitions.popitem(last=False)
+
+    def _flush(self) -> None:
+        with self._lock:
+            keys = list(self._pending)
+        for key in keys:
+            self._flush_user(key)
+        if keys:
+            logger.info(f"Persisted FAISS indexes for {len(keys)} users")
+
+    def _add(
+        self,
+        user_id: uuid.UUID,
+        ids: List[str],
+        embeddings: np.ndarray,
+        metadatas: List[Dict[str, Any]],
+        documents: List[str]
+    ) -> None:
+        new_ids = np.array([faiss_id(chunk_id) for chunk_id in ids], dtype=np.int64)
+        new_vectors = normalize_rows(np.asarray(embeddings, dtype=np.float32).reshape(len(ids), self.dimension))
+        new_chunks = [chunk_from_metadata(content, metadata) for content, metadata in zip(documents, metadatas)]
+        self._record(user_id, ("add", new_ids, new_vectors, new_chunks))
+
+    async def add(
+        self,
+        user_id: uuid.UUID,
+        ids: List[str],
+        embeddings: np.ndarray,
+        metadatas: List[Dict[str, Any]],
+        documents: List[str],
+        db=None
+    ) -> None:
+        """Upsert precomputed embeddings into the user's in-memory index; persist() writes them."""
+        await run_vector_io(self._add, user_id, ids, embeddings, metadatas, documents)
+
+    def _search(
+        self,
+        user_id: uuid.UUID,
+        query_embedding: np.ndarray,
+        k: int,
+        include_vectors: bool,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[np.ndarray]]:
+        empty = ([], np.empty((0, self.dimension), dtype=np.float32) if include_vectors else None)
+        partition = self._get_partition(user_id)
+        if partition is None:
+            return empty
+        with partition.lock:
+            return self._search_partition(partition, query_embedding, k, include_vectors, filter, empty)
+
+    def _search_partition(
+        self,
+        partition: _FaissPartition,
+        query_embedding: np.ndarray,
+        k: int,
+        include_vectors: bool,
+        filter: Optional[Dict[str, Any]],
+        empty: Tuple[List[Dict[str, Any]], Optional[np.ndarray]]
+    ) -> Tuple[List[Dict[str, Any]], Optional[np.ndarray]]:
+        if not len(partition):
+            return empty
+        index_type, mode = partition.kind.split(":")
+        fetch_k = rescore_count(k) if mode != "float32" else k
+        if index_type == "hnsw":
+            params = faiss.SearchParametersHNSW()
+            params.efSearch = max(settings.FAISS_HNSW_EF_SEARCH, fetch_k + partition.dead)
+        else:
+            params = faiss.SearchParameters()
+
+        selector = None
+        n_results = min(fetch_k, len(partition))
+        if filter:
+            allowed = np.array(
+                [
+                    int(partition.ids[row]) for row, chunk in enumerate(partition.chunks)
+                    if chunk is not None and matches_filter(chunk, filter)
+                ],
+                dtype=np.int64
+            )
+            if not len(allowed):
+                return empty
+            # The selector must outlive the search call
+            selector = faiss.IDSelectorBatch(allowed)
+            params.sel = selector
+            n_results = min(n_results, len(allowed))
+
+        query = normalize_rows(np.asarray(query_embedding, dtype=np.float32)).reshape(1, -1)
+        # Tombstoned HNSW labels may take result slots, so ask for that many more
+        scores, labels = partition.index.search(query, min(n_results + partition.dead, partition.index.ntotal), params=params)
+
+        rows, row_scores, seen = [], [], set()
+        for score, label in zip(scores[0], labels[0]):
+            row = partition.row_of.get(int(label))
+            if label < 0 or row is None or row in seen:
+                continue
+            seen.add(row)
+            rows.append(row)
+            row_scores.append(float(score))
+        rows, row_scores = rows[:n_results], row_scores[:n_results]
+
+        rows = np.asarray(rows, dtype=np.int64)
+        vectors = np.asarray(partition.vectors[rows], dtype=np.float32)
+        if mode != "float32":
+            # Codes only approximate the vectors; re-rank the candidates against the float32 originals
+            order, exact_scores = rescore(query[0], vectors, k)
+            rows, vectors, row_scores = rows[order], vectors[order], exact_scores.tolist()
+
+        chunks = [{**partition.chunks[row], "score": score} for row, score in zip(rows.tolist(), row_scores)]
+        return chunks, (vectors if include_vectors else None)
+
+    async def search(
+        self,
+        user_id: uuid.UUID,
+        query_embedding: np.ndarray,
+        k: int,
+        include_vectors: bool = True,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[np.ndarray]]:
+        """Return the user's k nearest chunks and, optionally, their vectors."""
+        return await run_vector_io(self._search, user_id, query_embedding, k, include_vectors, filter)
+
+    def _get_vectors(self, user_id: uuid.UUID, ids: List[str]) -> Dict[str, np.ndarray]:
+        partition = self._get_partition(user_id)
+        if partition is None:
+            return {}
+        vectors = {}
+        with partition.lock:
+            for chunk_id in ids:
+                row = partition.row_of.get(faiss_id(chunk_id))
+                if row is not None:
+                    vectors[chunk_id] = np.array(partition.vectors[row], dtype=np.float32)
+        return vectors
+
+    async def get_vectors(self, user_id: uuid.UUID, ids: List[str]) -> Dict[str, np.ndarray]:
+        """Return the stored (normalized) vectors of the given chunks."""
+        if not ids:
+            return {}
+        return await run_vector_io(self._get_vectors, user_id, ids)
+
+    def _delete_document(self, document_id: uuid.UUID, user_id: uuid.UUID) -> None:
+        self._record(user_id, ("delete", str(document_id)))
+
+    async def delete_document(self, document_id: uuid.UUID, user_id: Optional[uuid.UUID] = None, db=None) -> None:
+        """Delete every chunk of a document from its owner's index.
+
+        Raises:
+            ValueError: If user_id is missing; scanning every user's index for
+                one document would cost as much as the whole corpus
+        """
+        if user_id is None:
+            raise ValueError("The FAISS backend requires user_id to delete a document")
+        await run_vector_io(self._delete_document, document_id, user_id)
+
+    async def persist(self) -> None:
+        """Write every partition with pending writes as a new snapshot."""
+        await run_vector_io(self._flush)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return partition counters for monitoring."""
+        with self._lock:
+            return {
+                "backend": self.name,
+                "index": self.index_type,
+                "storage": settings.VECTOR_STORAGE_MODE,
+                "open_partitions": len(self._partitions),
+                "pending_partitions": len(self._pending),
+            }
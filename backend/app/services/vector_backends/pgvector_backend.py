@@ -0,0 +1,249 @@
+import asyncio
+import uuid
+import logging
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+from sqlalchemy import text
+from pgvector.asyncpg import register_vector
+from app.core.config import settings
+from app.core.db import async_session, engine
+from app.services.vector_backends.base import RESERVED_METADATA_KEYS, VectorBackend
+
+logger = logging.getLogger(__name__)
+
+# One query: nearest embeddings joined to their chunks, restricted to the owner's notes
+_SEARCH_SQL = """
+SELECT c.id, c.document_id, c.content, c.chunk_type, c.chunk_metadata,
+       1 - (e.embedding <=> CAST(:query AS vector)) AS score{vector_column}
+FROM document_embeddings e
+JOIN document_chunks c ON c.id = e.chunk_id
+JOIN notes n ON n.id = c.document_id
+WHERE n.user_id = :user_id{filter_clause}
+ORDER BY e.embedding <=> CAST(:query AS vector)
+LIMIT :k
+"""
+
+class PgVectorBackend(VectorBackend):
+    """Postgres vector backend storing embeddings in document_embeddings.
+
+    Embeddings sit next to their DocumentChunk rows, so every backend replica
+    shares one index. Writes go through the caller's session with COPY, which
+    lets them reference chunks inserted in the same transaction. Searches are a
+    single SQL query over chunks, notes and the owner filter, using an ivfflat
+    or HNSW cosine index whose probes / ef_search are set per query.
+
+    The table and index are created if missing, matching the Alembic
+    migrations for deployments that never ran them.
+    """
+
+    name = "pgvector"
+    durable_writes = True
+
+    def __init__(self, dimension: Optional[int] = None):
+        self.dimension = dimension or settings.EMBEDDING_DIMENSION
+        self.index_type = settings.PGVECTOR_INDEX
+        self._schema_ready = False
+        self._schema_lock = asyncio.Lock()
+
+    def _schema_statements(self) -> List[str]:
+        statements = [
+            "CREATE EXTENSION IF NOT EXISTS vector",
+            f"""CREATE TABLE IF NOT EXISTS document_embeddings (
+                id UUID PRIMARY KEY,
+                chunk_id UUID NOT NULL REFERENCES document_chunks(id) ON DELETE CASCADE,
+                embedding vector({self.dimension}) NOT NULL,
+                created_at TIMESTAMPTZ DEFAULT now(),
+                updated_at TIMESTAMPTZ
+            )""",
+            "CREATE INDEX IF NOT EXISTS idx_document_embeddings_chunk_id ON document_embeddings (chunk_id)",
+        ]
+        if self.index_type == "hnsw":
+            statements.append(
+                "CREATE INDEX IF NOT EXISTS document_embeddings_vector_hnsw_idx ON document_embeddings "
+                f"USING hnsw (embedding vector_cosine_ops) "
+                f"WITH (m = {int(settings.PGVECTOR_HNSW_M)}, ef_construction = {int(settings.PGVECTOR_HNSW_EF_CONSTRUCTION)})"
+            )
+        else:
+            statements.append(
+                "CREATE INDEX IF NOT EXISTS document_embeddings_vector_idx ON document_embeddings "
+                f"USING ivfflat (embedding vector_cosine_ops) WITH (lists = {int(settings.PGVECTOR_IVFFLAT_LISTS)})"
+            )
+        return statements
+
+    async def _ensure_schema(self) -> None:
+        if self._schema_ready:
+            return
+        async with self._schema_lock:
+            if self._schema_ready:
+                return
+            async with engine.begin() as conn:
+                for statement in self._schema_statements():
+                    await conn.execute(text(statement))
+            self._schema_ready = True
+            logger.info(f"pgvector schema ready ({self.index_type} index, {self.dimension} dimensions)")
+
+    @staticmethod
+    def _vector_literal(vector: List[float]) -> str:
+        return "[" + ",".join(repr(float(x)) for x in vector) + "]"
+
+    async def _copy_embeddings(self, session, chunk_ids: List[str], embeddings: np.ndarray) -> None:
+        """COPY embeddings into document_embeddings on the session's connection."""
+        connection = await session.connection()
+        raw_connection = await connection.get_raw_connection()
+        driver_connection = raw_connection.driver_connection
+        await register_vector(driver_connection)
+
+        chunk_uuids = [uuid.UUID(str(chunk_id)) for chunk_id in chunk_ids]
+        # COPY can't upsert, so drop any earlier vectors for these chunks first
+        await session.execute(
+            text("DELETE FROM document_embeddings WHERE chunk_id = ANY(:chunk_ids)"),
+            {"chunk_ids": chunk_uuids}
+        )
+        await driver_connection.copy_records_to_table(
+            "document_embeddings",
+            records=[
+                (uuid.uuid4(), chunk_id, np.asarray(embedding, dtype=np.float32))
+                for chunk_id, embedding in zip(chunk_uuids, embeddings)
+            ],
+            columns=["id", "chunk_id", "embedding"]
+        )
+
+    async def add(
+        self,
+        user_id: uuid.UUID,
+        ids: List[str],
+        embeddings: np.ndarray,
+        metadatas: List[Dict[str, Any]],
+        documents: List[str],
+        db=None
+    ) -> None:
+        """Bulk-insert embeddings for existing chunks.
+
+        Chunk content and metadata already live in document_chunks, so only
+        the vectors are written. With db, rows join the caller's transaction.
+        """
+        await self._ensure_schema()
+        if db is not None:
+            await self._copy_embeddings(db, ids, embeddings)
+            return
+
+        async with async_session() as session:
+            await self._copy_embeddings(session, ids, embeddings)
+            await session.commit()
+
+    async def search(
+        self,
+        user_id: uuid.UUID,
+        query_embedding: np.ndarray,
+        k: int,
+        include_vectors: bool = True,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[np.ndarray]]:
+        """Return the user's k nearest chunks and, optionally, their vectors."""
+        if user_id is None:
+            raise ValueError("Vector store operations require a user_id")
+        await self._ensure_schema()
+
+        params = {"user_id": uuid.UUID(str(user_id)), "query": self._vector_literal(query_embedding), "k": k}
+        conditions = []
+        for i, (key, value) in enumerate((filter or {}).items()):
+            if key in ("id", "document_id"):
+                conditions.append(f"c.{key} = :filter_{i}")
+                params[f"filter_{i}"] = uuid.UUID(str(value))
+            elif key == "chunk_type":
+                conditions.append(f"c.chunk_type = :filter_{i}")
+                params[f"filter_{i}"] = str(value)
+            else:
+                conditions.append(f"c.chunk_metadata ->> :filter_key_{i} = :filter_{i}")
+                params[f"filter_key_{i}"] = key
+                params[f"filter_{i}"] = str(value)
+
+        sql = _SEARCH_SQL.format(
+            vector_column=", e.embedding::text AS embedding" if include_vectors else "",
+            filter_clause="".join(f" AND {condition}" for condition in conditions)
+        )
+        async with async_session() as session:
+            # Index search breadth applies to this transaction only
+            if self.index_type == "hnsw":
+                await session.execute(text(f"SET LOCAL hnsw.ef_search = {int(settings.PGVECTOR_HNSW_EF_SEARCH)}"))
+            else:
+                await session.execute(text(f"SET LOCAL ivfflat.probes = {int(settings.PGVECTOR_IVFFLAT_PROBES)}"))
+
+            result = await session.execute(text(sql), params)
+            rows = result.mappings().all()
+
+        chunks = [
+            {
+                "id": str(row["id"]),
+                "document_id": str(row["document_id"]),
+                "content": row["content"],
+                "chunk_type": row["chunk_type"] or "text",
+                "chunk_metadata": {k: v for k, v in (row["chunk_metadata"] or {}).items() if k not in RESERVED_METADATA_KEYS},
+                "score": float(row["score"])
+            }
+            for row in rows
+        ]
+
+        vectors = None
+        if include_vectors:
+            vectors = np.array(
+                [np.fromstring(row["embedding"].strip("[]"), sep=",", dtype=np.float32) for row in rows],
+                dtype=np.float32
+            ).reshape(len(rows), -1)
+        return chunks, vectors
+
+    async def get_vectors(self, user_id: uuid.UUID, ids: List[str]) -> Dict[str, np.ndarray]:
+        """Return the stored vectors of the given chunks, restricted to the owner's notes."""
+        if not ids:
+            return {}
+        await self._ensure_schema()
+        async with async_session() as session:
+            result = await session.execute(
+                text(
+                    "SELECT e.chunk_id, e.embedding::text AS embedding FROM document_embeddings e "
+                    "JOIN document_chunks c ON c.id = e.chunk_id "
+                    "JOIN notes n ON n.id = c.document_id "
+                    "WHERE n.user_id = :user_id AND e.chunk_id = ANY(:chunk_ids)"
+                ),
+                {"user_id": uuid.UUID(str(user_id)), "chunk_ids": [uuid.UUID(str(chunk_id)) for chunk_id in ids]}
+            )
+            rows = result.mappings().all()
+        return {
+            str(row["chunk_id"]): np.fromstring(row["embedding"].strip("[]"), sep=",", dtype=np.float32)
+            for row in rows
+        }
+
+    async def _delete_embeddings(self, session, document_id: uuid.UUID) -> None:
+        await session.execute(
+            text(
+                "DELETE FROM document_embeddings e USING document_chunks c "
+                "WHERE e.chunk_id = c.id AND c.document_id = :document_id"
+            ),
+            {"document_id": uuid.UUID(str(document_id))}
+        )
+
+    async def delete_document(self, document_id: uuid.UUID, user_id: Optional[uuid.UUID] = None, db=None) -> None:
+        """Delete the embeddings of every chunk of a document.
+
+        With db, the delete joins the caller's transaction, so it commits or
+        rolls back together with the chunk rows (whose deletion cascades to
+        their embeddings anyway).
+        """
+        await self._ensure_schema()
+        if db is not None:
+            await self._delete_embeddings(db, document_id)
+            return
+
+        async with async_session() as session:
+            await self._delete_embeddings(session, document_id)
+            await session.commit()
+
+    async def persist(self) -> None:
+        """Postgres commits are durable; nothing to flush."""
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "index": self.index_type,
+            "schema_ready": self._schema_ready,
+        }
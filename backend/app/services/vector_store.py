@@ -1,16 +1,65 @@
-import os
 import uuid
+import asyncio
 import logging
-from typing import List, Dict, Any, Optional
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
+import numpy as np
 from langchain.schema import Document
-from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
 from app.core.config import settings
+from app.core.executors import run_vector_io, run_vector_io_unbounded
 from app.core.logging import logger
-from app.services.embeddings import get_embeddings
+from app.services.embeddings import embedding_batcher
+from app.services.retrieval import HybridRetriever, RetrievedContext
+from app.services.vector_backends.base import create_backend, normalize_rows
+from app.services.vector_wal import WriteAheadLog, decode_vectors, encode_vectors
+
+def maximal_marginal_relevance(
+    query_vector: np.ndarray,
+    candidate_vectors: np.ndarray,
+    k: int = 5,
+    lambda_mult: float = 0.5
+) -> List[int]:
+    """Select k diverse candidates by maximal marginal relevance.
+    
+    Relevance and pairwise redundancy are cosine similarities computed as
+    matrix products over the normalized vectors.
+    
+    Returns:
+        Indices into candidate_vectors, in selection order
+    """
+    if len(candidate_vectors) == 0 or k <= 0:
+        return []
+    
+    candidates = normalize_rows(candidate_vectors)
+    relevance = candidates @ normalize_rows(query_vector)
+    pairwise = candidates @ candidates.T
+    
+    selected = [int(np.argmax(relevance))]
+    # Highest similarity of each candidate to anything already selected
+    redundancy = pairwise[selected[0]].copy()
+    while len(selected) < min(k, len(candidates)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        np.maximum(redundancy, pairwise[best], out=redundancy)
+    return selected
 
 class VectorStore:
-    """Handles document embeddings and vector store operations using singleton pattern with Chroma"""
+    """Handles document embeddings and vector store operations using singleton pattern
+    
+    Chunks are embedded here and handed to the storage backend selected by
+    VECTOR_STORE_BACKEND: "chroma" (per-user local collections),
+    "pgvector" (the document_embeddings table in Postgres) or "faiss"
+    (per-user in-process FAISS indexes).
+    
+    Backends without durable writes run write-behind once start() has been
+    called: each write is appended to a write-ahead log, applied to the
+    backend, and persisted by a background task every
+    VECTOR_FLUSH_INTERVAL_SECONDS or after VECTOR_FLUSH_MAX_PENDING chunks,
+    so requests never wait for a flush. Writes still in the log when a
+    process dies are replayed by the next start().
+    """
     
     _instance = None
     
@@ -21,225 +70,400 @@ class VectorStore:
         return cls._instance
     
     def __init__(self, db=None):
-        """Initialize Chroma vector store if not already initialized.
+        """Initialize the vector backend if not already initialized.
         
         Args:
             db: SQLAlchemy session (kept for API compatibility, not used)
         """
         if not self._initialized:
             self._initialize_store()
+            self.wal: Optional[WriteAheadLog] = None
+            if not self.backend.durable_writes:
+                self.wal = WriteAheadLog(settings.VECTOR_WAL_DIR, fsync=settings.VECTOR_WAL_FSYNC)
+            self._flusher: Optional[asyncio.Task] = None
+            self._flush_requested: Optional[asyncio.Event] = None
+            self._flush_lock: Optional[asyncio.Lock] = None
+            self._writes_idle: Optional[asyncio.Condition] = None
+            self._writes_in_flight = 0
+            self._pending_writes = 0
             self._initialized = True
     
     def _initialize_store(self):
-        """Initialize the Chroma vector store with persistence"""
+        """Create the configured vector backend"""
         try:
-            # Ensure the persist directory exists
-            os.makedirs(settings.VECTOR_STORE_DIR, exist_ok=True)
+            self.backend = create_backend(settings.VECTOR_STORE_BACKEND)
             
-            # Create the embedding function using sentence transformers
-            embedding_function = HuggingFaceEmbeddings(
-                model_name=settings.DEFAULT_EMBEDDING_MODEL
-            )
+            logger.info(f"Using {self.backend.name} vector backend")
             
-            # Initialize Chroma with persistence
-            self.store = Chroma(
-                persist_directory=settings.VECTOR_STORE_DIR,
-                embedding_function=embedding_function,
-                collection_name="document_chunks"
+        except Exception as e:
+            logger.error(f"Error initializing vector store: {str(e)}")
+            raise
+    
+    @property
+    def write_behind(self) -> bool:
+        return self._flusher is not None
+    
+    async def start(self) -> None:
+        """Replay writes left in the write-ahead log and start the background flusher."""
+        if self.wal is None or self._flusher is not None:
+            return
+        
+        records, paths = await run_vector_io(self.wal.recover)
+        if records:
+            for record in records:
+                if record["op"] == "add":
+                    record["embeddings"] = decode_vectors(record["embeddings"])
+                await self._apply(record)
+            await self.backend.persist()
+            logger.info(f"Replayed {len(records)} vector store writes from the write-ahead log")
+        await run_vector_io(self.wal.discard, paths)
+        await run_vector_io(self.wal.open)
+        
+        self._flush_requested = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._writes_idle = asyncio.Condition()
+        self._flusher = asyncio.get_running_loop().create_task(self._run_flusher())
+    
+    async def _apply(self, record: Dict[str, Any], db=None) -> None:
+        """Apply one logged write to the backend."""
+        if record["op"] == "add":
+            await self.backend.add(
+                uuid.UUID(record["user_id"]),
+                ids=record["ids"],
+                embeddings=record["embeddings"],
+                metadatas=record["metadatas"],
+                documents=record["documents"],
+                db=db
             )
+        else:
+            user_id = record.get("user_id")
+            await self.backend.delete_document(
+                uuid.UUID(record["document_id"]),
+                user_id=uuid.UUID(user_id) if user_id else None,
+                db=db
+            )
+    
+    @asynccontextmanager
+    async def _tracked_write(self) -> AsyncIterator[None]:
+        """Mark a logged write as in flight so a flush never splits its log append from its apply."""
+        async with self._writes_idle:
+            self._writes_in_flight += 1
+        try:
+            yield
+        finally:
+            async with self._writes_idle:
+                self._writes_in_flight -= 1
+                self._writes_idle.notify_all()
+    
+    async def _write(self, record: Dict[str, Any], count: int, db=None) -> None:
+        """Apply a write, logging it for a later flush or persisting it right away."""
+        if not self.write_behind:
+            await self._apply(record, db=db)
+            if not self.backend.durable_writes:
+                # No flusher running (e.g. outside the app lifespan): persist synchronously
+                await self.backend.persist()
+            return
+        
+        logged = record
+        if record["op"] == "add":
+            logged = {**record, "embeddings": encode_vectors(record["embeddings"])}
+        async with self._tracked_write():
+            record_id = await run_vector_io(self.wal.append, logged)
+            try:
+                await self._apply(record, db=db)
+            except Exception:
+                # The caller sees this write fail, so it must not be replayed on the next start
+                try:
+                    await run_vector_io_unbounded(self.wal.abort, record_id)
+                except Exception as e:
+                    logger.error(f"Could not mark failed vector store write in the log: {str(e)}")
+                raise
+        
+        self._pending_writes += count
+        if self._pending_writes >= settings.VECTOR_FLUSH_MAX_PENDING:
+            self._flush_requested.set()
+    
+    async def _run_flusher(self) -> None:
+        """Background loop persisting pending writes on a timer or when enough accumulate."""
+        backoff = 0.0
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=settings.VECTOR_FLUSH_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            if not self._pending_writes:
+                continue
+            try:
+                await self.flush()
+                backoff = 0.0
+            except Exception as e:
+                # Keep the loop alive; writes stay in the log until a flush succeeds
+                backoff = min(max(backoff * 2, 1.0), settings.VECTOR_FLUSH_INTERVAL_SECONDS)
+                logger.error(f"Vector store flush failed, retrying in {backoff:.0f}s: {str(e)}")
+                await asyncio.sleep(backoff)
+    
+    async def flush(self) -> None:
+        """Persist every write applied so far and drop the log segments they were in.
+
+        Raises the backend's error if persisting fails; the writes stay pending.
+        """
+        if not self.write_behind:
+            return
+        
+        async with self._flush_lock:
+            async with self._writes_idle:
+                # Writes logged before the rotation must be applied before the backend persists
+                await self._writes_idle.wait_for(lambda: self._writes_in_flight == 0)
+                # Log bookkeeping bypasses backpressure so a busy pool can't stall flushing
+                segment = await run_vector_io_unbounded(self.wal.rotate)
+                pending, self._pending_writes = self._pending_writes, 0
             
-            logger.info(f"Initialized Chroma vector store at {settings.VECTOR_STORE_DIR}")
+            try:
+                await self.backend.persist()
+            except Exception:
+                # Writes stay pending and in the log; the caller decides when to retry
+                self._pending_writes += pending
+                raise
             
-        except Exception as e:
-            logger.error(f"Error initializing Chroma vector store: {str(e)}")
-            raise
+            await run_vector_io_unbounded(self.wal.release, segment)
+            logger.debug(f"Persisted {pending} pending vector store writes")
     
-    async def add_documents(self, chunks: List[Any]) -> None:
+    async def add_documents(
+        self,
+        chunks: List[Any],
+        user_id: uuid.UUID = None,
+        db=None,
+        indexed_chunks: Optional[Dict[str, uuid.UUID]] = None
+    ) -> None:
         """Add document chunks to the vector store.
         
+        Each chunk is embedded exactly once and the vectors are written
+        straight to the backend. Chunks whose content is already indexed
+        under another chunk reuse that chunk's stored vector instead.
+        
         Args:
-            chunks: List of DocumentChunk objects
+            chunks: List of stored chunks (DocumentChunk rows or ChunkRecords)
+            user_id: Owner of the chunks
+            db: Session the chunks were inserted in; backends that reference
+                chunk rows write in the same transaction
+            indexed_chunks: Content hash -> ID of an already indexed chunk with
+                that content (see DocumentProcessingService.find_indexed_chunks)
         """
         try:
-            # Convert DocumentChunk objects to LangChain Document objects
-            documents = []
-            for chunk in chunks:
-                # Get embedding for the content
-                embedding = get_embeddings(chunk.content)
-                
-                # Get user_id from the note
-                try:
-                    # Try to get note from database to get user_id
-                    user_id = str(chunk.document.user_id) if hasattr(chunk, 'document') and chunk.document else None
-                except:
-                    user_id = None
-                
-                # Create a LangChain Document
-                doc = Document(
-                    page_content=chunk.content,
-                    metadata={
-                        "chunk_id": str(chunk.id),
-                        "document_id": str(chunk.document_id),
-                        "user_id": user_id,  # Add user_id to metadata
-                        "chunk_type": chunk.chunk_type,
-                        **(chunk.chunk_metadata or {})
-                    }
-                )
-                documents.append(doc)
-            
-            # Add documents to Chroma
-            if documents:
-                self.store.add_documents(documents)
-                self.store.persist()  # Save to disk
-                logger.info(f"Successfully added {len(documents)} chunks to Chroma vector store")
+            if not chunks:
+                return
+            if user_id is None:
+                raise ValueError("add_documents requires a user_id")
+            
+            embeddings = await self._embed_chunks(chunks, user_id, indexed_chunks or {})
+            
+            ids = [str(chunk.id) for chunk in chunks]
+            metadatas = [
+                {
+                    "chunk_id": str(chunk.id),
+                    "document_id": str(chunk.document_id),
+                    "user_id": str(user_id),
+                    "chunk_type": chunk.chunk_type,
+                    **(chunk.chunk_metadata or {})
+                }
+                for chunk in chunks
+            ]
+            
+            record = {
+                "op": "add",
+                "user_id": str(user_id),
+                "ids": ids,
+                "embeddings": embeddings,
+                "metadatas": metadatas,
+                "documents": [chunk.content for chunk in chunks],
+            }
+            await self._write(record, len(ids), db=db)
+            logger.info(f"Successfully added {len(ids)} chunks to {self.backend.name} vector store")
             
         except Exception as e:
-            logger.error(f"Error adding documents to Chroma vector store: {str(e)}")
+            logger.error(f"Error adding documents to vector store: {str(e)}")
             raise
     
-    async def similarity_search(self, query_embedding: List[float], k: int = 5, user_id: uuid.UUID = None) -> List[Dict[str, Any]]:
+    async def _embed_chunks(
+        self,
+        chunks: List[Any],
+        user_id: uuid.UUID,
+        indexed_chunks: Dict[str, uuid.UUID]
+    ) -> np.ndarray:
+        """Embed chunks, taking vectors of already indexed identical content from the backend."""
+        sources = [indexed_chunks.get(getattr(chunk, "content_hash", None)) for chunk in chunks]
+        stored: Dict[str, np.ndarray] = {}
+        if any(sources):
+            stored = await self.backend.get_vectors(user_id, list({str(source) for source in sources if source}))
+
+        vectors: List[Optional[np.ndarray]] = [stored.get(str(source)) if source else None for source in sources]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            # Get embeddings for new or changed contents in batched model calls
+            embedded = await embedding_batcher.embed_many([chunks[i].content for i in missing])
+            for i, vector in zip(missing, embedded):
+                vectors[i] = vector
+        
+        if len(missing) < len(chunks):
+            logger.info(f"Reused stored vectors for {len(chunks) - len(missing)} of {len(chunks)} chunks")
+        return np.stack(vectors).astype(np.float32, copy=False)
+    
+    async def similarity_search(
+        self,
+        query_embedding: np.ndarray,
+        k: int = 5,
+        user_id: uuid.UUID = None,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
         """Search for similar chunks using cosine similarity.
         
         Args:
             query_embedding: The embedding vector of the query
             k: Maximum number of results to return
-            user_id: Filter results by user ID (via document metadata)
+            user_id: Owner whose chunks are searched
+            filter: Field or chunk_metadata values the results must equal
             
         Returns:
             List of dictionaries containing document chunk information
         """
         try:
-            # Use Chroma's similarity search with embeddings
-            filter_dict = None
-            if user_id:
-                # Use $eq operator with user_id field
-                filter_dict = {"user_id": {"$eq": str(user_id)}}
-            
-            results = self.store.similarity_search_by_vector(
-                query_embedding,
-                k=k,
-                filter=filter_dict
-            )
-            
-            # Convert results to a compatible format
-            chunks = []
-            for doc in results:
-                chunks.append({
-                    "id": doc.metadata.get("chunk_id"),
-                    "document_id": doc.metadata.get("document_id"),
-                    "content": doc.page_content,
-                    "chunk_type": doc.metadata.get("chunk_type", "text"),
-                    "chunk_metadata": {k: v for k, v in doc.metadata.items() 
-                                    if k not in ["chunk_id", "document_id", "chunk_type", "user_id"]}
-                })
-            
+            chunks, _ = await self.search_candidates(query_embedding, k, user_id=user_id, include_vectors=False, filter=filter)
             return chunks
             
         except Exception as e:
             logger.error(f"Error performing similarity search: {str(e)}")
             raise
     
-    async def delete_documents(self, note_id: uuid.UUID) -> None:
+    async def search_candidates(
+        self,
+        query_embedding: np.ndarray,
+        fetch_k: int,
+        user_id: uuid.UUID = None,
+        include_vectors: bool = True,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[np.ndarray]]:
+        """Fetch the user's nearest fetch_k chunks, optionally with their stored vectors.
+        
+        Returns:
+            Tuple of (chunks ordered by distance, float32 matrix of their vectors or None)
+        """
+        return await self.backend.search(user_id, query_embedding, fetch_k, include_vectors=include_vectors, filter=filter)
+    
+    async def dense_search(
+        self,
+        query_embedding: np.ndarray,
+        k: int = 5,
+        user_id: uuid.UUID = None,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Top-k similarity and MMR rankings from one candidate fetch.
+        
+        The fetch_k nearest candidates are read once with their vectors; the
+        similarity ranking is their first k, and the MMR selection is computed
+        over the same candidates with NumPy, so the query is neither
+        re-embedded nor searched a second time.
+        
+        Returns:
+            Tuple of (similarity ranking, MMR ranking)
+        """
+        try:
+            chunks, vectors = await self.search_candidates(query_embedding, max(k, fetch_k), user_id=user_id)
+            if not chunks:
+                return [], []
+            
+            selected = maximal_marginal_relevance(
+                np.asarray(query_embedding, dtype=np.float32), vectors, k=k, lambda_mult=lambda_mult
+            )
+            return chunks[:k], [chunks[i] for i in selected]
+            
+        except Exception as e:
+            logger.error(f"Error performing dense search: {str(e)}")
+            raise
+    
+    async def delete_documents(self, note_id: uuid.UUID, user_id: Optional[uuid.UUID] = None, db=None) -> None:
         """Delete all chunks for a document.
         
         Args:
             note_id: UUID of the note to delete chunks for
+            user_id: Owner of the note; without it every partition is searched
+            db: Session the note's chunks are deleted in; backends that store
+                rows in the database delete in the same transaction
         """
         try:
-            # Delete documents by filtering on document_id
-            self.store.delete(
-                filter={"document_id": {"$eq": str(note_id)}}
-            )
-            
-            # Persist changes to disk
-            self.store.persist()
+            record = {
+                "op": "delete",
+                "document_id": str(note_id),
+                "user_id": str(user_id) if user_id is not None else None,
+            }
+            await self._write(record, 1, db=db)
             
-            logger.info(f"Successfully deleted chunks for document {note_id} from Chroma")
+            logger.info(f"Successfully deleted chunks for document {note_id} from {self.backend.name}")
             
         except Exception as e:
             logger.error(f"Error deleting chunks for document {note_id}: {str(e)}")
             raise
     
-    async def hybrid_search(self, query: str, mmr_k: int = 5, mmr_fetch_k: int = 15, similarity_k: int = 3) -> str:
-        """Retrieve relevant context using hybrid search approach"""
+    def stats(self) -> Dict[str, Any]:
+        """Return backend counters for monitoring."""
+        return {**self.backend.stats(), "write_behind": self.write_behind, "pending_writes": self._pending_writes}
+    
+    async def hybrid_search(
+        self,
+        query: str,
+        user_id: uuid.UUID,
+        k: int = 5,
+        query_embedding: Optional[np.ndarray] = None,
+        db=None
+    ) -> RetrievedContext:
+        """Retrieve relevant context for one user with dense + BM25 fusion.
+        
+        Args:
+            query: Search query
+            user_id: Owner whose chunks are searched
+            k: Number of chunks to return
+            query_embedding: Precomputed query embedding, if the caller has one
+            db: Database session used to build the user's BM25 shard if missing
+            
+        Returns:
+            RetrievedContext: The retrieved chunks; str() renders them as prompt text
+        """
         try:
-            retrieved_docs = []
-            
-            # MMR search for diverse results
-            mmr_docs = self.store.max_marginal_relevance_search(query=query, k=mmr_k, fetch_k=mmr_fetch_k)
-            retrieved_docs.extend(mmr_docs)
-            logger.info(f"Retrieved {len(mmr_docs)} chunks using MMR search")
-            
-            # Also get top similar chunks
-            similar_docs = self.store.similarity_search(query=query, k=similarity_k)
-            
-            # Combine results (avoiding duplicates)
-            seen_content = set(doc.page_content for doc in retrieved_docs)
-            for doc in similar_docs:
-                if doc.page_content not in seen_content:
-                    retrieved_docs.append(doc)
-                    seen_content.add(doc.page_content)
-
-            logger.info(f"Retrieved {len(retrieved_docs)} total unique chunks")
+            retriever = HybridRetriever(self, db=db)
+            context = await retriever.retrieve(query, user_id, k=k, query_embedding=query_embedding)
             
-            if not retrieved_docs:
+            if not context:
                 logger.warning("No relevant context found")
-                return ""
-
-            # Log first few chunks
-            for i, doc in enumerate(retrieved_docs[:3]):
-                logger.info(f"Chunk {i+1}: {doc.page_content[:500]}...")
-
-            return self._format_context(retrieved_docs)
+            
+            return context
 
         except Exception as e:
             logger.exception(f"Error in hybrid search: {str(e)}")
-            return ""
+            return RetrievedContext()
     
-    async def get_documents_for_context(self, context: str) -> List[Document]:
-        """Get the documents that were used to generate the context."""
-        try:
-            # Split context into chunks and search for each
-            chunks = context.split("\n\n---\n\n")
-            documents = []
-            
-            for chunk in chunks:
-                # Remove the header if present
-                if "[" in chunk and "]" in chunk:
-                    chunk = chunk[chunk.find("]") + 1:].strip()
-                
-                # Search for this chunk in the vector store
-                docs = self.store.similarity_search(chunk, k=1)
-                if docs:
-                    documents.extend(docs)
-            
-            return documents
-
-        except Exception as e:
-            logger.exception(f"Error getting documents for context: {str(e)}")
-            return []
-    
-    def _format_context(self, docs: List[Document]) -> str:
-        """Format retrieved documents into context string"""
-        context_parts = []
-        for i, doc in enumerate(docs):
-            chunk_type = doc.metadata.get("chunk_type", "unknown")
-
-            if chunk_type == "line" and "start_line" in doc.metadata:
-                header = f"[CHUNK {i+1} - LINES {doc.metadata['start_line']}-{doc.metadata['end_line']}]"
-            else:
-                header = f"[CHUNK {i+1} - TYPE: {chunk_type}]"
-
-            context_parts.append(f"{header}\n{doc.page_content}")
-
-        return "\n\n---\n\n".join(context_parts)
+    def get_documents_for_context(self, context: RetrievedContext) -> List[Document]:
+        """Get the documents that were used to generate the context.
+        
+        The context carries its chunks' ids and metadata, so no search is needed.
+        """
+        return context.source_documents()
     
     async def close(self):
-        """Properly close the Chroma client"""
+        """Stop the flusher and persist every pending write"""
         try:
-            if hasattr(self, 'store') and self.store:
-                self.store.persist()  # Save any changes
-                logger.info("Vector store closed and persisted successfully")
+            if self._flusher is not None:
+                self._flusher.cancel()
+                try:
+                    await self._flusher
+                except asyncio.CancelledError:
+                    pass
+                await self.flush()
+                self._flusher = None
+                await run_vector_io(self.wal.close)
+            elif hasattr(self, 'backend') and self.backend:
+                await self.backend.persist()  # Save any changes
+            logger.info("Vector store closed and persisted successfully")
         except Exception as e:
             logger.exception(f"Error closing vector store: {e}")
 
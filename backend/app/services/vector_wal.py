@@ -0,0 +1,182 @@
+import os
+import json
+import base64
+import fcntl
+import logging
+import threading
+import uuid
+from typing import Any, Dict, Iterator, List, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def encode_vectors(vectors: np.ndarray) -> Dict[str, Any]:
+    """Pack a float32 matrix into a JSON-safe dict."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    return {"shape": list(vectors.shape), "data": base64.b64encode(vectors.tobytes()).decode("ascii")}
+
+def decode_vectors(packed: Dict[str, Any]) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(packed["data"]), dtype=np.float32).reshape(packed["shape"])
+
+class WriteAheadLog:
+    """Per-process, segmented log of vector writes not yet persisted by the backend.
+
+    Each process appends JSON lines to its own segment files
+    (wal-<pid>-<seq>.jsonl) and holds an exclusive lock on wal-<pid>.lock for
+    its lifetime. rotate() starts a new segment before a flush so records
+    written during the flush survive it; release() deletes the segments a
+    flush covered. Segments whose owner lock can be taken belong to a
+    process that died before flushing; recover() reads them for replay.
+    A write that failed to apply is cancelled by an abort() record and is
+    not replayed.
+    """
+
+    def __init__(self, directory: str, fsync: bool = True):
+        self.directory = directory
+        self.fsync = fsync
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._file = None
+        self._lock_file = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _segment_path(self, pid: int, seq: int) -> str:
+        return os.path.join(self.directory, f"wal-{pid}-{seq}.jsonl")
+
+    def _segments(self, pid: int) -> List[str]:
+        prefix = f"wal-{pid}-"
+        seqs = sorted(
+            int(name[len(prefix):-len(".jsonl")])
+            for name in os.listdir(self.directory)
+            if name.startswith(prefix) and name.endswith(".jsonl") and name[len(prefix):-len(".jsonl")].isdigit()
+        )
+        return [self._segment_path(pid, seq) for seq in seqs]
+
+    def open(self) -> None:
+        """Take this process's owner lock and open a fresh segment."""
+        with self._lock:
+            if self._file is not None:
+                return
+            self._lock_file = open(os.path.join(self.directory, f"wal-{self.pid}.lock"), "a")
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            existing = self._segments(self.pid)
+            self._seq = int(existing[-1].rsplit("-", 1)[1].split(".")[0]) + 1 if existing else 0
+            self._file = open(self._segment_path(self.pid, self._seq), "a", encoding="utf-8")
+
+    def append(self, record: Dict[str, Any]) -> str:
+        """Durably record one write before it is applied.
+
+        Returns:
+            str: ID of the logged record; pass it to abort() if applying the write fails
+        """
+        record_id = uuid.uuid4().hex
+        self._write_line({**record, "wal_id": record_id})
+        return record_id
+
+    def abort(self, record_id: str) -> None:
+        """Cancel a logged write so recover() skips it."""
+        self._write_line({"op": "abort", "wal_id": record_id})
+
+    def _write_line(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            if self._file is None:
+                raise RuntimeError("Write-ahead log is not open")
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+    def rotate(self) -> int:
+        """Close the current segment and start a new one.
+
+        Returns:
+            int: Sequence number of the last closed segment; pass it to release()
+        """
+        with self._lock:
+            if self._file is None:
+                return -1
+            self._file.close()
+            closed = self._seq
+            self._seq += 1
+            self._file = open(self._segment_path(self.pid, self._seq), "a", encoding="utf-8")
+            return closed
+
+    def release(self, upto: int) -> None:
+        """Delete this process's segments up to and including sequence upto."""
+        for path in self._segments(self.pid):
+            if int(path.rsplit("-", 1)[1].split(".")[0]) <= upto:
+                os.remove(path)
+
+    @staticmethod
+    def _read(path: str) -> Iterator[Dict[str, Any]]:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-append; the write was never acknowledged
+                    logger.warning(f"Skipping unreadable record in {path}")
+
+    def recover(self) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Read the segments left behind by processes that died before flushing.
+
+        Call before open(). A segment is orphaned when its owner lock can be
+        taken, or when it carries this process's pid (left by an earlier
+        process that had the same pid, as is common in containers).
+
+        Returns:
+            Tuple of (records oldest first per process, segment and lock paths to discard() once replayed)
+        """
+        records: List[Dict[str, Any]] = []
+        paths: List[str] = []
+        for name in sorted(os.listdir(self.directory)):
+            if not (name.startswith("wal-") and name.endswith(".lock")):
+                continue
+            pid = int(name[len("wal-"):-len(".lock")])
+            if pid != self.pid:
+                lock_path = os.path.join(self.directory, name)
+                with open(lock_path, "a") as lock_file:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    except BlockingIOError:
+                        continue  # Owner is still running
+                paths.append(lock_path)
+            for path in self._segments(pid):
+                records.extend(self._read(path))
+                paths.append(path)
+
+        aborted = {record.get("wal_id") for record in records if record["op"] == "abort"}
+        records = [record for record in records if record["op"] != "abort" and record.get("wal_id") not in aborted]
+        return records, paths
+
+    def discard(self, paths: List[str]) -> None:
+        """Delete replayed segments; another process may have already removed them."""
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def pending_segments(self) -> int:
+        return len(self._segments(self.pid))
+
+    def close(self) -> None:
+        """Close the log; segments not yet released stay behind for recovery."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                # Drop the empty tail segment opened by the last rotate()
+                path = self._segment_path(self.pid, self._seq)
+                if os.path.exists(path) and os.path.getsize(path) == 0:
+                    os.remove(path)
+            if self._lock_file is not None:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+                self._lock_file.close()
+                self._lock_file = None
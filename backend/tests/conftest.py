@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# Settings read the environment on import, so point every on-disk store at a scratch directory first
+_scratch = tempfile.mkdtemp(prefix="backend-tests-")
+for name in ("UPLOAD_DIR", "VECTOR_STORE_DIR", "VECTOR_WAL_DIR", "FAISS_INDEX_DIR", "BM25_INDEX_DIR"):
+    os.environ.setdefault(name, os.path.join(_scratch, name.lower()))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
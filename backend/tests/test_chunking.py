@@ -0,0 +1,11 @@
+from app.services.chunking import iter_chunks, parse_chunk_specs
+
+def test_chunk_after_short_chunk_still_overlaps():
+    # "b. c." is shorter than the overlap, so the boundaries before it fall below the overlap's lower bound
+    text = "a" * 25 + ". b. c. " + " ".join(["dddd"] * 12)
+    chunks = list(iter_chunks(text, parse_chunk_specs("text:30:20")))
+
+    short = next(i for i, chunk in enumerate(chunks) if chunk.content == "b. c.")
+    following = chunks[short + 1]
+    assert chunks[short].start < following.start < chunks[short].end
+    assert following.content == "c."
@@ -0,0 +1,61 @@
+import random
+import pytest
+from app.services.chunking import parse_chunk_specs
+from app.services.document_processing import TextDocumentProcessor
+
+def _text(words: int, seed: int = 0, boundary_rate: float = 0.12) -> str:
+    rng = random.Random(seed)
+    vocabulary = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta", "foo", "bar"]
+    parts = []
+    for i in range(words):
+        parts.append(rng.choice(vocabulary))
+        roll = rng.random() / boundary_rate
+        parts.append(". " if roll < 5 / 12 else "\n" if roll < 10 / 12 else "\n\n" if roll < 1 else " ")
+    return "".join(parts)
+
+def _pieces(text: str, seed: int = 0, max_piece: int = 3000):
+    rng = random.Random(seed)
+    i = 0
+    while i < len(text):
+        step = rng.randint(1, max_piece)
+        yield text[i:i + step]
+        i += step
+
+@pytest.mark.parametrize("specs", [
+    "text:1000:200,line:10:5:lines",
+    "small:300:150,medium:800:200,line:10:5:lines",
+    "line:7:3:lines",
+])
+def test_streamed_chunks_match_whole_text(specs):
+    processor = TextDocumentProcessor()
+    processor.specs = parse_chunk_specs(specs)
+    text = _text(20000)
+
+    expected = processor.process(text)
+    streamed = processor.process_stream(_pieces(text))
+
+    assert [(d.page_content, d.metadata) for d in streamed] == [(d.page_content, d.metadata) for d in expected]
+
+@pytest.mark.parametrize("seed", range(300))
+def test_streamed_chunks_match_whole_text_randomized(seed):
+    # Short specs, dense boundaries and a small window put many chunk and window edges close together
+    rng = random.Random(seed)
+    specs = []
+    for i in range(rng.randint(1, 3)):
+        if rng.random() < 0.3:
+            size = rng.randint(1, 8)
+            specs.append(f"lines{i}:{size}:{rng.randint(0, size - 1)}:lines")
+        else:
+            size = rng.randint(10, 120)
+            specs.append(f"text{i}:{size}:{rng.randint(0, size - 1)}")
+    processor = TextDocumentProcessor()
+    processor.specs = parse_chunk_specs(",".join(specs))
+    text = _text(rng.randint(50, 600), seed, boundary_rate=rng.uniform(0.1, 0.6))
+    # Keep every chunk well under 4 * STREAM_WINDOW so the stream never has to force a cut
+    longest_lines = max(len(line) + 1 for line in text.split("\n")) * 8
+    processor.STREAM_WINDOW = max(rng.randint(50, 500), 120, longest_lines // 4 + 1)
+
+    expected = processor.process(text)
+    streamed = processor.process_stream(_pieces(text, seed, max_piece=rng.randint(1, 200)))
+
+    assert [(d.page_content, d.metadata) for d in streamed] == [(d.page_content, d.metadata) for d in expected]
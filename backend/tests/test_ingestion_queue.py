@@ -0,0 +1,131 @@
+import asyncio
+import uuid
+from unittest.mock import AsyncMock, Mock
+from sqlalchemy.sql.dml import Delete
+import app.models.chat  # noqa: F401  (User relationships refer to Chat by name)
+from app.models.ingestion_job import IngestionJob
+from app.models.note import Note
+from app.services import ingestion_queue
+from app.services.document_processing_service import DocumentProcessingService, file_content_hash
+from app.services.rag_service import RAGService
+
+class FakeResult:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar(self):
+        return self.value
+
+class FakeSession:
+    """Just enough of an AsyncSession for the ingestion path; records executed statements."""
+
+    def __init__(self, notes, scalar=None):
+        self.notes = {note.id: note for note in notes}
+        self.scalar = scalar
+        self.executed = []
+        self.commits = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def get(self, model, key):
+        return self.notes.get(key)
+
+    async def execute(self, statement, *args, **kwargs):
+        self.executed.append(statement)
+        return FakeResult(self.scalar)
+
+    async def commit(self):
+        self.commits += 1
+
+    async def rollback(self):
+        pass
+
+class FakeRAGService(RAGService):
+    """RAGService with the real chunk delete and stubbed indexing."""
+
+    def __init__(self, db):
+        self.db = db
+        self.document_processor = DocumentProcessingService(db)
+        self.vector_store = AsyncMock()
+        self.processed = []
+
+    async def process_note(self, note, progress=None, chunks=None):
+        self.processed.append((note.id, [chunk.page_content for chunk in chunks]))
+        return len(chunks)
+
+def test_retry_of_half_indexed_job_deletes_earlier_chunks(monkeypatch, tmp_path):
+    user_id = uuid.uuid4()
+    upload = tmp_path / "notes.txt"
+    upload.write_text("hello world")
+    note = Note(id=uuid.uuid4(), user_id=user_id, note_text="hello world", file_name="notes.txt")
+    session = FakeSession([note])
+    services = []
+
+    def make_service(db):
+        service = FakeRAGService(db)
+        services.append(service)
+        return service
+
+    monkeypatch.setattr(ingestion_queue, "async_session", lambda: session)
+    monkeypatch.setattr(ingestion_queue, "RAGService", make_service)
+
+    # Second attempt of a job whose first attempt created the note and then failed
+    job = IngestionJob(
+        id=uuid.uuid4(),
+        user_id=user_id,
+        note_id=note.id,
+        file_name="notes.txt",
+        content_type="text/plain",
+        file_path=str(upload),
+        status="processing",
+        attempts=2,
+        max_attempts=3,
+        locked_by="test:0"
+    )
+    pool = ingestion_queue.IngestionWorkerPool(workers=1)
+    monkeypatch.setattr(pool, "_update", AsyncMock(return_value=True))
+
+    chunks_indexed = asyncio.run(pool._ingest(job))
+
+    assert chunks_indexed == 1
+    deletes = [statement for statement in session.executed if isinstance(statement, Delete)]
+    assert len(deletes) == 1
+    assert deletes[0].table.name == "document_chunks"
+    assert note.id in deletes[0].compile().params.values()
+    services[0].vector_store.delete_documents.assert_awaited_once_with(note.id, user_id=user_id, db=session)
+    assert services[0].processed == [(note.id, ["hello world"])]
+    # The hash is only recorded once the note is indexed again
+    assert note.content_hash == file_content_hash(str(upload))
+
+def test_reupload_is_matched_before_extraction(monkeypatch, tmp_path):
+    upload = tmp_path / "notes.txt"
+    upload.write_text("hello world")
+    existing_id = uuid.uuid4()
+    session = FakeSession([], scalar=existing_id)
+    extract = Mock()
+
+    monkeypatch.setattr(ingestion_queue, "async_session", lambda: session)
+    monkeypatch.setattr(ingestion_queue, "extract_chunks", extract)
+
+    job = IngestionJob(
+        id=uuid.uuid4(),
+        user_id=uuid.uuid4(),
+        file_name="notes.txt",
+        content_type="text/plain",
+        file_path=str(upload),
+        status="processing",
+        attempts=1,
+        max_attempts=3,
+        locked_by="test:0"
+    )
+    pool = ingestion_queue.IngestionWorkerPool(workers=1)
+    monkeypatch.setattr(pool, "_update", AsyncMock(return_value=True))
+
+    assert asyncio.run(pool._ingest(job)) == 0
+    assert job.note_id == existing_id
+    assert file_content_hash(str(upload)) in session.executed[0].compile().params.values()
+    extract.assert_not_called()
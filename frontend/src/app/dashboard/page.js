@@ -29,8 +29,14 @@ export default function Dashboard() {
         }
     };
 
-    const handleUploadSuccess = (newNote) => {
-        setNotes([newNote, ...notes]);
+    const handleUploadSuccess = async () => {
+        // Uploads are processed in the background, so reload the list once the job completes
+        try {
+            const response = await auth.api.get('/notes');
+            setNotes(response.data);
+        } catch (error) {
+            console.error('Error fetching notes:', error);
+        }
     };
 
     const handleDeleteNote = (deletedNoteId) => {
@@ -128,6 +128,58 @@ export default function ChatInterface() {
         setInput('');
         setLoading(true);
 
+        // Stream the answer token by token; fall back to the blocking endpoint
+        // if the stream can't be opened (e.g. expired token needing a refresh)
+        const streamingId = `${Date.now()}-ai`;
+        let streamStarted = false;
+        try {
+            await auth.streamPost('/chat/send/stream', {
+                message: userMessageText,
+                session_id: currentSession?.id
+            }, (event, data) => {
+                if (!streamStarted) {
+                    streamStarted = true;
+                    setMessages(prevMessages => [
+                        ...prevMessages.filter(msg => !(msg.isUser && msg.message === userMessageText && !msg.id)),
+                        { id: `${Date.now()}-user`, message: userMessageText, isUser: true },
+                        { id: streamingId, message: '', response: '', thinking: '', isUser: false, sources: [] }
+                    ]);
+                }
+
+                const updateStreamingMessage = (update) => setMessages(prevMessages =>
+                    prevMessages.map(msg => msg.id === streamingId ? { ...msg, ...update(msg) } : msg)
+                );
+
+                if (event === 'sources') {
+                    updateStreamingMessage(() => ({ sources: data || [] }));
+                } else if (event === 'delta') {
+                    updateStreamingMessage(msg => {
+                        const response = msg.response + data;
+                        const { mainResponse, thinking } = formatMessageContent(response);
+                        return { response, message: mainResponse, thinking };
+                    });
+                } else if (event === 'done') {
+                    const { mainResponse, thinking } = formatMessageContent(data.response);
+                    updateStreamingMessage(() => ({ response: data.response, message: mainResponse, thinking }));
+                    if (!currentSession) {
+                        fetchChatSessions();
+                        setCurrentSession({ id: data.session_id });
+                    }
+                } else if (event === 'error') {
+                    updateStreamingMessage(() => ({ message: data.detail || "Sorry, there was an error processing your request. Please try again." }));
+                }
+            });
+            setLoading(false);
+            return;
+        } catch (streamError) {
+            if (streamStarted) {
+                console.error("Error while streaming message:", streamError);
+                setLoading(false);
+                return;
+            }
+            console.warn("Streaming unavailable, falling back to /chat/send:", streamError);
+        }
+
         try {
             // Send the message to the API
             const response = await auth.api.post('/chat/send', {
@@ -1,15 +1,53 @@
 'use client';
 
-import { useState } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 import { DocumentPlusIcon, TrashIcon } from '@heroicons/react/24/outline';
 import auth from '@/utils/auth';
 
+const JOB_POLL_INTERVAL_MS = 1500;
+
+const STAGE_LABELS = {
+    extracting: 'Extracting text',
+    chunking: 'Splitting into chunks',
+    indexing: 'Indexing',
+};
+
 export default function NoteUpload({ onUploadSuccess, notes = [], onDeleteSuccess }) {
     const [file, setFile] = useState(null);
     const [uploading, setUploading] = useState(false);
     const [error, setError] = useState('');
     const [deleteInProgress, setDeleteInProgress] = useState(null);
+    const [job, setJob] = useState(null);
+    const pollTimer = useRef(null);
+
+    useEffect(() => {
+        return () => clearTimeout(pollTimer.current);
+    }, []);
+
+    const pollJob = async (jobId) => {
+        try {
+            const response = await auth.api.get(`/notes/jobs/${jobId}`);
+            const currentJob = response.data;
+            setJob(currentJob);
+
+            if (currentJob.status === 'completed') {
+                setJob(null);
+                if (onUploadSuccess) {
+                    onUploadSuccess(currentJob);
+                }
+            } else if (currentJob.status === 'failed') {
+                setJob(null);
+                setError(currentJob.error || 'Failed to process file');
+            } else {
+                pollTimer.current = setTimeout(() => pollJob(jobId), JOB_POLL_INTERVAL_MS);
+            }
+        } catch (err) {
+            setJob(null);
+            setError(err.response?.data?.detail || 'Failed to check upload status');
+            console.error('Upload status error:', err);
+        }
+    };
 
     const handleFileChange = (e) => {
         const selectedFile = e.target.files[0];
@@ -51,9 +89,9 @@ export default function NoteUpload({ onUploadSuccess, notes = [], onDeleteSucces
             if (fileInput) {
                 fileInput.value = '';
             }
-            if (onUploadSuccess) {
-                onUploadSuccess(response.data);
-            }
+            // The server processes the file in the background; follow the job until it finishes
+            setJob(response.data);
+            pollTimer.current = setTimeout(() => pollJob(response.data.id), JOB_POLL_INTERVAL_MS);
         } catch (err) {
             setUploading(false);
             // Get a more specific error message if available
@@ -113,6 +151,24 @@ export default function NoteUpload({ onUploadSuccess, notes = [], onDeleteSucces
                         />
                     </div>
 
+                    {job && (
+                        <div className="mb-4">
+                            <div className="flex justify-between text-sm text-gray-600 mb-1">
+                                <span>
+                                    {job.file_name}: {job.status === 'queued' ? 'Queued' : (STAGE_LABELS[job.stage] || 'Processing')}
+                                    {job.attempts > 1 && ` (attempt ${job.attempts} of ${job.max_attempts})`}
+                                </span>
+                                <span>{Math.round(job.progress * 100)}%</span>
+                            </div>
+                            <div className="w-full bg-gray-200 rounded h-2">
+                                <div
+                                    className="bg-indigo-600 h-2 rounded transition-all"
+                                    style={{ width: `${Math.round(job.progress * 100)}%` }}
+                                ></div>
+                            </div>
+                        </div>
+                    )}
+
                     <button
                         onClick={handleUpload}
                         disabled={!file || uploading}
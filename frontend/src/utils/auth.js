@@ -120,6 +120,53 @@ api.interceptors.response.use(
     }
 );
 
+// POST a JSON body and dispatch each Server-Sent Event to onEvent(event, data).
+// Resolves when the stream ends; rejects (with err.status set) on a non-2xx response.
+const streamPost = async (path, body, onEvent) => {
+    const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}${path}`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream',
+            'Authorization': `Bearer ${localStorage.getItem('token')}`,
+        },
+        body: JSON.stringify(body),
+    });
+
+    if (!response.ok || !response.body) {
+        const error = new Error(`Stream request failed with status ${response.status}`);
+        error.status = response.status;
+        throw error;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Frames are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const frame = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            const dataLines = [];
+            frame.split('\n').forEach(line => {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+            });
+            if (dataLines.length) {
+                onEvent(event, JSON.parse(dataLines.join('\n')));
+            }
+        }
+    }
+};
+
 // Auth utilities
 const auth = {
     isAuthenticated() {
@@ -148,7 +195,10 @@ const auth = {
     },
 
     // Use this instance for API calls
-    api: api
+    api: api,
+
+    // Use this for streaming (SSE) API calls
+    streamPost: streamPost
 };
 
 export default auth; 
\ No newline at end of file